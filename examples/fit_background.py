@@ -70,6 +70,7 @@ parser.add_argument(
 )
 
 parser.add_argument("-dates", "--dates", type=str, nargs="+", help="Date string")
+parser.add_argument("-dtype", "--data_type", type=str, help="Data type")
 parser.add_argument("-dets", "--detectors", type=str, nargs="+", help="Name detector")
 parser.add_argument("-e", "--echans", type=str, nargs="+", help="Echan number")
 parser.add_argument("-trig", "--trigger", type=str, help="Name of trigger")
@@ -91,6 +92,9 @@ with open(args.config_file) as f:
 if args.dates is not None:
     config["general"]["dates"] = args.dates
 
+if args.data_type is not None:
+    config["general"]["data_type"] = args.data_type
+
 if args.detectors is not None:
     config["general"]["detectors"] = args.detectors
 
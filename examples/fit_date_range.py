@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+##################################################################
+# Fit a range of days for a matrix of detector and echan
+# configurations with fit_background.py as a task farm.
+#
+# On one node (process pool):
+# python fit_date_range.py -start 190401 -stop 190430 \
+#                          -dets n0-n1-n2 n6-n7-n8 -e 2 3 -n 8
+#
+# Across nodes (MPI master/worker, every fit runs on one rank):
+# GBMBKGPY_NO_MPI=1 mpiexec -n <nr_cores> python fit_date_range.py \
+#                          -start 190401 -stop 190430 -dets n0 n6 -e 2 -mpi
+#
+# An interrupted run is resumed by running it again with the same -out.
+##################################################################
+
+import os
+import argparse
+
+from gbmbkgpy.io.package_data import get_path_of_external_data_dir
+from gbmbkgpy.utils.batch_runner import (
+    BatchRunner,
+    FitScriptTask,
+    date_range,
+    prepare_gbm_day,
+)
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+parser.add_argument("-start", "--start", type=str, required=True, help="First date")
+parser.add_argument("-stop", "--stop", type=str, required=True, help="Last date")
+parser.add_argument(
+    "-dets",
+    "--detectors",
+    type=str,
+    nargs="+",
+    required=True,
+    help="Detector groups, the detectors of a group are joined with '-'",
+)
+parser.add_argument(
+    "-e",
+    "--echans",
+    type=str,
+    nargs="+",
+    required=True,
+    help="Echan groups, the echans of a group are joined with '-'",
+)
+parser.add_argument(
+    "-c",
+    "--config_file",
+    type=str,
+    help="Path to the config file of fit_background.py",
+    default="config_default.yml",
+)
+parser.add_argument(
+    "-dtype", "--data_type", type=str, help="Data type", default="ctime"
+)
+parser.add_argument(
+    "-out",
+    "--output_dir",
+    type=str,
+    help="Output directory of the batch run",
+    default=os.path.join(get_path_of_external_data_dir(), "fits", "batch"),
+)
+parser.add_argument("-n", "--num_workers", type=int, help="Size of the process pool")
+parser.add_argument("-mpi", "--mpi", action="store_true", help="Use the MPI task farm")
+parser.add_argument(
+    "--no_retry", action="store_true", help="Do not repeat failed tasks"
+)
+
+args = parser.parse_args()
+
+config_matrix = {
+    "data_type": [args.data_type],
+    "detectors": [group.split("-") for group in args.detectors],
+    "echans": [group.split("-") for group in args.echans],
+}
+
+runner = BatchRunner(
+    task_function=FitScriptTask(
+        script=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fit_background.py"),
+        config_file=os.path.abspath(args.config_file),
+    ),
+    dates=date_range(args.start, args.stop),
+    config_matrix=config_matrix,
+    output_dir=args.output_dir,
+    prepare_function=prepare_gbm_day,
+    retry_failed=not args.no_retry,
+)
+
+summary = runner.run(
+    backend="mpi" if args.mpi else "process", num_workers=args.num_workers
+)
+
+if summary is not None:
+    print(f"Tasks per status: {summary}")
+    print(f"Manifest: {runner.manifest.path}")
@@ -1,8 +1,83 @@
+import collections
 import numpy as np
 
 from gbmbkgpy.utils.binner import Rebinner
 
 
+def bins_in_intervals(bin_starts, intervals):
+    """
+    Check for many intervals at once which time bins start inside of one of
+    the intervals. Only uses np.searchsorted on the sorted bin starts and one
+    cumulative sum, so this scales with O(N + K log N) for N bins and K
+    intervals instead of scanning all bins once per interval.
+    :param bin_starts: sorted start times of the time bins
+    :param intervals: array with (start, stop) of all intervals
+    :returns: bool array, True if the bin starts in one of the intervals
+    """
+    intervals = np.asarray(intervals, dtype=float).reshape(-1, 2)
+
+    lower = np.searchsorted(bin_starts, intervals[:, 0], side="left")
+    upper = np.searchsorted(bin_starts, intervals[:, 1], side="right")
+
+    # ignore empty intervals
+    non_empty = upper > lower
+
+    # +1 at the first and -1 after the last bin of every interval
+    counter = np.zeros(len(bin_starts) + 1, dtype=np.int64)
+    np.add.at(counter, lower[non_empty], 1)
+    np.add.at(counter, upper[non_empty], -1)
+
+    return np.cumsum(counter[:-1]) > 0
+
+
+class AppendableArray:
+    """
+    Array that can grow at the end with amortized O(1) appends. The
+    capacity is doubled every time it is exceeded, so appending small
+    chunks does not copy the whole array every time.
+    """
+
+    def __init__(self, array):
+        array = np.asarray(array)
+        self._size = len(array)
+        self._buffer = np.empty(
+            (max(2 * self._size, 1),) + array.shape[1:], dtype=array.dtype
+        )
+        self._buffer[: self._size] = array
+
+    def extend(self, values):
+        """
+        Append the values at the end
+        :returns: view on the filled part of the buffer
+        """
+        values = np.asarray(values, dtype=self._buffer.dtype)
+        new_size = self._size + len(values)
+
+        if new_size > len(self._buffer):
+            capacity = len(self._buffer)
+            while capacity < new_size:
+                capacity *= 2
+
+            buffer = np.empty(
+                (capacity,) + self._buffer.shape[1:], dtype=self._buffer.dtype
+            )
+            buffer[: self._size] = self._buffer[: self._size]
+            self._buffer = buffer
+
+        self._buffer[self._size: new_size] = values
+        self._size = new_size
+
+        return self.array
+
+    @property
+    def array(self):
+        return self._buffer[: self._size]
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+
 class Data:
 
     def __init__(self, name, time_bins, counts=None, valid_time_mask=None):
@@ -17,23 +92,60 @@ class Data:
         #self._rebinned = False
 
         self._min_bin_width = 0
+        self._rebinner = None
+        self._rebin_valid_mask = None
         self._rebinned_time_bins = time_bins
         self._rebinned_counts = counts
 
-        self._fit_rebinned_time_bins = time_bins
-        self._fit_rebinned_counts = counts
-
         # Initialize the valid_mask to all True
         if valid_time_mask is not None:
-            self._valid_time_mask = valid_time_mask
+            self._base_valid_time_mask = valid_time_mask
         else:
-            self._valid_time_mask = np.ones(len(self._time_bins), dtype=bool)
+            self._base_valid_time_mask = np.ones(len(self._time_bins), dtype=bool)
+
+        self._base_valid_rebinned_time_mask = self._base_valid_time_mask
+
+        # Named mask layers (e.g. saa, trigger, flare, user). Every layer
+        # stores its intervals and the bins it masks. The layers are only
+        # combined to the final masks if they are needed.
+        self._mask_layers = collections.OrderedDict()
+        self._layer_bin_masks = {}
+        self._combined_masks = None
+
+        # Buffers for appending new time bins, created at the first append
+        self._append_buffers = None
+
+    def _select_time_bins(self, selection):
+        """
+        Only keep the selected unbinned time bins, e.g. to put the
+        data of several detectors on the same time grid. This resets the
+        rebinning, so it should be done directly after the init.
+        :param selection: bool mask of the time bins to keep
+        """
+        self._time_bins = self._time_bins[selection]
+        self._counts = self._counts[selection]
+        self._base_valid_time_mask = self._base_valid_time_mask[selection]
 
-        self._valid_rebinned_time_mask = self._valid_time_mask
+        self._append_buffers = None
 
-        self._fit_time_mask = self._valid_time_mask
+        self._reset_binning()
 
-        self._fit_rebinned_time_mask = self._valid_time_mask
+    def _reset_binning(self):
+        """
+        Drop the rebinning and all cached bin masks after the unbinned
+        time bins changed
+        """
+        self._min_bin_width = 0
+        self._rebinner = None
+        self._rebin_valid_mask = None
+        self._rebinned_time_bins = self._time_bins
+        self._rebinned_counts = self._counts
+        self._base_valid_rebinned_time_mask = self._base_valid_time_mask
+
+        for layer in self._layer_bin_masks.keys():
+            self._layer_bin_masks[layer] = {}
+
+        self._combined_masks = None
 
     def rebin_data(self, min_bin_width):
         """
@@ -47,28 +159,147 @@ class Data:
 
         #self._rebinned = True
 
-        valid_data_rebinner = Rebinner(self._time_bins, min_bin_width,
-                                       mask=self._valid_time_mask)
+        # Bins that are not valid at the time of the rebinning (e.g. the
+        # saa layer) are excluded from it. Layers changed later on are
+        # applied on top of the rebinned bins without rebinning again.
+        self._rebin_valid_mask = self._unbinned_valid_mask()
+        self._rebinner = Rebinner(self._time_bins, min_bin_width,
+                                  mask=self._rebin_valid_mask)
+
+        if self._append_buffers is not None:
+            self._append_buffers.pop("rebin_valid", None)
+
+        self._rebinned_time_bins = self._rebinner.time_rebinned
 
-        self._rebinned_time_bins = valid_data_rebinner.time_rebinned
+        self._base_valid_rebinned_time_mask = self._rebinner.rebinned_mask
 
-        self._valid_rebinned_time_mask = valid_data_rebinner.rebinned_mask
+        self._rebinned_counts = self._rebin_counts()
 
-        self._rebinned_counts = valid_data_rebinner.rebin(self._counts)[0].astype(
-            np.int64
+        # the rebinned masks of all layers have to be recalculated
+        for bin_masks in self._layer_bin_masks.values():
+            bin_masks.pop("rebinned", None)
+
+        self._combined_masks = None
+
+    def _rebin_counts(self):
+        """
+        Rebin the counts with the current rebinner
+        """
+        return self._rebinner.rebin(self._counts)[0].astype(np.int64)
+
+    def _rebin_counts_from(self, first_bin):
+        """
+        Rebin the counts of the rebinned bins starting with first_bin with
+        the current rebinner. Gives the same result as _rebin_counts for
+        these bins, but only touches the unbinned bins they contain.
+        """
+        starts = self._rebinner.starts[first_bin:]
+        stops = self._rebinner.stops[first_bin:].copy()
+
+        # If the last time_bin is the last rebinned time bin it is included
+        if starts[-1] == stops[-1]:
+            stops[-1] = len(self._counts)
+
+        offset = starts[0]
+        num_counts = np.zeros(
+            (len(self._counts) - offset + 1, self._counts.shape[1]),
+            dtype=np.int64
+        )
+        np.cumsum(self._counts[offset:], axis=0, out=num_counts[1:])
+
+        counts = num_counts[stops - offset] - num_counts[starts - offset]
+        counts[~self._rebinner.rebinned_mask[first_bin:]] = 0
+
+        return counts
+
+    def append(self, time_bins, counts):
+        """
+        Append new time bins at the end of the data, e.g. new data packets
+        in near real time. The unbinned arrays grow with capacity doubling
+        and only the last rebinned bin and the new bins get rebinned. The
+        mask layers are applied to the new bins as well.
+        :param time_bins: new time bins (N, 2), after the current time bins
+        :param counts: counts of the new time bins (N, num_echan)
+        :returns: number of valid time bins (time_bins property) that are
+        unchanged, all following bins are new or were rebinned again
+        """
+        time_bins = np.asarray(time_bins, dtype=np.float64).reshape(-1, 2)
+        counts = np.asarray(counts, dtype=np.int64).reshape(
+            len(time_bins), self.num_echan
         )
 
-        fit_data_rebinner = Rebinner(self._time_bins, min_bin_width,
-                                     mask=self._fit_time_mask)
+        assert time_bins[0, 0] >= self._time_bins[-1, 1], (
+            "The new time bins have to start after the last time bin"
+        )
 
-        self._fit_rebinned_time_bins = fit_data_rebinner.time_rebinned
+        old_valid_rebinned = self.valid_rebinned_time_mask
+        num_old_bins = len(self._time_bins)
 
-        self._fit_rebinned_time_mask = fit_data_rebinner.rebinned_mask
+        if self._append_buffers is None:
+            self._append_buffers = {
+                "time_bins": AppendableArray(self._time_bins),
+                "valid": AppendableArray(self._base_valid_time_mask),
+            }
 
-        self._fit_rebinned_counts = fit_data_rebinner.rebin(self._counts)[0].astype(
-            np.int64
+        self._time_bins = self._append_buffers["time_bins"].extend(time_bins)
+        self._append_counts(counts)
+        self._base_valid_time_mask = self._append_buffers["valid"].extend(
+            np.ones(len(time_bins), dtype=bool)
         )
 
+        # only the new bins have to be checked against the mask layers
+        for layer, bin_masks in self._layer_bin_masks.items():
+            if "unbinned" in bin_masks:
+                bin_masks["unbinned"] = np.concatenate((
+                    bin_masks["unbinned"],
+                    bins_in_intervals(time_bins[:, 0],
+                                      self._mask_layers[layer]["intervals"])
+                ))
+            bin_masks.pop("rebinned", None)
+
+        if self._rebinner is None:
+            first_bin = num_old_bins
+
+            self._rebinned_time_bins = self._time_bins
+            self._rebinned_counts = self._counts
+            self._base_valid_rebinned_time_mask = self._base_valid_time_mask
+
+        else:
+            # the mask layers are applied on top of the new bins, like
+            # layers that were changed after the rebinning
+            if "rebin_valid" not in self._append_buffers:
+                self._append_buffers["rebin_valid"] = AppendableArray(
+                    self._rebin_valid_mask
+                )
+
+            self._rebin_valid_mask = self._append_buffers["rebin_valid"].extend(
+                np.ones(len(time_bins), dtype=bool)
+            )
+
+            first_bin = self._rebinner.extend(
+                self._time_bins, self._rebin_valid_mask
+            )
+
+            self._rebinned_time_bins = self._rebinner.time_rebinned
+            self._base_valid_rebinned_time_mask = self._rebinner.rebinned_mask
+
+            self._rebinned_counts = np.concatenate(
+                (self._rebinned_counts[:first_bin],
+                 self._rebin_counts_from(first_bin))
+            )
+
+        self._combined_masks = None
+
+        return int(np.sum(old_valid_rebinned[:first_bin]))
+
+    def _append_counts(self, counts):
+        """
+        Append the counts of new time bins to the unbinned counts
+        """
+        if "counts" not in self._append_buffers:
+            self._append_buffers["counts"] = AppendableArray(self._counts)
+
+        self._counts = self._append_buffers["counts"].extend(counts)
 
     def mask_start_of_data(self, t):
         """
@@ -76,28 +307,150 @@ class Data:
         """
         self.mask_data(self._time_bins[0, 0], t)
 
-    def mask_data(self, t_0, t, unvalid=True):
+    def mask_data(self, t_0, t, unvalid=True, layer=None):
         """
         Mask all the time bins starting between t0 and t0+t
+        :param unvalid: If False the bins are only excluded from the fit
+        :param layer: Name of the mask layer, default is "user" or
+        "user_fit" if unvalid is False
         """
-        mask = np.logical_and(self._time_bins[:, 0]-t_0 <= t,
-                              self._time_bins[:, 0] >= t_0)
+        if layer is None:
+            layer = "user" if unvalid else "user_fit"
 
-        self._fit_time_mask[mask] = False
+        self.mask_intervals([[t_0, t_0 + t]], layer=layer, unvalid=unvalid)
 
-        if unvalid:
-            self._valid_time_mask[mask] = False
+    def mask_intervals(self, intervals, layer="user", unvalid=True,
+                       append=True):
+        """
+        Mask all the time bins starting in one of the given intervals.
+        All intervals are applied at once, which is much faster than calling
+        mask_data for every interval.
+        :param intervals: array with (start, stop) of all intervals
+        :param layer: Name of the mask layer (e.g. "saa", "trigger", "flare")
+        :param unvalid: If False the bins are only excluded from the fit
+        :param append: Append the intervals to the layer if it already exists,
+        otherwise the layer gets replaced
+        """
+        intervals = np.asarray(intervals, dtype=float).reshape(-1, 2)
 
-        #if self._rebinned:
-        mask = np.logical_and(
-            self._rebinned_time_bins[:, 0]-t_0 <= t,
-            self._rebinned_time_bins[:, 0] >= t_0
+        if append and layer in self._mask_layers:
+            assert self._mask_layers[layer]["unvalid"] == unvalid, (
+                f"The mask layer {layer} was created with unvalid="
+                f"{self._mask_layers[layer]['unvalid']}"
+            )
+            intervals = np.concatenate(
+                (self._mask_layers[layer]["intervals"], intervals)
+            )
+
+        # keep the intervals of the layer sorted by start time
+        intervals = intervals[np.argsort(intervals[:, 0], kind="stable")]
+
+        self._mask_layers[layer] = {"intervals": intervals, "unvalid": unvalid}
+
+        self._layer_bin_masks[layer] = {}
+        self._combined_masks = None
+
+    def remove_mask_layer(self, layer):
+        """
+        Remove a mask layer. The masks of the other layers are not recomputed.
+        Bins that were excluded from the rebinning by the layer are only
+        rebinned again with the next call of rebin_data.
+        :param layer: Name of the mask layer
+        """
+        assert layer in self._mask_layers, (
+            f"No mask layer with the name {layer}. "
+            f"Existing layers: {self.mask_layers}"
         )
 
-        self._fit_rebinned_time_mask[mask] = False
+        self._mask_layers.pop(layer)
+        self._layer_bin_masks.pop(layer)
+        self._combined_masks = None
+
+    def _layer_bin_mask(self, layer, rebinned):
+        """
+        Bins masked by a layer, cached until the layer or the binning changes.
+        Like for the unbinned bins, a rebinned bin is masked if it starts
+        in one of the intervals of the layer.
+        :param rebinned: Use the rebinned or the unbinned time bins
+        """
+        key = "rebinned" if rebinned else "unbinned"
+        bin_masks = self._layer_bin_masks[layer]
+
+        if key not in bin_masks:
+            time_bins = self._rebinned_time_bins if rebinned else self._time_bins
+
+            bin_masks[key] = bins_in_intervals(
+                time_bins[:, 0], self._mask_layers[layer]["intervals"]
+            )
+
+        return bin_masks[key]
+
+    def _unbinned_valid_mask(self):
+        """
+        Base valid mask of the unbinned bins combined with all layers that
+        mask the bins as unvalid
+        """
+        valid = self._base_valid_time_mask.copy()
+
+        for layer, settings in self._mask_layers.items():
+            if settings["unvalid"]:
+                valid[self._layer_bin_mask(layer, rebinned=False)] = False
 
-        if unvalid:
-            self._valid_rebinned_time_mask[mask] = False
+        return valid
+
+    def _rebinned_bins_containing(self, unbinned_mask):
+        """
+        Rebinned bins that contain at least one bin of the unbinned mask
+        """
+        if self._rebinner is None:
+            return unbinned_mask
+
+        num_masked = np.concatenate(([0], np.cumsum(unbinned_mask)))
+
+        starts = self._rebinner.starts
+        # same bins as in _rebin_counts_from
+        stops = self._rebinner.stops.copy()
+        if starts[-1] == stops[-1]:
+            stops[-1] = len(unbinned_mask)
+
+        return num_masked[stops] - num_masked[starts] > 0
+
+    def _combine_masks(self):
+        """
+        Combine the base masks with all mask layers
+        """
+        if self._combined_masks is None:
+
+            valid = self._base_valid_time_mask.copy()
+            valid_rebinned = self._base_valid_rebinned_time_mask.copy()
+
+            fit = valid.copy()
+            fit_rebinned = valid_rebinned.copy()
+
+            for layer, settings in self._mask_layers.items():
+                mask = self._layer_bin_mask(layer, rebinned=False)
+                mask_rebinned = self._layer_bin_mask(layer, rebinned=True)
+
+                fit[mask] = False
+                fit_rebinned[mask_rebinned] = False
+
+                if settings["unvalid"]:
+                    valid[mask] = False
+                    valid_rebinned[mask_rebinned] = False
+
+            # like with a separate rebinning of the fit data, a rebinned
+            # bin is only used in the fit if it contains no unbinned bin
+            # that is only masked for the fit
+            fit_rebinned[self._rebinned_bins_containing(valid & ~fit)] = False
+
+            self._combined_masks = {
+                "valid": valid,
+                "valid_rebinned": valid_rebinned,
+                "fit": fit,
+                "fit_rebinned": fit_rebinned,
+            }
+
+        return self._combined_masks
 
     @property
     def fit_counts(self):
@@ -105,7 +458,7 @@ class Data:
         Returns the count information of all time bins
         :return: counts
         """
-        return self._fit_rebinned_counts[self._fit_rebinned_time_mask]
+        return self._rebinned_counts[self.fit_rebinned_time_mask]
 
     @property
     def fit_time_bins(self):
@@ -113,7 +466,7 @@ class Data:
         Returns the time bin information of all time bins
         :return: time_bins
         """
-        return self._fit_rebinned_time_bins[self._fit_rebinned_time_mask]
+        return self._rebinned_time_bins[self.fit_rebinned_time_mask]
 
     @property
     def time_bin_width(self):
@@ -155,21 +508,54 @@ class Data:
         """
         return self._rebinned_time_bins[self.valid_rebinned_time_mask]
 
+    @property
+    def unbinned_time_bins(self):
+        """
+        Returns the valid time bins before the rebinning
+        :return: time_bins
+        """
+        return self._time_bins[self.valid_time_mask]
+
+    @property
+    def unbinned_counts(self):
+        """
+        Returns the counts of the valid time bins before the rebinning
+        :return: counts
+        """
+        return self._counts[self.valid_time_mask]
+
+    @property
+    def valid_fit_time_mask(self):
+        """
+        Mask of the valid (rebinned) time bins that are also used in the fit.
+        This allows to apply the fit masks on arrays that were precalculated
+        for all valid time bins.
+        :return: bool array with the length of time_bins
+        """
+        return self.fit_rebinned_time_mask[self.valid_rebinned_time_mask]
+
+    @property
+    def mask_layers(self):
+        return list(self._mask_layers.keys())
+
+    def mask_layer_intervals(self, layer):
+        return self._mask_layers[layer]["intervals"]
+
     @property
     def fit_time_mask(self):
-        return self._fit_time_mask
+        return self._combine_masks()["fit"]
 
     @property
     def fit_rebinned_time_mask(self):
-        return self._fit_rebinned_time_mask
+        return self._combine_masks()["fit_rebinned"]
 
     @property
     def valid_time_mask(self):
-        return self._valid_time_mask
+        return self._combine_masks()["valid"]
 
     @property
     def valid_rebinned_time_mask(self):
-        return self._valid_rebinned_time_mask
+        return self._combine_masks()["valid_rebinned"]
 
     @property
     def name(self):
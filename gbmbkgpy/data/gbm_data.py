@@ -1,9 +1,21 @@
+import os
+import hashlib
+import collections
+import warnings as custom_warnings
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import astropy.io.fits as fits
+import astropy.time as astro_time
 
-from gbmbkgpy.data.data import Data
+from gbmgeometry import GBMTime
+
+from gbmbkgpy.data.data import Data, AppendableArray
 from gbmbkgpy.io.downloading import download_gbm_file
-from gbmbkgpy.io.package_data import get_path_of_external_data_dir
+from gbmbkgpy.io.package_data import (get_path_of_external_data_dir,
+                                      get_path_of_data_file)
+from gbmbkgpy.utils.mpi import check_mpi
+
+using_mpi, rank, size, comm = check_mpi()
 
 
 valid_det_names = [
@@ -23,10 +35,93 @@ valid_det_names = [
     "b1",
 ]
 
+
+def echan_mask_construction(echans, max_echan):
+    """
+    Construct the echan masks for the reconstructed energy ranges
+    :param echans: list with echans like ["1", "2", "3-5"]
+    :param max_echan: highest echan number of the data type
+    :returns: bool array with one mask over all channels per echan entry
+    """
+    echans_mask = []
+    for e in echans:
+        bounds = e.split("-")
+        mask = np.zeros(max_echan+1, dtype=bool)
+        if len(bounds) == 1:
+            # Only one echan given
+            index = int(bounds[0])
+            assert (
+                0 <= index <= max_echan
+            ), f"Only Echan numbers between 0 and {max_echan} are allowed"
+            mask[index] = True
+        else:
+            # Echan start and stop given
+            index_start = int(bounds[0])
+            index_stop = int(bounds[1])
+            assert (
+                0 <= index_start <= max_echan
+            ), f"Only Echan numbers between 0 and {max_echan} are allowed"
+            assert (
+                0 <= index_stop <= max_echan
+            ), f"Only Echan numbers between 0 and {max_echan} are allowed"
+            mask[index_start: index_stop + 1] = np.ones(
+                1 + index_stop - index_start, dtype=bool
+            )
+        echans_mask.append(mask)
+    return np.array(echans_mask)
+
+
+def get_poshist_bounds(date, use_cache=True):
+    """
+    Get the first and last time covered by the poshist file of a day.
+    Only the SCLK_UTC column of the memory mapped file is read and
+    the result is cached, as it is needed for every detector.
+    The poshist file must already be downloaded.
+    :param date: string like '180407'
+    :param use_cache: Use the cache in $GBMDATA/cache/poshist
+    :returns: min_time, max_time
+    """
+    cache_path = (get_path_of_external_data_dir() / "cache" / "poshist" /
+                  f"poshist_bounds_{date}.npy")
+
+    if use_cache and cache_path.exists():
+        return tuple(np.load(cache_path))
+
+    # no download here, this must not call any MPI collectives because
+    # the ranks can differ in which cache files they find
+    poshist_file_path = (get_path_of_external_data_dir() / "poshist" / date /
+                         f"glg_poshist_all_{date}_v00.fit")
+
+    with fits.open(poshist_file_path, memmap=True) as f:
+        pos_times = f["GLAST POS HIST"].data["SCLK_UTC"]
+        bounds = np.array([pos_times[0], pos_times[-1]], dtype=np.float64)
+
+    if use_cache and rank == 0:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+
+        with open(tmp_path, "wb") as f:
+            np.save(f, bounds)
+
+        os.replace(tmp_path, cache_path)
+
+    return tuple(bounds)
+
+
 class GBMData(Data):
 
     def __init__(self, name, date, data_type, detector,
-                 echans, min_time=None, max_time=None):
+                 echans, min_time=None, max_time=None, use_cache=True,
+                 poshist_bounds=None, download=True):
+        """
+        :param use_cache: Save the cleaned arrays of the data file in a
+        binary cache in $GBMDATA/cache and load them from there next time
+        :param poshist_bounds: (min, max) time covered by the poshist file,
+        if already known. Otherwise it is read from the poshist file.
+        :param download: Download the data and poshist files if needed.
+        Set this to False if the files are already downloaded.
+        """
 
         self._date = date
         self._data_type = data_type
@@ -34,11 +129,14 @@ class GBMData(Data):
         self._echans = echans
         self._min_time = min_time
         self._max_time = max_time
+        self._use_cache = use_cache
+        self._poshist_bounds = poshist_bounds
 
         assert detector in valid_det_names,\
             f"{detector} is not a valid detector name"
 
-        self._download_data()
+        if download:
+            self._download_data()
 
         self._echan_mask_construction()
 
@@ -58,52 +156,24 @@ class GBMData(Data):
         """
         Read in all the data
         """
+        cleaned = None
 
-        dir_path = get_path_of_external_data_dir()
-        data_file_dir_path = dir_path / self._data_type / self._date
-
-        poshist_file_path = (dir_path / "poshist" / self._date /
-                        f"glg_poshist_all_{self._date}_v00.fit")
-
+        if self._use_cache:
+            cleaned = self._load_cache()
 
-        data_file_path = (data_file_dir_path /
-                          f"glg_{self._data_type}_{self._detector}"
-                          f"_{self._date}_v00.pha")
+        if cleaned is None:
+            cleaned = self._read_in_cleaned_arrays()
 
-        with fits.open(data_file_path) as f:
-            counts = f["SPECTRUM"].data["COUNTS"]
-            bin_start = f["SPECTRUM"].data["TIME"]
-            bin_stop = f["SPECTRUM"].data["ENDTIME"]
+            if self._use_cache:
+                self._save_cache(cleaned)
 
-            edge_start = f["EBOUNDS"].data["E_MIN"]
-            edge_stop = f["EBOUNDS"].data["E_MAX"]
+        time_bins = cleaned["time_bins"]
+        counts = cleaned["counts"]
+        bin_start = time_bins[:, 0]
+        bin_stop = time_bins[:, 1]
 
-        self._Ebin_out_edge = np.append(edge_start, edge_stop[-1])
-        # some clean ups:
-
-        # Sometimes there are corrupt time bins where the
-        # time bin start = time bin stop
-        idx_zero_bins = bin_start == bin_stop
-        bin_start = bin_start[~idx_zero_bins]
-        bin_stop = bin_stop[~idx_zero_bins]
-        counts = counts[~idx_zero_bins]
-
-        # Sometimes the poshist file does not cover the whole time
-        # covered by the CTIME/CSPEC file.
-        #
-        # Get boundary for time interval covered by the poshist file
-        with fits.open(poshist_file_path) as f:
-            pos_times = f["GLAST POS HIST"].data["SCLK_UTC"]
-        min_time_pos = pos_times[0]
-        max_time_pos = pos_times[-1]
-
-        # check for all time bins if they are outside of this interval
-        idx_outside_poshist = np.logical_or(bin_start <= min_time_pos,
-                                            bin_stop >= max_time_pos)
-
-        bin_start = bin_start[~idx_outside_poshist]
-        bin_stop = bin_stop[~idx_outside_poshist]
-        counts = counts[~idx_outside_poshist]
+        self._Ebin_out_edge = cleaned["ebin_out_edge"]
+        self._poshist_bounds = cleaned["poshist_bounds"]
 
         valid_time_mask = np.zeros(len(counts), dtype=bool)
         # remove time bins outside of the time between
@@ -119,21 +189,128 @@ class GBMData(Data):
 
         valid_time_mask[start_idx:stop_idx] = True
 
+        return counts, time_bins, valid_time_mask
+
+    def _read_in_cleaned_arrays(self):
+        """
+        Read the data file and clean it up. The SPECTRUM table is memory
+        mapped and only the channels used in the echan masks are read.
+        :returns: dict with time_bins, counts (summed in the echan masks),
+        ebin_out_edge and poshist_bounds
+        """
+        dir_path = get_path_of_external_data_dir()
+        data_file_dir_path = dir_path / self._data_type / self._date
+
+        data_file_path = (data_file_dir_path /
+                          f"glg_{self._data_type}_{self._detector}"
+                          f"_{self._date}_v00.pha")
+
+        # only the channels that are part of at least one echan mask
+        channels = np.flatnonzero(np.any(self._echans_mask, axis=0))
+
+        with fits.open(data_file_path, memmap=True) as f:
+            bin_start = np.array(f["SPECTRUM"].data["TIME"], dtype=np.float64)
+            bin_stop = np.array(f["SPECTRUM"].data["ENDTIME"], dtype=np.float64)
+
+            # some clean ups:
+
+            # Sometimes there are corrupt time bins where the
+            # time bin start = time bin stop
+            idx_good_bins = bin_start != bin_stop
+
+            # Sometimes the poshist file does not cover the whole time
+            # covered by the CTIME/CSPEC file.
+            #
+            # Get boundary for time interval covered by the poshist file
+            if self._poshist_bounds is not None:
+                min_time_pos, max_time_pos = self._poshist_bounds
+            else:
+                min_time_pos, max_time_pos = get_poshist_bounds(
+                    self._date, use_cache=self._use_cache
+                )
+
+            # check for all time bins if they are outside of this interval
+            idx_good_bins &= np.logical_and(bin_start > min_time_pos,
+                                            bin_stop < max_time_pos)
+
+            # bin the counts with the echan mask, only reading the needed
+            # channels and keeping them in a compact integer type. Rows and
+            # columns are selected at once to avoid a copy of all channels.
+            counts = self._add_counts_echan(
+                f["SPECTRUM"].data["COUNTS"][
+                    np.ix_(np.flatnonzero(idx_good_bins), channels)
+                ],
+                channels
+            )
+
+            edge_start = f["EBOUNDS"].data["E_MIN"]
+            edge_stop = f["EBOUNDS"].data["E_MAX"]
 
-        #bin_start = bin_start[start_idx:stop_idx]
-        #bin_stop = bin_stop[start_idx:stop_idx]
-        #counts = counts[start_idx:stop_idx]
+            ebin_out_edge = np.append(edge_start, edge_stop[-1]).astype(
+                np.float64
+            )
 
         # Get time bins
-        time_bins = np.vstack((bin_start, bin_stop)).T
+        time_bins = np.vstack((bin_start[idx_good_bins],
+                               bin_stop[idx_good_bins])).T
+
+        return {
+            "time_bins": time_bins,
+            "counts": counts,
+            "ebin_out_edge": ebin_out_edge,
+            "poshist_bounds": np.array([min_time_pos, max_time_pos],
+                                       dtype=np.float64),
+        }
+
+    def _cache_path(self):
+        """
+        Path of the cache file for this data file and echan selection
+        """
+        echan_hash = hashlib.md5(self._echans_mask.tobytes()).hexdigest()[:12]
 
-        # Convert to numpy int64
-        counts = counts.astype(np.int64)
+        return (get_path_of_external_data_dir() / "cache" / self._data_type /
+                self._date / f"{self._detector}_{echan_hash}.npz")
 
-        # bin the counts with the echan mask
-        counts = self._add_counts_echan(counts)
+    def _load_cache(self):
+        """
+        Load the cleaned arrays from the cache if the cache exists
+        and is newer than the data file
+        :returns: dict with the cleaned arrays or None
+        """
+        cache_path = self._cache_path()
 
-        return counts, time_bins, valid_time_mask
+        if not cache_path.exists():
+            return None
+
+        data_file_path = (get_path_of_external_data_dir() / self._data_type /
+                          self._date /
+                          f"glg_{self._data_type}_{self._detector}"
+                          f"_{self._date}_v00.pha")
+
+        if cache_path.stat().st_mtime < data_file_path.stat().st_mtime:
+            return None
+
+        with np.load(cache_path) as f:
+            if not np.array_equal(f["echans_mask"], self._echans_mask):
+                return None
+
+            return {key: f[key] for key in ["time_bins", "counts",
+                                            "ebin_out_edge", "poshist_bounds"]}
+
+    def _save_cache(self, cleaned):
+        """
+        Save the cleaned arrays to the cache (uncompressed for fast loading)
+        """
+        if rank == 0:
+            cache_path = self._cache_path()
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+            tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+
+            with open(tmp_path, "wb") as f:
+                np.savez(f, echans_mask=self._echans_mask, **cleaned)
+
+            os.replace(tmp_path, cache_path)
 
     def _download_data(self):
         # download the poshist files
@@ -149,49 +326,26 @@ class GBMData(Data):
         """
         if self._data_type == "ctime":
             max_echan = 7
-        elif self._data_type == "cspec":
+        elif self._data_type in ("cspec", "tte"):
             max_echan = 127
 
-        echans_mask = []
-        for e in self._echans:
-            bounds = e.split("-")
-            mask = np.zeros(max_echan+1, dtype=bool)
-            if len(bounds) == 1:
-                # Only one echan given
-                index = int(bounds[0])
-                assert (
-                    0 <= index <= max_echan
-                ), f"Only Echan numbers between 0 and {max_echan} are allowed"
-                mask[index] = True
-            else:
-                # Echan start and stop given
-                index_start = int(bounds[0])
-                index_stop = int(bounds[1])
-                assert (
-                    0 <= index_start <= max_echan
-                ), f"Only Echan numbers between 0 and {max_echan} are allowed"
-                assert (
-                    0 <= index_stop <= max_echan
-                ), f"Only Echan numbers between 0 and {max_echan} are allowed"
-                mask[index_start: index_stop + 1] = np.ones(
-                    1 + index_stop - index_start, dtype=bool
-                )
-            echans_mask.append(mask)
-        self._echans_mask = np.array(echans_mask)
+        self._echans_mask = echan_mask_construction(self._echans, max_echan)
 
-    def _add_counts_echan(self, counts):
+    def _add_counts_echan(self, counts, channels=None):
         """
         Add the counts together according to the echan masks
-        :param counts: Counts in all time bins and all echans
+        :param counts: Counts in all time bins and all (or the given) echans
+        :param channels: channel numbers of the columns in counts,
+        default are all channels
         :return: summed counts in the definied echans and combined echans
         """
-        sum_counts = np.zeros((len(counts), len(self._echans_mask)))
-        for i, echan_mask in enumerate(self._echans_mask):
-            for j, entry in enumerate(echan_mask):
-                if entry:
-                    sum_counts[:, i] += counts[:, j]
+        echans_mask = self._echans_mask
+        if channels is not None:
+            echans_mask = echans_mask[:, channels]
 
-        return sum_counts
+        # one integer matrix product for all echan masks
+        return np.dot(np.asarray(counts, dtype=np.int32),
+                      echans_mask.T.astype(np.int32))
 
     def cut_out_saa(self, t):
         """
@@ -199,10 +353,60 @@ class GBMData(Data):
         """
 
         # times of saa
-        saa_times = self.saa_times
+        saa_times = self.saa_times[:, 0]
+
+        # all saa exits are masked at once in the "saa" layer
+        self.mask_intervals(np.vstack((saa_times, saa_times + t)).T,
+                            layer="saa", append=False)
+
+    def mask_solar_flares(self, flare_classes=("M", "X"), padding=0,
+                          unvalid=False):
+        """
+        Mask all solar flares of this day from the GOES flare lists
+        in data/datasets/flares in the "flare" layer
+        :param flare_classes: GOES classes of the flares that should be masked
+        :param padding: additional time in seconds masked before and after
+        every flare
+        :param unvalid: If False the flares are only excluded from the fit
+        """
+        intervals = []
+
+        for date in self.dates:
+            day_start = GBMTime(
+                astro_time.Time(f"20{date[:2]}-{date[2:4]}-"
+                                f"{date[4:6]}T00:00:00",
+                                format="isot", scale="utc")
+            ).met
+
+            flare_file = get_path_of_data_file("flares", f"20{date[:2]}.dat")
+
+            if not flare_file.is_file():
+                custom_warnings.warn(
+                    f"No flare list for 20{date[:2]}, "
+                    f"the solar flares of {date} are not masked"
+                )
+                continue
+
+            with open(flare_file) as f:
+                for line in f:
+                    # GOES XRS report format: date yymmdd, start, stop, class
+                    # some records are cut off before the class
+                    if (line[5:11] != date or len(line) <= 59
+                            or line[59] not in flare_classes):
+                        continue
+
+                    start = int(line[13:15]) * 3600 + int(line[15:17]) * 60
+                    stop = int(line[18:20]) * 3600 + int(line[20:22]) * 60
+
+                    # flares that end after midnight
+                    if stop < start:
+                        stop += 86400
 
-        for t_0 in saa_times:
-            self.mask_data(t_0, t)
+                    intervals.append([day_start + start - padding,
+                                      day_start + stop + padding])
+
+        self.mask_intervals(intervals, layer="flare", unvalid=unvalid,
+                            append=False)
 
     @property
     def saa_times(self):
@@ -211,6 +415,10 @@ class GBMData(Data):
                               > 10)
         return self._time_bins[saa_idx+1, 0]
 
+    @property
+    def poshist_bounds(self):
+        return self._poshist_bounds
+
     @property
     def ebin_out_edges(self):
         return self._Ebin_out_edge
@@ -226,3 +434,378 @@ class GBMData(Data):
     @property
     def date(self):
         return self._date
+
+    @property
+    def dates(self):
+        return [self._date]
+
+
+class GBMDataMultiDay(GBMData):
+
+    def __init__(self, name, dates, data_type, detector, echans,
+                 min_bin_width=30, max_cached_days=2, use_cache=True):
+        """
+        Continuous data of one detector for several consecutive days.
+        Only the time bins of all days are kept in memory, the counts of
+        the single days are loaded on demand (at most max_cached_days at
+        the same time) and are only stored in the rebinned form. The
+        time bins are continuous over the day boundaries, so for example
+        SAA exits are found also if they cross midnight.
+        :param dates: list of consecutive dates like ['180407', '180408']
+        :param min_bin_width: min bin width of the rebinned data, must be
+        larger than 0. Without rebinning the rebinned counts would be the
+        unbinned counts of all days.
+        :param max_cached_days: max number of days with counts in memory
+        """
+        assert min_bin_width > 0, \
+            "GBMDataMultiDay only keeps the rebinned counts, min_bin_width must be > 0"
+
+        self._dates = list(dates)
+        self._date = self._dates[0]
+        self._data_type = data_type
+        self._detector = detector
+        self._echans = echans
+        self._use_cache = use_cache
+        self._max_cached_days = max_cached_days
+        self._day_cache = collections.OrderedDict()
+
+        assert detector in valid_det_names,\
+            f"{detector} is not a valid detector name"
+
+        time_bins = []
+        valid_time_mask = []
+
+        # The unbinned counts are split in segments: one per day, loaded
+        # on demand, and one in memory for the appended time bins
+        self._segments = []
+
+        last_stop = -np.inf
+
+        for day_idx, date in enumerate(self._dates):
+            day_data = self._day_data(day_idx)
+
+            # remove the bins that overlap with the day before
+            selection = day_data._time_bins[:, 0] >= last_stop
+
+            time_bins.append(day_data._time_bins[selection])
+            valid_time_mask.append(day_data._base_valid_time_mask[selection])
+
+            self._segments.append(
+                {"day_idx": day_idx, "selection": selection, "counts": None}
+            )
+
+            last_stop = day_data._time_bins[-1, 1]
+
+            self._echans_mask = day_data.echans_mask
+            self._Ebin_out_edge = day_data.ebin_out_edges
+            self._poshist_bounds = day_data.poshist_bounds
+
+            # the day is only kept in the day cache
+            del day_data
+
+        self._update_segment_offsets()
+
+        super(GBMData, self).__init__(name,
+                                      np.concatenate(time_bins),
+                                      None,
+                                      np.concatenate(valid_time_mask))
+
+        self.rebin_data(min_bin_width)
+
+    def _load_day(self, day_idx):
+        """
+        Read the GBMData of one day
+        """
+        return GBMData(
+            name=f"{self._detector}_{self._dates[day_idx]}",
+            date=self._dates[day_idx],
+            data_type=self._data_type,
+            detector=self._detector,
+            echans=self._echans,
+            use_cache=self._use_cache,
+        )
+
+    def _day_data(self, day_idx):
+        """
+        GBMData of one day, loaded on demand
+        """
+        if day_idx in self._day_cache:
+            self._day_cache.move_to_end(day_idx)
+        else:
+            # drop the oldest day before the next one is read
+            while self._day_cache and \
+                    len(self._day_cache) >= self._max_cached_days:
+                self._day_cache.popitem(last=False)
+
+            self._day_cache[day_idx] = self._load_day(day_idx)
+
+        return self._day_cache[day_idx]
+
+    def _update_segment_offsets(self):
+        """
+        (first index, number of time bins) of every segment
+        """
+        self._segment_offsets = []
+        offset = 0
+
+        for segment in self._segments:
+            if segment["counts"] is not None:
+                num = len(segment["counts"].array)
+            else:
+                num = int(np.sum(segment["selection"]))
+
+            self._segment_offsets.append((offset, num))
+            offset += num
+
+    def _segment_counts(self, segment_idx):
+        """
+        Unbinned counts of one segment
+        """
+        segment = self._segments[segment_idx]
+
+        if segment["counts"] is not None:
+            return segment["counts"].array
+
+        return self._day_data(segment["day_idx"])._counts[segment["selection"]]
+
+    def _sum_counts(self, starts, stops):
+        """
+        Sum of the unbinned counts in the index ranges [starts, stops).
+        The segments are summed one after the other with cumulative sums,
+        only the segments that overlap with the ranges are loaded.
+        """
+        counts = np.zeros((len(starts), self.num_echan), dtype=np.int64)
+
+        if len(starts) == 0:
+            return counts
+
+        first, last = np.min(starts), np.max(stops)
+
+        for segment_idx, (offset, num) in enumerate(self._segment_offsets):
+            if offset >= last or offset + num <= first:
+                continue
+
+            cumsum = np.zeros((num + 1, self.num_echan), dtype=np.int64)
+            np.cumsum(self._segment_counts(segment_idx), axis=0,
+                      out=cumsum[1:])
+
+            # part of every range that is in this segment
+            segment_starts = np.clip(starts - offset, 0, num)
+            segment_stops = np.clip(stops - offset, 0, num)
+
+            counts += cumsum[segment_stops] - cumsum[segment_starts]
+
+        return counts
+
+    def _rebin_counts(self):
+        """
+        Rebin the counts segment by segment, so only the counts of one day
+        are needed at the same time
+        """
+        return self._rebin_counts_from(0)
+
+    def _rebin_counts_from(self, first_bin):
+        starts = self._rebinner.starts[first_bin:]
+        stops = self._rebinner.stops[first_bin:].copy()
+
+        # same convention as in the Rebinner for the last bin
+        if starts[-1] == stops[-1]:
+            stops[-1] = len(self._time_bins)
+
+        counts = self._sum_counts(starts, stops)
+
+        # same as in the Rebinner: set bins next to the SAA to zero
+        counts[~self._rebinner.rebinned_mask[first_bin:]] = 0
+
+        return counts
+
+    def _append_counts(self, counts):
+        """
+        The counts of appended time bins are kept in memory in the last
+        segment
+        """
+        last_segment = self._segments[-1]
+
+        if last_segment["counts"] is None:
+            self._segments.append(
+                {"day_idx": None, "selection": None,
+                 "counts": AppendableArray(counts)}
+            )
+        else:
+            last_segment["counts"].extend(counts)
+
+        self._update_segment_offsets()
+
+    def _select_time_bins(self, selection):
+        """
+        Only keep the selected unbinned time bins. The data is rebinned
+        again with the current min bin width, because the counts are only
+        kept in the rebinned form.
+        :param selection: bool mask of the time bins to keep
+        """
+        for segment, (offset, num) in zip(self._segments,
+                                          self._segment_offsets):
+            segment_selection = selection[offset:offset + num]
+
+            if segment["counts"] is not None:
+                segment["counts"] = AppendableArray(
+                    segment["counts"].array[segment_selection]
+                )
+            else:
+                day_selection = segment["selection"].copy()
+                day_selection[
+                    np.flatnonzero(day_selection)[~segment_selection]
+                ] = False
+                segment["selection"] = day_selection
+
+        self._update_segment_offsets()
+
+        self._time_bins = self._time_bins[selection]
+        self._base_valid_time_mask = self._base_valid_time_mask[selection]
+
+        self._append_buffers = None
+
+        self._reset_binning()
+
+    def rebin_data(self, min_bin_width):
+        assert min_bin_width > 0, \
+            "GBMDataMultiDay only keeps the rebinned counts, min_bin_width must be > 0"
+
+        super().rebin_data(min_bin_width)
+
+    def _reset_binning(self):
+        min_bin_width = self._min_bin_width
+
+        super()._reset_binning()
+
+        self.rebin_data(min_bin_width)
+
+    @property
+    def unbinned_counts(self):
+        """
+        Counts of the valid time bins before the rebinning, collected
+        segment by segment
+        """
+        valid_time_mask = self.valid_time_mask
+
+        return np.concatenate([
+            self._segment_counts(segment_idx)[
+                valid_time_mask[offset:offset + num]
+            ]
+            for segment_idx, (offset, num) in enumerate(self._segment_offsets)
+        ])
+
+    @property
+    def num_echan(self):
+        return len(self._echans_mask)
+
+    @property
+    def dates(self):
+        return self._dates
+
+
+class GBMDataSet:
+
+    def __init__(self, date, data_type, detectors, echans,
+                 min_time=None, max_time=None, use_cache=True,
+                 max_workers=None):
+        """
+        Load the data of several detectors of one day. The poshist file is
+        downloaded and its time bounds are read only once and the data
+        files of all detectors are read in parallel in a thread pool.
+        All detectors are put on a common time grid, so the resulting data
+        objects can directly be used for the ModelDets of a ModelCombine.
+        :param date: string like '180407'
+        :param data_type: 'ctime' or 'cspec'
+        :param detectors: list of detector names
+        :param echans: list with echans (same for all detectors)
+        :param max_workers: Number of threads, default is one per detector
+        """
+        self._date = date
+        self._data_type = data_type
+        self._detectors = list(detectors)
+        self._echans = echans
+
+        for det in self._detectors:
+            assert det in valid_det_names, f"{det} is not a valid detector name"
+
+        # all downloads in the main thread, they can contain MPI barriers
+        download_gbm_file(date, "poshist")
+        for det in self._detectors:
+            download_gbm_file(date, data_type, det)
+
+        poshist_bounds = get_poshist_bounds(date, use_cache=use_cache)
+
+        def load(det):
+            return GBMData(name=det, date=date, data_type=data_type,
+                           detector=det, echans=echans, min_time=min_time,
+                           max_time=max_time, use_cache=use_cache,
+                           poshist_bounds=poshist_bounds, download=False)
+
+        if max_workers is None:
+            max_workers = len(self._detectors)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            data_list = list(executor.map(load, self._detectors))
+
+        self._data = collections.OrderedDict(zip(self._detectors, data_list))
+
+        self._put_on_common_time_grid()
+
+    def _put_on_common_time_grid(self):
+        """
+        Only keep the time bins that exist for all detectors
+        """
+        common_starts = None
+        for data in self._data.values():
+            if common_starts is None:
+                common_starts = data._time_bins[:, 0]
+            else:
+                common_starts = np.intersect1d(common_starts,
+                                               data._time_bins[:, 0],
+                                               assume_unique=True)
+
+        for data in self._data.values():
+            mask = np.isin(data._time_bins[:, 0], common_starts,
+                           assume_unique=True)
+            if not np.all(mask):
+                data._select_time_bins(mask)
+
+    def rebin_data(self, min_bin_width):
+        """
+        Rebin the data of all detectors
+        """
+        for data in self._data.values():
+            data.rebin_data(min_bin_width)
+
+    def cut_out_saa(self, t):
+        """
+        Cut out a certain time t after every SAA exit for all detectors
+        """
+        for data in self._data.values():
+            data.cut_out_saa(t)
+
+    def __getitem__(self, det):
+        return self._data[det]
+
+    def __iter__(self):
+        return iter(self._data.values())
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def data_list(self):
+        return list(self._data.values())
+
+    @property
+    def detectors(self):
+        return self._detectors
+
+    @property
+    def date(self):
+        return self._date
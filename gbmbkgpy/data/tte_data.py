@@ -0,0 +1,283 @@
+import numba
+import numpy as np
+import astropy.io.fits as fits
+
+from gbmbkgpy.data.gbm_data import GBMData, valid_det_names, get_poshist_bounds
+from gbmbkgpy.io.downloading import download_gbm_file, download_gbm_tte_file
+from gbmbkgpy.io.package_data import get_path_of_external_data_dir
+
+
+@numba.njit(
+    numba.void(
+        numba.int64[:], numba.int64[:], numba.boolean[:, :], numba.int64[:, :]
+    )
+)
+def histogram_events_numba(bin_idx, pha, echans_mask, counts):
+    """
+    Add the events to the counts of their time bin and of all echan
+    groups that contain their pha channel. Events with bin_idx < 0 are
+    outside of all time bins and get ignored.
+    :param bin_idx: index of the time bin of every event
+    :param pha: pha channel of every event
+    :param echans_mask: bool array (N_echan_groups, N_channels)
+    :param counts: counts array (N_time_bins, N_echan_groups) to fill
+    """
+    for i in range(bin_idx.shape[0]):
+        b = bin_idx[i]
+        if b < 0:
+            continue
+        for j in range(echans_mask.shape[0]):
+            if echans_mask[j, pha[i]]:
+                counts[b, j] += 1
+
+
+def time_bins_in_gtis(gtis, bin_width):
+    """
+    Split all good time intervals in bins of the given width. The
+    remainder at the end of every interval is dropped, so there are gaps
+    in the time bins between the good time intervals (e.g. SAA passages).
+    :param gtis: array with (start, stop) of the good time intervals
+    :param bin_width: width of the time bins
+    :returns: time bins array (N, 2)
+    """
+    bin_starts = []
+    for start, stop in gtis:
+        num_bins = int(np.floor((stop - start) / bin_width))
+        bin_starts.append(start + np.arange(num_bins) * bin_width)
+
+    bin_starts = np.concatenate(bin_starts)
+
+    return np.vstack((bin_starts, bin_starts + bin_width)).T
+
+
+class EventList:
+    """
+    Memory mapped TTE event files. The events are never stored as a whole,
+    they are streamed in chunks from the TIME and PHA columns and directly
+    histogrammed into the requested time bins and echan groups.
+    """
+
+    def __init__(self, event_files, chunk_size=2 ** 22):
+        """
+        :param event_files: paths of the TTE files, ordered in time
+        :param chunk_size: number of events read and histogrammed at once
+        """
+        self._event_files = [str(p) for p in event_files]
+        self._chunk_size = int(chunk_size)
+
+        gtis = []
+        num_events = 0
+        for path in self._event_files:
+            with fits.open(path, memmap=True) as f:
+                gtis.append(
+                    np.vstack((f["GTI"].data["START"],
+                               f["GTI"].data["STOP"])).T.astype(np.float64)
+                )
+                num_events += f["EVENTS"].header["NAXIS2"]
+
+                edge_start = f["EBOUNDS"].data["E_MIN"]
+                edge_stop = f["EBOUNDS"].data["E_MAX"]
+
+        self._ebin_out_edge = np.append(edge_start, edge_stop[-1]).astype(
+            np.float64
+        )
+
+        self._num_events = num_events
+        self._gtis = self._merge_intervals(np.concatenate(gtis))
+
+    @staticmethod
+    def _merge_intervals(intervals):
+        """
+        Sort the intervals and merge the touching or overlapping ones,
+        e.g. the GTIs of two consecutive hourly files
+        """
+        intervals = intervals[np.argsort(intervals[:, 0])]
+
+        merged = [intervals[0].copy()]
+        for start, stop in intervals[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append(np.array([start, stop]))
+
+        return np.array(merged)
+
+    def iter_chunks(self):
+        """
+        Iterate over the events in chunks
+        :returns: generator of (time, pha) arrays
+        """
+        for path in self._event_files:
+            with fits.open(path, memmap=True) as f:
+                events = f["EVENTS"].data
+                time = events["TIME"]
+                pha = events["PHA"]
+
+                for start in range(0, len(events), self._chunk_size):
+                    stop = start + self._chunk_size
+                    yield (np.asarray(time[start:stop], dtype=np.float64),
+                           np.asarray(pha[start:stop], dtype=np.int64))
+
+    def histogram(self, time_bins, echans_mask):
+        """
+        Histogram all events in the given time bins and echan groups.
+        The time bins have to be sorted and must not overlap, but they
+        can be of arbitrary width and have gaps.
+        :param time_bins: time bins array (N, 2)
+        :param echans_mask: bool array (N_echan_groups, N_channels)
+        :returns: counts array (N, N_echan_groups)
+        """
+        echans_mask = np.ascontiguousarray(echans_mask, dtype=np.bool_)
+        counts = np.zeros((len(time_bins), len(echans_mask)), dtype=np.int64)
+
+        bin_start = np.ascontiguousarray(time_bins[:, 0])
+        bin_stop = np.ascontiguousarray(time_bins[:, 1])
+
+        for time, pha in self.iter_chunks():
+
+            # the events are sorted in time, so chunks outside of the
+            # time bins can be skipped
+            if time[-1] < bin_start[0] or time[0] >= bin_stop[-1]:
+                continue
+
+            bin_idx = np.searchsorted(bin_start, time, side="right") - 1
+
+            # events before the first bin or in a gap between two bins
+            outside = bin_idx < 0
+            outside[~outside] = time[~outside] >= bin_stop[bin_idx[~outside]]
+            bin_idx[outside] = -1
+
+            histogram_events_numba(bin_idx, pha, echans_mask, counts)
+
+        return counts
+
+    @property
+    def gtis(self):
+        return self._gtis
+
+    @property
+    def ebin_out_edges(self):
+        return self._ebin_out_edge
+
+    @property
+    def num_events(self):
+        return self._num_events
+
+
+class GBMTTEData(GBMData):
+    """
+    GBM data based on the continuous TTE event lists. The counts are
+    histogrammed from the events, so rebin_data creates bins of exactly
+    the requested width directly from the events instead of combining
+    the bins of a fixed base binning.
+    """
+
+    def __init__(self, name, date, detector, echans, hours=None,
+                 bin_width=1.024, min_time=None, max_time=None,
+                 chunk_size=2 ** 22, poshist_bounds=None, download=True):
+        """
+        :param hours: hours of the day to use (0-23), default all hours
+        :param bin_width: width of the time bins built at the init
+        :param chunk_size: number of events histogrammed at once
+        :param poshist_bounds: (min, max) time covered by the poshist file,
+        if already known. Otherwise it is read from the poshist file.
+        :param download: Download the TTE and poshist files if needed.
+        """
+
+        self._date = date
+        self._data_type = "tte"
+        self._detector = detector
+        self._echans = echans
+        self._min_time = min_time
+        self._max_time = max_time
+        self._use_cache = False
+        self._hours = list(range(24)) if hours is None else list(hours)
+
+        assert detector in valid_det_names,\
+            f"{detector} is not a valid detector name"
+
+        if download:
+            self._download_data()
+
+        self._echan_mask_construction()
+
+        self._events = EventList(self._event_file_paths(), chunk_size)
+
+        self._Ebin_out_edge = self._events.ebin_out_edges
+
+        if poshist_bounds is None:
+            poshist_bounds = get_poshist_bounds(self._date)
+        self._poshist_bounds = np.asarray(poshist_bounds, dtype=np.float64)
+
+        self._gtis = self._clip_gtis(self._events.gtis)
+
+        time_bins = time_bins_in_gtis(self._gtis, bin_width)
+        counts = self._events.histogram(time_bins, self._echans_mask)
+
+        super(GBMData, self).__init__(name, time_bins, counts)
+
+    def _download_data(self):
+        # download the poshist files
+        download_gbm_file(self._date, "poshist")
+
+        for hour in self._hours:
+            download_gbm_tte_file(self._date, self._detector, hour)
+
+    def _event_file_paths(self):
+        file_dir = get_path_of_external_data_dir() / "tte" / self._date
+
+        return [
+            file_dir / f"glg_tte_{self._detector}_{self._date}_"
+                       f"{str(hour).zfill(2)}z_v00.fit"
+            for hour in self._hours
+        ]
+
+    def _clip_gtis(self, gtis):
+        """
+        Clip the good time intervals to the time covered by the poshist
+        file and to min_time and max_time
+        """
+        lower, upper = self._poshist_bounds
+
+        if self._min_time is not None:
+            lower = max(lower, self._min_time)
+
+        if self._max_time is not None:
+            upper = min(upper, self._max_time)
+
+        gtis = np.clip(gtis, lower, upper)
+
+        return gtis[gtis[:, 1] > gtis[:, 0]]
+
+    def rebin_data(self, min_bin_width):
+        """
+        Histogram the events again in time bins with a width of
+        min_bin_width. All mask layers are kept and get applied to
+        the new time bins.
+        :param min_bin_width: width of the new time bins
+        """
+        time_bins = time_bins_in_gtis(self._gtis, min_bin_width)
+
+        self._time_bins = time_bins
+        self._counts = self._events.histogram(time_bins, self._echans_mask)
+        self._base_valid_time_mask = np.ones(len(time_bins), dtype=bool)
+
+        self._reset_binning()
+
+        self._min_bin_width = min_bin_width
+
+    def append(self, time_bins, counts):
+        # rebin_data histograms the events again and would drop
+        # appended bins
+        raise NotImplementedError(
+            "The TTE data is histogrammed from the event files, "
+            "new events have to be added as new event files"
+        )
+
+    @property
+    def gtis(self):
+        return self._gtis
+
+    @property
+    def hours(self):
+        return self._hours
@@ -1,3 +1,5 @@
+import os
+import collections
 import numpy as np
 from scipy.interpolate import interp1d
 import scipy.interpolate as interpolate
@@ -13,6 +15,11 @@ from gbmbkgpy.io.downloading import (download_gbm_file,
                                      download_trigdata_file,
                                      download_lat_spacecraft)
 from gbmbkgpy.utils.binner import Rebinner
+from gbmbkgpy.data.gbm_data import get_poshist_bounds
+from gbmbkgpy.io.package_data import get_path_of_external_data_dir
+from gbmbkgpy.utils.mpi import check_mpi
+
+using_mpi, rank, size, comm = check_mpi()
 
 
 def ang2cart(ra, dec):
@@ -54,6 +61,216 @@ def get_ang(X1, X2):
     return np.arccos(tmp)
 
 
+def day_start_met(date, days_after=0):
+    """
+    MET of the start of a day
+    :param date: string like '180407'
+    :param days_after: shift by this number of days
+    """
+    day = astro_time.Time(f"20{date[:2]}-{date[2:4]}-{date[4:6]}")
+
+    return GBMTime(day + u.Quantity(days_after, u.day)).met
+
+
+def get_lat_mcl_week(mission_week, use_cache=True):
+    """
+    McIlwain L-parameter of one weekly LAT spacecraft file. The columns
+    are stored in a compact cache in $GBMDATA/cache/lat (times as float32
+    offsets to TSTART and McIlwain L as float32), which is shared between
+    all days and processes, so the ~30 MB FITS file is only read once.
+    :param mission_week: mission week of the LAT file
+    :param use_cache: Use the cache in $GBMDATA/cache/lat
+    :returns: time, mc_l, tstart and tstop of the file
+    """
+    mission_week = int(mission_week)
+
+    cache_path = (get_path_of_external_data_dir() / "cache" / "lat" /
+                  f"mcl_w{str(mission_week).zfill(3)}.npz")
+
+    # rank 0 decides, otherwise the ranks could differ in the
+    # download below, which contains a MPI barrier
+    cache_exists = use_cache and cache_path.exists()
+    if using_mpi:
+        cache_exists = comm.bcast(cache_exists, root=0)
+
+    if cache_exists:
+        with np.load(cache_path) as cache:
+            tstart, tstop = cache["bounds"]
+            lat_time = tstart + cache["time_offset"].astype(np.float64)
+            mc_l = cache["mc_l"].astype(np.float64)
+
+        return lat_time, mc_l, tstart, tstop
+
+    filepath = download_lat_spacecraft(mission_week)
+
+    with fits.open(filepath, memmap=True) as fits_file:
+        tstart = float(fits_file["PRIMARY"].header["TSTART"])
+        tstop = float(fits_file["PRIMARY"].header["TSTOP"])
+
+        lat_time = np.mean(
+            np.vstack((fits_file["SC_DATA"].data["START"],
+                       fits_file["SC_DATA"].data["STOP"])),
+            axis=0,
+        )
+        mc_l = np.array(fits_file["SC_DATA"].data["L_MCILWAIN"],
+                        dtype=np.float32)
+
+    # a week has ~6e5 s, so float32 offsets are exact to ~0.05 s
+    time_offset = (lat_time - tstart).astype(np.float32)
+
+    if use_cache and rank == 0:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+
+        with open(tmp_path, "wb") as f:
+            np.savez(f, bounds=np.array([tstart, tstop]),
+                     time_offset=time_offset, mc_l=mc_l)
+
+        os.replace(tmp_path, cache_path)
+
+    return (tstart + time_offset.astype(np.float64),
+            mc_l.astype(np.float64), tstart, tstop)
+
+
+def get_lat_mcl(min_met, max_met, use_cache=True):
+    """
+    McIlwain L-parameter from the weekly LAT spacecraft files between two
+    times. All weeks overlapping with the time range are combined and the
+    week before or after is added if a file does not cover the full range.
+    :param min_met: start of the time range
+    :param max_met: stop of the time range
+    :param use_cache: Use the cache of the weekly files
+    :returns: time, mc_l
+    """
+    first_week = int(np.floor(GBMTime.from_MET(min_met).mission_week.value))
+    last_week = int(np.floor(GBMTime.from_MET(max_met).mission_week.value))
+
+    lat_time = []
+    mc_l = []
+
+    for mission_week in range(first_week, last_week + 1):
+        week_time, week_mc_l, tstart, tstop = get_lat_mcl_week(
+            mission_week, use_cache
+        )
+
+        # do we need the week before?
+        if mission_week == first_week and tstart >= min_met:
+            before_time, before_mc_l, _, _ = get_lat_mcl_week(
+                mission_week - 1, use_cache
+            )
+            lat_time.append(before_time)
+            mc_l.append(before_mc_l)
+
+        lat_time.append(week_time)
+        mc_l.append(week_mc_l)
+
+        # do we need the next week?
+        if mission_week == last_week and tstop <= max_met:
+            after_time, after_mc_l, _, _ = get_lat_mcl_week(
+                mission_week + 1, use_cache
+            )
+            lat_time.append(after_time)
+            mc_l.append(after_mc_l)
+
+    return np.concatenate(lat_time), np.concatenate(mc_l)
+
+
+def bgo_cr_tracer_spline(time_bins, counts):
+    """
+    Smoothing spline of the BGO count rate in 100 second bins
+    :param time_bins: time bins of the CSPEC data (N, 2)
+    :param counts: counts summed over the channel range (N,)
+    :returns: spline (t, c, k) and the minimum of the spline
+    """
+    # bin in 100 second bins with the Rebinner, which sets the counts of
+    # the bins closed by a gap (SAA) to zero
+    this_rebinner = Rebinner(time_bins, 100)
+    rebinned_time_bins = this_rebinner.time_rebinned
+    (rebinned_counts,) = this_rebinner.rebin(counts)
+
+    rates = rebinned_counts / (rebinned_time_bins[:, 1] -
+                               rebinned_time_bins[:, 0])
+
+    # Add first time and last time with corresponding rate to rate_list
+    rates = np.concatenate((rates[:1], rates, rates[-1:]))
+
+    times = np.concatenate(
+        (time_bins[:1, 0], np.mean(rebinned_time_bins, axis=1),
+         time_bins[-1:, 1])
+    )
+
+    # same smoothing spline as interpolate.UnivariateSpline(s=1000, k=3)
+    tck = interpolate.splrep(times, rates, s=1000, k=3)
+
+    # minimum of the spline over the whole day, so the tracer does not
+    # depend on the times it is evaluated at
+    tracer_min = float(np.min(
+        interpolate.splev(np.arange(times[0], times[-1], 10.0), tck)
+    ))
+
+    return tck, tracer_min
+
+
+def get_bgo_cr_tracer(date, side, echan_range=(85, 104), use_cache=True):
+    """
+    Smoothing spline of the count rate in the high energy channels of a BGO
+    detector, which traces the cosmic ray rate. The spline knots and the
+    minimum of the spline over the day are cached in $GBMDATA/cache/bgo_tracer.
+    :param date: string like '180407'
+    :param side: BGO side (0 or 1)
+    :param echan_range: first and last CSPEC channel that are summed
+    :param use_cache: Use the cache in $GBMDATA/cache/bgo_tracer
+    :returns: spline (t, c, k) and the minimum of the spline
+    """
+    first_echan, last_echan = (int(e) for e in echan_range)
+
+    cache_path = (get_path_of_external_data_dir() / "cache" / "bgo_tracer" /
+                  f"{date}_b{side}_{first_echan}-{last_echan}.npz")
+
+    # rank 0 decides, otherwise the ranks could differ in the
+    # download below, which contains a MPI barrier
+    cache_exists = use_cache and cache_path.exists()
+    if using_mpi:
+        cache_exists = comm.bcast(cache_exists, root=0)
+
+    if cache_exists:
+        with np.load(cache_path) as cache:
+            tck = (cache["t"], cache["c"], int(cache["k"]))
+            tracer_min = float(cache["min"])
+
+        return tck, tracer_min
+
+    # download bgo data
+    datafile_path = download_gbm_file(date, "cspec", f"b{side}")
+
+    # read in data, only the needed channel range
+    with fits.open(datafile_path, memmap=True) as f:
+        counts = np.sum(
+            f["SPECTRUM"].data["COUNTS"][:, first_echan:last_echan + 1],
+            axis=1,
+            dtype=np.int64,
+        )
+        bin_start = np.array(f["SPECTRUM"].data["TIME"], dtype=np.float64)
+        bin_stop = np.array(f["SPECTRUM"].data["ENDTIME"], dtype=np.float64)
+
+    tck, tracer_min = bgo_cr_tracer_spline(
+        np.vstack((bin_start, bin_stop)).T, counts
+    )
+
+    if use_cache and rank == 0:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+
+        with open(tmp_path, "wb") as f:
+            np.savez(f, t=tck[0], c=tck[1], k=tck[2], min=tracer_min)
+
+        os.replace(tmp_path, cache_path)
+
+    return tck, tracer_min
+
+
 class GBMGeometry(Geometry):
 
     def __init__(self, date, cr_tracer_type="MCL", bgo_side=None):
@@ -76,9 +293,10 @@ class GBMGeometry(Geometry):
         :returns: x,y anz axis in icrs frame
         """
 
-        scx = np.zeros(3)
-        scy = np.zeros(3)
-        scz = np.zeros(3)
+        # works for one quaternion or an array of quaternions (4, N)
+        scx = np.zeros((3,) + np.shape(quaternions[0]))
+        scy = np.zeros((3,) + np.shape(quaternions[0]))
+        scz = np.zeros((3,) + np.shape(quaternions[0]))
 
         scx[0] = (
             quaternions[0] ** 2
@@ -214,24 +432,133 @@ class GBMGeometry(Geometry):
         :param dec: dec of source (array or float)
         :returns: bool
         """
+        return ~self.visibility(time, ra, dec)[0]
 
-        # get sc pos at this time
-        sc_pos = self._position_interpolator.sc_pos(time)
-
-        # earth opening angle seen from sat
+    def _cos_horizon(self, sc_pos):
+        """
+        Cosine of the earth opening angle (measured from the earth center)
+        seen from the satellite. A direction is occulted if the cosine of
+        its angle to the earth center is larger.
+        :param sc_pos: spacecraft positions (N, 3) in km
+        :returns: cos of the horizon angle and unit vectors to the earth center
+        """
         earth_radius = 6371.0
-        fermi_radius = np.sqrt((sc_pos ** 2).sum())
-        horizon_angle = 90 - np.rad2deg(np.arccos(earth_radius / fermi_radius))
-        min_vis = np.deg2rad(horizon_angle)
+        fermi_radius = np.linalg.norm(sc_pos, axis=1)
+
+        cos_horizon = np.sqrt(1 - (earth_radius / fermi_radius) ** 2)
+
+        earth_direction = -sc_pos / fermi_radius[:, np.newaxis]
+
+        return cos_horizon, earth_direction
+
+    def _visibility_margin(self, times, source_pos):
+        """
+        Difference of the horizon cosine and the cosine of the angle between
+        the sources and the earth center. >= 0 if visible.
+        :param times: times (N_times)
+        :param source_pos: unit vectors of the sources in ICRS (N_src, 3)
+        :returns: array (N_times, N_src)
+        """
+        sc_pos = np.atleast_2d(self._position_interpolator.sc_pos(times))
+
+        cos_horizon, earth_direction = self._cos_horizon(sc_pos)
+
+        return cos_horizon[:, np.newaxis] - np.dot(earth_direction, source_pos.T)
+
+    def visibility(self, times, ra, dec, return_crossings=False, num_refine=3):
+        """
+        Check for many times and sources at once if the sources are visible
+        (not occulted by the earth). All angles are compared with one
+        broadcasted dot product of the earth directions and the sources.
+        :param times: times of interest (array or float)
+        :param ra: ra of the sources in ICRS (array or float)
+        :param dec: dec of the sources in ICRS (array or float)
+        :param return_crossings: Also return the times when the sources set
+        behind the earth (ingress) and rise again (egress)
+        :param num_refine: number of regula falsi steps to refine the
+        crossing times between two of the given times
+        :returns: bool array (N_times, N_src), True if visible. If
+        return_crossings, also dict with lists of ingress and egress times
+        per source
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        source_pos = ang2cart(ra, dec)
+
+        margin = self._visibility_margin(times, source_pos)
+
+        visible = margin >= 0
+
+        if not return_crossings:
+            return visible
 
-        # vector defined by ra and dec
-        cart_position = ang2cart(ra, dec)
+        # all pairs of times and sources where the visibility changes
+        idx_time, idx_src = np.nonzero(visible[1:] != visible[:-1])
+
+        t_low = times[idx_time]
+        t_high = times[idx_time + 1]
+        m_low = margin[idx_time, idx_src]
+        m_high = margin[idx_time + 1, idx_src]
+
+        for step in range(num_refine):
+            t_cross = t_low - m_low * (t_high - t_low) / (m_high - m_low)
+
+            sc_pos = np.atleast_2d(self._position_interpolator.sc_pos(t_cross))
+            cos_horizon, earth_direction = self._cos_horizon(sc_pos)
+
+            m_cross = cos_horizon - np.einsum(
+                "ij,ij->i", earth_direction, source_pos[idx_src]
+            )
 
-        # angle between the two vectors
-        ang_sep = get_ang(cart_position, -sc_pos)
+            # keep the crossing bracketed
+            same_side = np.sign(m_cross) == np.sign(m_low)
+            t_low = np.where(same_side, t_cross, t_low)
+            m_low = np.where(same_side, m_cross, m_low)
+            t_high = np.where(same_side, t_high, t_cross)
+            m_high = np.where(same_side, m_high, m_cross)
 
-        # check if occulted
-        return ang_sep < min_vis
+        t_cross = t_low - m_low * (t_high - t_low) / (m_high - m_low)
+
+        ingress = visible[idx_time, idx_src]
+
+        crossings = {"ingress": [], "egress": []}
+        for j in range(len(source_pos)):
+            this_src = idx_src == j
+            crossings["ingress"].append(t_cross[this_src & ingress])
+            crossings["egress"].append(t_cross[this_src & ~ingress])
+
+        return visible, crossings
+
+    def visibility_satellite_frame(self, times, az, el):
+        """
+        Check for many times and positions given in the satellite frame if
+        they are visible (not occulted by the earth). The earth direction is
+        rotated in the satellite frame once per time and all positions are
+        compared with one broadcasted dot product.
+        :param times: times of interest (array or float)
+        :param az: az in sat frame (degree) (array or float)
+        :param el: el in sat frame (degree) (array or float)
+        :returns: bool array (N_times, N_pos), True if visible
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+
+        sc_pos = np.atleast_2d(self._position_interpolator.sc_pos(times))
+        quaternions = np.atleast_2d(self._position_interpolator.quaternion(times))
+
+        cos_horizon, earth_direction = self._cos_horizon(sc_pos)
+
+        scx, scy, scz = self._compute_sc_coords(quaternions.T)
+
+        # earth direction in the satellite frame (N_times, 3)
+        earth_direction_sat = np.vstack((
+            np.einsum("ij,ji->i", earth_direction, scx),
+            np.einsum("ij,ji->i", earth_direction, scy),
+            np.einsum("ij,ji->i", earth_direction, scz),
+        )).T
+
+        pos_sat = ang2cart(az, el)
+
+        return (cos_horizon[:, np.newaxis] -
+                np.dot(earth_direction_sat, pos_sat.T)) >= 0
 
     def sc_pos(self, time):
         """
@@ -287,157 +614,208 @@ class GBMGeometry(Geometry):
 
         return sun_cart
 
-    def _create_bgo_cr_tracer_interp(self, date, side, echans=np.arange(85,105,1)):
+    def _create_bgo_cr_tracer_interp(self, date, side, echan_range=(85, 104)):
+        """
+        create the cosmic ray tracer from the high energy BGO CSPEC channels
+        :param side: BGO side (0 or 1)
+        :param echan_range: first and last CSPEC channel that are summed
+        """
+        tck, tracer_min = get_bgo_cr_tracer(date, side, echan_range)
 
+        spline = interpolate.BSpline(*tck)
 
-        # download bgo data
-        datafile_path = download_gbm_file(date, "cspec", f"b{side}")
+        def final_tracer(x):
+            return spline(x) - tracer_min
 
-        # read in data
-        with fits.open(datafile_path) as f:
-            counts = f["SPECTRUM"].data["COUNTS"][:, echans[0]]
-            for echan in echans[1:]:
-                counts += f["SPECTRUM"].data["COUNTS"][:, echan]
-            bin_start = f["SPECTRUM"].data["TIME"]
-            bin_stop = f["SPECTRUM"].data["ENDTIME"]
+        self._interp_tracer = final_tracer
 
-        # bin in 100 second bins
-        total_time_bins = np.vstack((bin_start, bin_stop)).T
-        min_bin_width = 100
+    def _create_mcl_cr_tracer_interp(self, date, last_date=None):
+        """
+        create mcl interpolation function
+        :param date: first day
+        :param last_date: last day if the tracer should cover several days
+        """
+        if last_date is None:
+            last_date = date
 
-        this_rebinner = Rebinner(total_time_bins, min_bin_width)
-        rebinned_time_bins = this_rebinner.time_rebinned
-        (rebinned_counts,) = this_rebinner.rebin(counts)
+        min_met = day_start_met(date)
 
-        rates = rebinned_counts / (rebinned_time_bins[:, 1] - rebinned_time_bins[:, 0])
+        max_met = day_start_met(last_date, days_after=1)
 
-        # Add first time and last time with corresponding rate to rate_list
-        rates = np.concatenate((rates[:1], rates, rates[-1:]))
+        lat_time, mc_l = get_lat_mcl(min_met, max_met)
 
-        times = np.concatenate(
-            (bin_start[:1], np.mean(rebinned_time_bins, axis=1), bin_stop[-1:])
-        )
-        interp_tracer = interpolate.UnivariateSpline(
-                times, rates, s=1000, k=3
-            )
+        # get mc_l diff
+        mc_l -= np.min(mc_l)
 
-        def final_tracer(x):
-            return interp_tracer(x)-interp_tracer(x).min()
+        self._interp_tracer = interp1d(lat_time, mc_l)
 
-        self._interp_tracer = final_tracer
-    
-    def _create_mcl_cr_tracer_interp(self, date):
+    def cr_tracer(self, time):
         """
-        create mcl interpolation function
+        Returns the McIlwain L-parameter difference for the satellite position
+        for a given time and the minumum mcl value
+        :param time: times of interest (array or float)
         """
+        return self._interp_tracer(time)
 
-        # read the file
-        year = "20%s" % date[:2]
-        month = date[2:-2]
-        dd = date[-2:]
 
-        day = astro_time.Time("%s-%s-%s" % (year, month, dd))
+class GBMGeometryPosHist(GBMGeometry):
 
-        min_met = GBMTime(day).met
+    def __init__(self, date,cr_tracer_type="MCL", bgo_side=None):
 
-        max_met = GBMTime(day + u.Quantity(1, u.day)).met
+        # download data file and get file location
+        poshist_path = download_gbm_file(date, "poshist")
 
-        gbm_time = GBMTime(day)
+        # construct position interpolator object
+        self._position_interpolator = PositionInterpolator.from_poshist(
+            poshist_file=poshist_path
+        )
 
-        mission_week = np.floor(gbm_time.mission_week.value)
+        super().__init__(date,cr_tracer_type=cr_tracer_type,bgo_side=bgo_side)
 
-        filepath = download_lat_spacecraft(mission_week)
 
-        # Init all arrays as empty arrays
-        lat_time = np.array([])
-        mc_l = np.array([])
+class MultiDayPositionInterpolator:
 
-        # lets check that this file has the right info
+    def __init__(self, dates, max_cached_days=3):
+        """
+        Position interpolator for several consecutive days. The poshist
+        files of the single days are only loaded if they are needed and at
+        most max_cached_days of them are kept in memory. Times in the small
+        gaps between two poshist files are interpolated between the last
+        entry of the day before and the first entry of the day after.
+        :param dates: list of consecutive dates like ['180407', '180408']
+        :param max_cached_days: max number of days kept in memory
+        """
+        assert max_cached_days >= 2, (
+            "At least two days are needed to interpolate over day boundaries"
+        )
 
-        week_before = False
-        week_after = False
+        self._dates = list(dates)
+        self._max_cached_days = max_cached_days
+        self._cache = collections.OrderedDict()
 
-        with fits.open(filepath) as fits_file:
+        self._poshist_paths = [download_gbm_file(date, "poshist")
+                               for date in self._dates]
 
-            # do we need the week before?
-            if fits_file["PRIMARY"].header["TSTART"] >= min_met:
-                # we need to get week before
-                week_before = True
+        bounds = np.array([get_poshist_bounds(date) for date in self._dates])
+        self._day_starts = bounds[:, 0]
+        self._day_stops = bounds[:, 1]
 
-                before_filepath = download_lat_spacecraft(mission_week-1)
+    def _interpolator(self, day_idx):
+        """
+        PositionInterpolator of one day, loaded on demand
+        """
+        if day_idx in self._cache:
+            self._cache.move_to_end(day_idx)
+        else:
+            self._cache[day_idx] = PositionInterpolator.from_poshist(
+                poshist_file=self._poshist_paths[day_idx]
+            )
+            if len(self._cache) > self._max_cached_days:
+                self._cache.popitem(last=False)
 
-            # do we need the next week?
-            if fits_file["PRIMARY"].header["TSTOP"] <= max_met:
+        return self._cache[day_idx]
 
-                # we need to get week after
+    def _evaluate(self, func_name, t, ndim):
+        """
+        Evaluate a function of the PositionInterpolator for times that can
+        be spread over several days
+        """
+        scalar = np.ndim(t) == 0
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
 
-                week_after = True
+        day_idx = np.clip(
+            np.searchsorted(self._day_starts, t, side="right") - 1,
+            0, len(self._dates) - 1
+        )
 
-                after_filepath = download_lat_spacecraft(mission_week+1)
+        result = np.empty((len(t), ndim))
 
-            # first lets get the primary file
+        for idx in np.unique(day_idx):
+            selection = day_idx == idx
+            times = t[selection]
 
-            lat_time = np.mean(
-                np.vstack((fits_file["SC_DATA"].data["START"],
-                           fits_file["SC_DATA"].data["STOP"])),
-                axis=0,
-            )
-            mc_l = fits_file["SC_DATA"].data["L_MCILWAIN"]
-
-        # if we need to append anything to make up for the
-        # dates not being included in the files
-        # do it here...
-        if week_before:
-            with fits.open(before_filepath) as fits_file:
-                lat_time_before = np.mean(
-                    np.vstack((fits_file["SC_DATA"].data["START"],
-                               fits_file["SC_DATA"].data["STOP"])),
-                    axis=0,
-                )
-                mc_l_before = fits_file["SC_DATA"].data["L_MCILWAIN"]
+            values = np.empty((len(times), ndim))
 
-            mc_l = np.append(mc_l_before, mc_l)
-            lat_time = np.append(lat_time_before, lat_time)
+            # times after the end of this poshist file
+            in_gap = times > self._day_stops[idx]
 
-        if week_after:
-            with fits.open(after_filepath) as fits_file:
-                lat_time_after = np.mean(
-                    np.vstack((fits_file["SC_DATA"].data["START"],
-                               fits_file["SC_DATA"].data["STOP"])),
-                    axis=0,
+            if np.any(~in_gap):
+                values[~in_gap] = getattr(self._interpolator(idx), func_name)(
+                    times[~in_gap]
                 )
-                mc_l_after = fits_file["SC_DATA"].data["L_MCILWAIN"]
 
-            mc_l = np.append(mc_l, mc_l_after)
-            lat_time = np.append(lat_time, lat_time_after)
+            if np.any(in_gap):
+                assert idx + 1 < len(self._dates), (
+                    "Time is outside of the time covered by the poshist files"
+                )
+                t0 = self._day_stops[idx]
+                t1 = self._day_starts[idx + 1]
 
-        # get mc_l diff
-        mc_l -= np.min(mc_l)
+                v0 = getattr(self._interpolator(idx), func_name)(t0)
+                v1 = getattr(self._interpolator(idx + 1), func_name)(t1)
 
-        self._interp_tracer = interp1d(lat_time, mc_l)
+                weight = ((times[in_gap] - t0) / (t1 - t0))[:, np.newaxis]
+                values[in_gap] = v0 + weight * (v1 - v0)
 
-    def cr_tracer(self, time):
-        """
-        Returns the McIlwain L-parameter difference for the satellite position
-        for a given time and the minumum mcl value
-        :param time: times of interest (array or float)
-        """
-        return self._interp_tracer(time)
+            result[selection] = values
 
+        if scalar:
+            return result[0]
 
-class GBMGeometryPosHist(GBMGeometry):
+        return result
 
-    def __init__(self, date,cr_tracer_type="MCL", bgo_side=None):
+    def quaternion(self, t):
+        return self._evaluate("quaternion", t, 4)
 
-        # download data file and get file location
-        poshist_path = download_gbm_file(date, "poshist")
+    def sc_pos(self, t):
+        return self._evaluate("sc_pos", t, 3)
 
-        # construct position interpolator object
-        self._position_interpolator = PositionInterpolator.from_poshist(
-            poshist_file=poshist_path
+    def utc(self, t):
+        met = self.met(t)
+
+        time = GBMTime.from_MET(met)
+
+        return time.time.fits
+
+    def met(self, t):
+        return t
+
+    @property
+    def time(self):
+        return self._interpolator(0).time
+
+    @property
+    def dates(self):
+        return self._dates
+
+
+class GBMGeometryPosHistMultiDay(GBMGeometry):
+
+    def __init__(self, dates, cr_tracer_type="MCL", max_cached_days=3):
+        """
+        Geometry for several consecutive days, that can be used like the
+        geometry of a single day. The poshist files are loaded lazily
+        and the CR tracer is continuous over the day boundaries.
+        :param dates: list of consecutive dates like ['180407', '180408']
+        :param max_cached_days: max number of poshist files kept in memory
+        """
+        assert cr_tracer_type == "MCL", (
+            "Only the MCL tracer is supported for several days"
         )
 
-        super().__init__(date,cr_tracer_type=cr_tracer_type,bgo_side=bgo_side)
+        self._dates = list(dates)
+
+        self._position_interpolator = MultiDayPositionInterpolator(
+            self._dates, max_cached_days=max_cached_days
+        )
+
+        self._date = self._dates[0]
+
+        self._create_mcl_cr_tracer_interp(self._dates[0], self._dates[-1])
+
+    @property
+    def dates(self):
+        return self._dates
 
 
 class GBMGeometryTrigdat(GBMGeometry):
@@ -80,3 +80,44 @@ class Geometry:
         """
 
         raise RuntimeError("Has to be implemented in sub-class")
+
+    def visibility(self, times, ra, dec, return_crossings=False):
+        """
+        Check for many times and sources at once if the sources are visible
+        (not occulted by the earth). This fallback loops over the times and
+        calls is_occulted, sub-classes can overwrite it with a batched version.
+        :param times: times of interest (array or float)
+        :param ra: ra of the sources in ICRS (array or float)
+        :param dec: dec of the sources in ICRS (array or float)
+        :param return_crossings: Also return the ingress and egress times
+        :returns: bool array (N_times, N_src), True if visible
+        """
+        if return_crossings:
+            raise NotImplementedError(
+                "The crossing times have to be implemented in sub-class"
+            )
+
+        times = np.atleast_1d(times)
+
+        return np.array(
+            [~np.atleast_1d(self.is_occulted(time, ra, dec)) for time in times]
+        )
+
+    def visibility_satellite_frame(self, times, az, el):
+        """
+        Check for many times and positions in the satellite frame if they
+        are visible (not occulted by the earth). This fallback loops over
+        the times, sub-classes can overwrite it with a batched version.
+        :param times: times of interest (array or float)
+        :param az: az in sat frame (degree) (array or float)
+        :param el: el in sat frame (degree) (array or float)
+        :returns: bool array (N_times, N_pos), True if visible
+        """
+        times = np.atleast_1d(times)
+
+        visible = []
+        for time in times:
+            ra, dec = self.satellite_to_icrs(time, az, el)
+            visible.append(~np.atleast_1d(self.is_occulted(time, ra, dec)))
+
+        return np.array(visible)
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class BackgroundQueryIndex:
+    """
+    Cumulative sums of the observed counts, the model counts and the squared
+    statistical error of a result over the time bins (time x det x echan).
+    The counts in an interval are the difference of two rows of the sums,
+    so every interval query only needs two np.searchsorted calls (O(log N))
+    instead of a boolean mask and a sum over all time bins.
+    An interval contains all bins that start at or after its start and stop
+    at or before its end, like PHAWriter.write_pha.
+    """
+
+    def __init__(self, time_bins, observed_counts, model_counts, stat_err):
+        """
+        :param time_bins: time bins (N, 2), sorted in time
+        :param observed_counts: observed counts (N, N_det, N_echan)
+        :param model_counts: model counts (N, N_det, N_echan)
+        :param stat_err: statistical error of the model counts
+        (N, N_det, N_echan), combined in quadrature
+        """
+        self._time_bins = np.asarray(time_bins, dtype=np.float64)
+
+        assert np.all(np.diff(self._time_bins[:, 0]) >= 0) and np.all(
+            np.diff(self._time_bins[:, 1]) >= 0
+        ), "The time bins have to be sorted"
+
+        self._cum_observed = self._cumsum(observed_counts)
+        self._cum_model = self._cumsum(model_counts)
+        self._cum_stat_err_sq = self._cumsum(np.square(stat_err))
+
+    @staticmethod
+    def _cumsum(array):
+        """
+        Cumulative sum over the time bins with a leading row of zeros
+        """
+        array = np.asarray(array, dtype=np.float64)
+
+        cum = np.zeros((len(array) + 1,) + array.shape[1:])
+        np.cumsum(array, axis=0, out=cum[1:])
+
+        return cum
+
+    def bin_range(self, start, stop):
+        """
+        Index range [first, last) of the time bins in the intervals
+        :param start: start time(s) of the intervals
+        :param stop: stop time(s) of the intervals
+        """
+        first = np.searchsorted(self._time_bins[:, 0], start, side="left")
+        last = np.searchsorted(self._time_bins[:, 1], stop, side="right")
+
+        return first, np.maximum(last, first)
+
+    def query(self, start, stop):
+        """
+        Summed counts of all time bins in one or many intervals
+        :param start: start time(s) of the intervals
+        :param stop: stop time(s) of the intervals
+        :returns: dict with tstart, telapse, observed_counts, model_counts
+        and stat_err (N_det, N_echan), with a leading axis for arrays of
+        intervals
+        """
+        first, last = self.bin_range(start, stop)
+
+        assert np.all(last > first), "No time bin in the interval"
+
+        return {
+            "tstart": self._time_bins[first, 0],
+            "telapse": self._time_bins[last - 1, 1] - self._time_bins[first, 0],
+            "observed_counts": self._cum_observed[last] - self._cum_observed[first],
+            "model_counts": self._cum_model[last] - self._cum_model[first],
+            "stat_err": np.sqrt(
+                np.clip(
+                    self._cum_stat_err_sq[last] - self._cum_stat_err_sq[first],
+                    0,
+                    None,
+                )
+            ),
+        }
+
+    @property
+    def time_bins(self):
+        return self._time_bins
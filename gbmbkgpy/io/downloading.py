@@ -1,4 +1,5 @@
 import os
+import gzip
 import shutil
 from urllib.error import HTTPError
 from astropy.utils.data import download_file
@@ -177,6 +178,63 @@ def download_gbm_file(date, data_type, detector="all"):
     return final_path
 
 
+def download_gbm_tte_file(date, detector, hour):
+    """
+    Download one hour of continuous TTE data. The files are stored
+    uncompressed, so they can be memory mapped.
+
+    :param date: string like '180407'
+    :param detector: string like 'n1', 'n2'
+    :param hour: hour of the day (0-23)
+    :return:
+    """
+
+    year = "20%s" % date[:2]
+    month = date[2:-2]
+    day = date[-2:]
+
+    hour = str(int(hour)).zfill(2)
+
+    data_path = get_path_of_external_data_dir()
+
+    file_path = data_path / "tte" / date
+
+    final_path = (file_path /
+                  f"glg_tte_{detector}_{date}_{hour}z_v00.fit")
+
+    if rank == 0:
+        file_path.mkdir(parents=True, exist_ok=True)
+
+        if not final_path.exists():
+            base_url = (f"https://heasarc.gsfc.nasa.gov/FTP/fermi/data/"
+                        f"gbm/daily/{year}/{month}/{day}/current/"
+                        f"glg_tte_{detector}_{date}_{hour}z_v0")
+
+            path_to_file = None
+            for version in ["0", "1", "2", "3", "4"]:
+                try:
+                    path_to_file = download_file(f"{base_url}{version}.fit.gz")
+                except HTTPError:
+                    pass
+                if path_to_file is not None:
+                    break
+
+            if path_to_file is None:
+                print(f"No version found for the url {base_url}?.fit.gz")
+
+            tmp_path = final_path.with_suffix(".tmp")
+            with gzip.open(path_to_file, "rb") as f_in:
+                with open(tmp_path, "wb") as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+            os.replace(tmp_path, final_path)
+            os.remove(path_to_file)
+
+    if using_mpi:
+        comm.Barrier()
+
+    return final_path
+
+
 def download_trigdata_file(trigger):
     """
     Download trigdata
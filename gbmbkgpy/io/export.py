@@ -1,12 +1,20 @@
 import os
+import collections
+from pathlib import Path
 import numpy as np
-import copy
 import arviz
 
 from gbmbkgpy.utils.pha import SPECTRUM, PHAII
 import h5py
-from gbmbkgpy.utils.progress_bar import progress_bar
-from gbmbkgpy.utils.binner import Rebinner
+from gbmbkgpy.io.ppc import PPCEngine, ArrayPPCSink, QuantilePPCSink
+from gbmbkgpy.io.model_export import ChunkedModelExporter
+from gbmbkgpy.io.background_index import BackgroundQueryIndex
+from gbmbkgpy.utils.statistics.streaming_quantiles import default_band_levels
+from gbmbkgpy.io.posterior_store import (
+    load_posterior_samples_array,
+    multinest_basename,
+)
+from gbmbkgpy.utils.checkpoint import CheckpointStore
 
 NO_REBIN = 1e-9
 
@@ -37,70 +45,68 @@ class DataExporter(object):
         self._best_fit_values = best_fit_values
         self._total_scale_factor = 1.0
 
-        # Create a copy of the response precalculation
-        response_precalculation = model_generator._resp
-
-        # Create a copy of the geomtry precalculation
-        geometry_precalculation = model_generator._geom
+        self._data = model_generator.data
+        self._model = model_generator.model
+        self._time_bins = model_generator.data.time_bins
+        self._saa_mask = model_generator.saa_calc.saa_mask
 
         config = model_generator.config
 
+        self._observed_counts = model_generator.data.counts
+
+        # With save_unbinned the whole file is saved in the unbinned time
+        # bins, like before. The model counts are evaluated in chunks with
+        # the already fitted model, instead of building a second model on
+        # the unbinned time bins.
+        self._unbinned_exporter = None
+
         if (
             config["export"]["save_unbinned"]
-            and config["general"]["min_bin_width"] > 1e-9
+            and config["general"]["min_bin_width"] > NO_REBIN
         ):
+            self._time_bins = self._data.unbinned_time_bins
+            self._observed_counts = self._data.unbinned_counts
 
-            # Create copy of config dictionary
-            config_export = config
+            # the unbinned time bins are all outside of the SAA
+            self._saa_mask = np.ones(len(self._time_bins), dtype=bool)
 
-            config_export["general"]["min_bin_width"] = 1e-9
-
-            # Create a new model generator instance of the same type
-            model_generator_unbinned = type(model_generator)()
-
-            model_generator_unbinned.from_config_dict(
-                config=config_export,
-                response=response_precalculation,
-                geometry=geometry_precalculation,
+            self._unbinned_exporter = ChunkedModelExporter(
+                self._source_counts_at_time_bins, self._time_bins
             )
 
-            model_generator_unbinned.likelihood.set_free_parameters(best_fit_values)
-
-            self._data = model_generator_unbinned.data
-            self._model = model_generator_unbinned.model
-            self._time_bins = model_generator_unbinned.data.time_bins
-            self._saa_mask = model_generator_unbinned.saa_calc.saa_mask
-
-        else:
-
-            self._data = model_generator.data
-            self._model = model_generator.model
-            self._time_bins = model_generator.data.time_bins
-            self._saa_mask = model_generator.saa_calc.saa_mask
-
-        self._ppc_model = None
         self._ppc_time_bins = None
 
     def save_data(self, file_path, result_dir, save_ppc=True):
         """
         Function to save the data needed to create the plots.
         """
-        # Calculate the PPC
-        ppc_counts, ppc_counts_binned = self._ppc_data(result_dir)
+        # Calculate the PPC, or load it from the checkpoint of the fit if it
+        # was already calculated for this posterior before a restart
+        checkpoint = CheckpointStore(Path(multinest_basename(result_dir)).parent)
+
+        def compute_ppc():
+            ppc_bands, ppc_counts_binned = self._ppc_data(result_dir)
+            return {
+                "band_low": ppc_bands[0],
+                "band_high": ppc_bands[1],
+                "counts_binned": ppc_counts_binned,
+                "time_bins": self._ppc_time_bins,
+            }
+
+        ppc = checkpoint.stage(
+            "ppc_bands",
+            [self._time_bins, self._saa_mask,
+             load_posterior_samples_array(result_dir)],
+            compute_ppc,
+        )
+        ppc_counts_binned = ppc["counts_binned"]
+        self._ppc_time_bins = ppc["time_bins"]
 
         if rank == 0:
             print("Save fit result to: {}".format(file_path))
 
-            # Get the model counts
-            model_counts = self._model.get_counts(time_bins=self._time_bins)
-
-            # Get the counts of the individual sources
-            source_list = self.get_counts_of_sources()
-
-            # Get the statistical error from the posterior samples
-            low = np.percentile(ppc_counts, 50 - 50 * 0.68, axis=0)
-            high = np.percentile(ppc_counts, 50 + 50 * 0.68, axis=0)
-            stat_err = high - low
+            # Get the statistical error from the 68% band of the PPC
+            stat_err = ppc["band_high"][0] - ppc["band_low"][0]
 
             with h5py.File(file_path, "w") as f:
 
@@ -124,36 +130,18 @@ class DataExporter(object):
                     data=self._saa_mask,
                     compression="lzf",
                 )
+                f.create_dataset("stat_err", data=stat_err, compression="lzf")
+
+                f.attrs["ppc_band_levels"] = default_band_levels
                 f.create_dataset(
-                    "time_bins_start",
-                    data=self._time_bins[:, 0],
-                    compression="lzf",
-                )
-                f.create_dataset(
-                    "time_bins_stop",
-                    data=self._time_bins[:, 1],
-                    compression="lzf",
+                    "ppc_band_low", data=ppc["band_low"], compression="lzf"
                 )
                 f.create_dataset(
-                    "observed_counts",
-                    data=self._data.counts,
-                    compression="lzf",
+                    "ppc_band_high", data=ppc["band_high"], compression="lzf"
                 )
 
-                f.create_dataset(
-                    "model_counts",
-                    data=model_counts,
-                    compression="lzf",
-                )
-                f.create_dataset("stat_err", data=stat_err, compression="lzf")
-
-                group_sources = f.create_group("sources")
-                for source in source_list:
-                    group_sources.create_dataset(
-                        source["label"],
-                        data=source["data"],
-                        compression="lzf",
-                    )
+                if self._unbinned_exporter is None:
+                    self._save_model_counts(f)
 
                 if save_ppc:
                     f.create_dataset(
@@ -165,40 +153,95 @@ class DataExporter(object):
 
             print("File sucessfully saved!")
 
-    def get_counts_of_sources(self):
+        if self._unbinned_exporter is not None:
+            # same datasets as _save_model_counts, but evaluated and written
+            # in chunks. All ranks evaluate chunks, rank 0 writes them.
+            f = h5py.File(file_path, "a") if rank == 0 else None
+
+            try:
+                self._unbinned_exporter.write(
+                    f, observed_counts=self._observed_counts
+                )
+            finally:
+                if f is not None:
+                    f.close()
+
+    def _save_model_counts(self, f):
+        """
+        Save the time bins, the observed counts, the model counts and the
+        counts of the individual sources
+        """
+        # Get the model counts
+        model_counts = self._model.get_counts(time_bins=self._time_bins)
+
+        # Get the counts of the individual sources
+        source_list = self.get_counts_of_sources()
+
+        f.create_dataset(
+            "time_bins_start",
+            data=self._time_bins[:, 0],
+            compression="lzf",
+        )
+        f.create_dataset(
+            "time_bins_stop",
+            data=self._time_bins[:, 1],
+            compression="lzf",
+        )
+        f.create_dataset(
+            "observed_counts",
+            data=self._observed_counts,
+            compression="lzf",
+        )
+
+        f.create_dataset(
+            "model_counts",
+            data=model_counts,
+            compression="lzf",
+        )
+
+        group_sources = f.create_group("sources")
+        for source in source_list:
+            group_sources.create_dataset(
+                source["label"],
+                data=source["data"],
+                compression="lzf",
+            )
+
+    def get_counts_of_sources(self, time_bins=None, saa_mask=None,
+                              skip_empty=True):
         """
         Builds a list of the different model sources.
         Each source is a dict containing the label of the source, the data, and the plotting color
+        :param time_bins: time bins, default are the time bins of the export
+        :param saa_mask: saa mask of the time bins
+        :param skip_empty: skip continuum and SAA sources without counts
         :return:
         """
+        if time_bins is None:
+            time_bins = self._time_bins
+            saa_mask = self._saa_mask
 
         source_list = []
         i_index = 0
 
         for i, source_name in enumerate(self._model.continuum_sources):
-            data = self._model.get_continuum_counts(
-                i, self._data.time_bins, self._saa_mask
-            )
-            if np.sum(data) != 0:
+            data = self._model.get_continuum_counts(i, time_bins, saa_mask)
+            if np.sum(data) != 0 or not skip_empty:
                 source_list.append({"label": source_name, "data": data})
                 i_index += 1
 
         for i, source_name in enumerate(self._model._global_sources):
-            data = self._model.get_global_counts(
-                i, self._data.time_bins, self._saa_mask
-            )
+            data = self._model.get_global_counts(i, time_bins, saa_mask)
             source_list.append({"label": source_name, "data": data})
             i_index += 1
 
         for i, source_name in enumerate(self._model.fit_spectrum_sources):
-            data = self._model.get_fit_spectrum_counts(
-                i, self._data.time_bins, self._saa_mask
-            )
+            data = self._model.get_fit_spectrum_counts(i, time_bins, saa_mask)
             source_list.append({"label": source_name, "data": data})
             i_index += 1
 
-        saa_data = self._model.get_saa_counts(self._data.time_bins, self._saa_mask)
-        if np.sum(saa_data) != 0:
+        saa_data = self._model.get_saa_counts(time_bins, saa_mask)
+        if np.sum(saa_data) != 0 or not skip_empty:
             source_list.append({"label": "SAA_decays", "data": saa_data})
             i_index += 1
 
@@ -210,141 +253,69 @@ class DataExporter(object):
 
         return source_list
 
-    def _ppc_data(self, result_dir):
+    def _source_counts_at_time_bins(self, time_bins):
         """
-        Add ppc plot
-        :param result_dir: path to result directory
-        :param echan: Which echan
+        Counts of all sources in a chunk of the unbinned time bins, which
+        are all outside of the SAA
         """
-
-        data_rebinner = Rebinner(self._time_bins, min_bin_width=60, mask=self._saa_mask)
-
-        self._ppc_time_bins = data_rebinner.time_rebinned
-
-        import pymultinest
-
-        analyzer = pymultinest.analyse.Analyzer(1, result_dir)
-        mn_posteriour_samples = analyzer.get_equal_weighted_posterior()[:, :-1]
-
-        counts = []
-        counts_binned = []
-
-        # Make a mask with 500 random True to choose N_samples random samples,
-        # if multinest returns less then 500 posterior samples the use the maximal possible number
-        N_samples = (
-            500 if len(mn_posteriour_samples) > 500 else len(mn_posteriour_samples)
+        source_list = self.get_counts_of_sources(
+            time_bins, np.ones(len(time_bins), dtype=bool), skip_empty=False
+        )
+        return collections.OrderedDict(
+            (source["label"], source["data"]) for source in source_list
         )
 
-        random_mask = np.zeros(len(mn_posteriour_samples), dtype=int)
-        random_mask[:N_samples] = 1
-        np.random.shuffle(random_mask)
-        random_mask = random_mask.astype(bool)
-
-        # For these N_samples random samples calculate the corresponding rates for all time bins
-        # with the parameters of this sample
-        if using_mpi:
-
-            points_per_rank = float(N_samples) / float(size)
-            points_lower_index = int(np.floor(points_per_rank * rank))
-            points_upper_index = int(np.floor(points_per_rank * (rank + 1)))
-
-            hidden = False if rank == 0 else True
-
-            with progress_bar(
-                len(
-                    mn_posteriour_samples[random_mask][
-                        points_lower_index:points_upper_index
-                    ]
-                ),
-                title="Calculating PPC",
-                hidden=hidden,
-            ) as p:
-
-                for i, sample in enumerate(
-                    mn_posteriour_samples[random_mask][
-                        points_lower_index:points_upper_index
-                    ]
-                ):
-                    synth_counts = self.get_synthetic_data(sample).astype(np.uint32)
-                    counts.append(synth_counts)
-
-                    rebinned_counts = data_rebinner.rebin(synth_counts)[0]
-
-                    counts_binned.append(rebinned_counts)
-
-                    p.increase()
-
-            # Now combine and brodcast the results in small packages,
-            # because mpi can't handle arrays that big
-            ppc_counts = None
-            ppc_counts_binned = None
-
-            with progress_bar(len(counts), title="Gather PCC", hidden=hidden) as p:
-                for i, cnts in enumerate(counts):
-
-                    counts_g = comm.gather(cnts, root=0)
-
-                    counts_binned_g = comm.gather(counts_binned[i], root=0)
-
-                    if rank == 0:
-
-                        counts_g = np.array(counts_g)
-
-                        counts_binned_g = np.array(counts_binned_g)
-
-                        if ppc_counts is None:
-
-                            ppc_counts = counts_g
-
-                            ppc_counts_binned = counts_binned_g
-
-                        else:
-
-                            ppc_counts = np.append(ppc_counts, counts_g, axis=0)
-
-                            ppc_counts_binned = np.append(
-                                ppc_counts_binned, counts_binned_g, axis=0
-                            )
-
-                    p.increase()
-
-        else:
-            with progress_bar(
-                len(mn_posteriour_samples[random_mask]),
-                title="Calculation PPC",
-            ) as p:
+    def _ppc_data(self, result_dir, n_samples=500, seed=None):
+        """
+        PPC bands in every time bin and the rebinned PPC counts
+        :param result_dir: path to result directory
+        :param n_samples: max number of posterior samples
+        :param seed: seed of the Poisson draws and the sample selection
+        :returns: (low, high) arrays (N_levels, N_time_bins, N_echan) of the
+        default_band_levels, rebinned ppc counts (N_samples, N_bins, N_echan)
+        """
+        # every block of samples is evaluated with one batched call of
+        # get_model_counts_batch, the model parameters are not changed
+        engine = PPCEngine.from_model(
+            self._model,
+            time_bins=self._time_bins,
+            min_bin_width=60,
+            rebin_mask=self._saa_mask,
+            seed=seed,
+        )
 
-                for i, sample in enumerate(mn_posteriour_samples[random_mask]):
-                    synth_counts = self.get_synthetic_data(sample)
-                    counts.append(synth_counts)
+        self._ppc_time_bins = engine.ppc_time_bins
 
-                    rebinned_counts = data_rebinner.rebin(synth_counts)[0]
+        quantile_sink = QuantilePPCSink()
+        binned_sink = ArrayPPCSink(binned_only=True)
 
-                    counts_binned.append(rebinned_counts)
+        engine.run(
+            load_posterior_samples_array(result_dir),
+            [quantile_sink, binned_sink],
+            n_samples=n_samples,
+        )
 
-                    p.increase()
+        if rank != 0:
+            return (None, None), None
 
-            ppc_counts = np.array(counts)
-            ppc_counts_binned = np.array(counts_binned)
+        bands = quantile_sink.bands(default_band_levels)
+        band_low = np.array([bands[level][0] for level in default_band_levels])
+        band_high = np.array([bands[level][1] for level in default_band_levels])
 
-        return ppc_counts, ppc_counts_binned
+        return (band_low, band_high), binned_sink.counts_binned
 
     def get_synthetic_data(self, synth_parameters):
         """
         Creates a ContinousData object with synthetic data based on the total counts from the synth_model
-        If no synth_model is passed it makes a deepcopy of the existing model
-        :param synth_parameters:
+        The parameters of the model are not changed
+        :param synth_parameters: parameter values in the order of
+        model.parameter
         :return:
         """
-        if self._ppc_model is None:
-
-            self._ppc_model = copy.deepcopy(self._model)
-
-        for i, parameter in enumerate(self._ppc_model.free_parameters.values()):
-            parameter.value = synth_parameters[i]
-
         synth_counts = np.random.poisson(
-            self._ppc_model.get_counts(self._data.time_bins)
+            self._model.get_model_counts_batch(
+                synth_parameters, time_bins=self._time_bins
+            )[0]
         )
 
         return synth_counts
@@ -761,6 +732,7 @@ class PHAWriter(object):
         self._model_counts = model_counts
         self._stat_err = stat_err
         self._det_echan_loaded = det_echan_loaded
+        self._query_index = None
 
     @classmethod
     def from_result_files(cls, result_file_list):
@@ -1056,6 +1028,27 @@ class PHAWriter(object):
 
             f.create_dataset("stat_err", data=self._stat_err, compression="lzf")
 
+    @property
+    def query_index(self):
+        """
+        Prefix sum index for the background queries of intervals, it is
+        built once with the first query
+        """
+        if self._query_index is None:
+            self._query_index = BackgroundQueryIndex(
+                self._time_bins,
+                self._observed_counts,
+                self._model_counts,
+                self._stat_err,
+            )
+        return self._query_index
+
+    def _default_file_name(self):
+        if self._trigger is None:
+            return "_".join(self._dates)
+
+        return self._trigger
+
     def write_pha(
         self,
         output_dir,
@@ -1068,105 +1061,145 @@ class PHAWriter(object):
         """
         Creates saves a background file for each detector
         """
+        self.write_pha_batch(
+            output_dir,
+            [active_time_start],
+            [active_time_end],
+            trigger_times=None if trigger_time is None else [trigger_time],
+            file_names=None if file_name is None else [file_name],
+            overwrite=overwrite,
+        )
 
-        if trigger_time is not None:
-            trigtime = trigger_time
-        else:
-            trigtime = self._trigger_time
-
-        time_bins = self._time_bins - trigtime
+    def write_pha_batch(
+        self,
+        output_dir,
+        active_time_starts,
+        active_time_ends,
+        trigger_times=None,
+        file_names=None,
+        overwrite=False,
+    ):
+        """
+        Saves the observed and background spectra of many intervals (e.g.
+        of many triggers) for each detector. All intervals are answered with
+        one vectorized query of the prefix sum index.
+        :param active_time_starts: start times of the intervals relative to
+        the trigger times
+        :param active_time_ends: end times of the intervals relative to the
+        trigger times
+        :param trigger_times: trigger time of every interval, default is the
+        trigger time of the result
+        :param file_names: file name prefix of every interval, default is the
+        trigger or the dates of the result
+        """
+        active_time_starts = np.atleast_1d(active_time_starts)
+        active_time_ends = np.atleast_1d(active_time_ends)
 
-        idx_min_time = time_bins[:, 0] >= active_time_start
-        idx_max_time = time_bins[:, 1] <= active_time_end
-        idx_valid_bin = idx_min_time * idx_max_time
+        if trigger_times is None:
+            trigger_times = np.full(len(active_time_starts), self._trigger_time)
 
-        for det in self._detectors:
-            det_idx = valid_det_names.index(det)
+        trigger_times = np.atleast_1d(trigger_times)
 
-            tstart = time_bins[idx_valid_bin][0, 0]
+        if file_names is None:
+            file_names = [self._default_file_name()] * len(active_time_starts)
 
-            telapse = (
-                time_bins[idx_valid_bin][-1, 1] - time_bins[idx_valid_bin][0, 0],
-            )
+        assert len(active_time_ends) == len(active_time_starts)
+        assert len(trigger_times) == len(active_time_starts)
+        assert len(file_names) == len(active_time_starts)
 
-            observed_counts = np.sum(
-                self._observed_counts[idx_valid_bin, det_idx, :], axis=0
-            )
+        spectra = self.query_index.query(
+            trigger_times + active_time_starts, trigger_times + active_time_ends
+        )
 
-            observed_rate = observed_counts / telapse
+        for i, file_name in enumerate(file_names):
 
-            model_counts = np.sum(self._model_counts[idx_valid_bin, det_idx, :], axis=0)
+            tstart = spectra["tstart"][i] - trigger_times[i]
+            telapse = spectra["telapse"][i]
 
-            model_rate = model_counts / telapse
+            for det in self._detectors:
+                det_idx = valid_det_names.index(det)
 
-            stat_err = (
-                np.sqrt(
-                    np.sum(np.square(self._stat_err[idx_valid_bin, det_idx, :]), axis=0)
+                self._write_det_pha(
+                    output_dir,
+                    file_name,
+                    det,
+                    tstart,
+                    telapse,
+                    spectra["observed_counts"][i, det_idx],
+                    spectra["model_counts"][i, det_idx],
+                    spectra["stat_err"][i, det_idx],
+                    overwrite,
                 )
-                / telapse
-            )
-
-            # Calculate the dead time of the detector:
-            # Each event in the echans 0-6 gives a dead time of 2.6 μs
-            # Each event in the over flow channel 7 gives a dead time of 10 μs
-            dead_time = (
-                np.sum(observed_counts[0:7]) * 2.6 * 1e-6 + observed_counts[7] * 1e-5
-            )
 
-            # Write observed spectrum to PHA file
-            observed_spectrum = PHAII(
-                instrument_name="GBM_{}".format(det_name_lookup[det]),
-                telescope_name="Fermi",
-                tstart=tstart,
-                telapse=telapse,
-                channel=self._echans,
-                rate=observed_rate,
-                quality=np.zeros_like(observed_rate, dtype=int),
-                grouping=np.ones_like(self._echans),
-                exposure=telapse - dead_time,
-                backscale=1.0,
-                respfile=None,
-                ancrfile=None,
-                back_file=None,
-                sys_err=np.zeros_like(observed_rate),
-                stat_err=None,
-                is_poisson=True,
-            )
-
-            # Write background spectrum to PHA file
-            background_spectrum = PHAII(
-                instrument_name="GBM_{}".format(det_name_lookup[det]),
-                telescope_name="Fermi",
-                tstart=tstart,
-                telapse=telapse,
-                channel=self._echans,
-                rate=model_rate,
-                quality=np.zeros_like(model_rate, dtype=int),
-                grouping=np.ones_like(self._echans),
-                exposure=telapse - dead_time,
-                backscale=1.0,
-                respfile=None,
-                ancrfile=None,
-                back_file=None,
-                sys_err=np.zeros_like(model_rate),
-                stat_err=stat_err,
-                is_poisson=False,
-            )
+    def _write_det_pha(
+        self,
+        output_dir,
+        file_name,
+        det,
+        tstart,
+        telapse,
+        observed_counts,
+        model_counts,
+        stat_err,
+        overwrite,
+    ):
+        observed_rate = observed_counts / telapse
 
-            if file_name is None:
+        model_rate = model_counts / telapse
 
-                if self._trigger is None:
+        stat_err_rate = stat_err / telapse
 
-                    file_name = "_".join(self._dates)
+        # Calculate the dead time of the detector:
+        # Each event in the echans 0-6 gives a dead time of 2.6 μs
+        # Each event in the over flow channel 7 gives a dead time of 10 μs
+        dead_time = (
+            np.sum(observed_counts[0:7]) * 2.6 * 1e-6 + observed_counts[7] * 1e-5
+        )
 
-                else:
+        # Write observed spectrum to PHA file
+        observed_spectrum = PHAII(
+            instrument_name="GBM_{}".format(det_name_lookup[det]),
+            telescope_name="Fermi",
+            tstart=tstart,
+            telapse=telapse,
+            channel=self._echans,
+            rate=observed_rate,
+            quality=np.zeros_like(observed_rate, dtype=int),
+            grouping=np.ones_like(self._echans),
+            exposure=telapse - dead_time,
+            backscale=1.0,
+            respfile=None,
+            ancrfile=None,
+            back_file=None,
+            sys_err=np.zeros_like(observed_rate),
+            stat_err=None,
+            is_poisson=True,
+        )
 
-                    file_name = self._trigger
+        # Write background spectrum to PHA file
+        background_spectrum = PHAII(
+            instrument_name="GBM_{}".format(det_name_lookup[det]),
+            telescope_name="Fermi",
+            tstart=tstart,
+            telapse=telapse,
+            channel=self._echans,
+            rate=model_rate,
+            quality=np.zeros_like(model_rate, dtype=int),
+            grouping=np.ones_like(self._echans),
+            exposure=telapse - dead_time,
+            backscale=1.0,
+            respfile=None,
+            ancrfile=None,
+            back_file=None,
+            sys_err=np.zeros_like(model_rate),
+            stat_err=stat_err_rate,
+            is_poisson=False,
+        )
 
-            obs_file_path = os.path.join(output_dir, "{}_{}.pha".format(file_name, det))
-            bkg_file_path = os.path.join(
-                output_dir, "{}_{}_bak.pha".format(file_name, det)
-            )
+        obs_file_path = os.path.join(output_dir, "{}_{}.pha".format(file_name, det))
+        bkg_file_path = os.path.join(
+            output_dir, "{}_{}_bak.pha".format(file_name, det)
+        )
 
-            observed_spectrum.writeto(obs_file_path, overwrite=overwrite)
-            background_spectrum.writeto(bkg_file_path, overwrite=overwrite)
+        observed_spectrum.writeto(obs_file_path, overwrite=overwrite)
+        background_spectrum.writeto(bkg_file_path, overwrite=overwrite)
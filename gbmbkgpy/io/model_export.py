@@ -0,0 +1,195 @@
+import collections
+
+import h5py
+import numpy as np
+
+from gbmbkgpy.utils.mpi import check_mpi
+
+using_mpi, rank, size, comm = check_mpi()
+
+
+class ChunkedModelExporter:
+    """
+    Export the counts of a fitted model on a fine time grid (e.g. the
+    unbinned time bins of the data) without building a new model. The model
+    is evaluated lazily in blocks of time bins with the interpolations of
+    the sources and every block is written directly into chunked and
+    compressed HDF5 datasets, so the memory only depends on the chunk size.
+    The total counts and the counts of every source are written in the same
+    pass. With MPI the ranks evaluate the chunks in turns and rank 0 writes.
+    """
+
+    def __init__(self, source_counts, time_bins, chunk_size=2 ** 14,
+                 compression="lzf"):
+        """
+        :param source_counts: function(time_bins) that returns an
+        OrderedDict with the counts (N_time_bins, N_echan) of every source
+        :param time_bins: all time bins of the export (N, 2)
+        :param chunk_size: number of time bins per chunk
+        :param compression: compression of the HDF5 datasets
+        """
+        self._source_counts = source_counts
+        self._time_bins = np.asarray(time_bins)
+        self._chunk_size = int(chunk_size)
+        self._compression = compression
+
+    @classmethod
+    def from_model(cls, model, time_bins=None, **kwargs):
+        """
+        Exporter of a fitted ModelDet
+        :param time_bins: time bins of the export, default are the unbinned
+        time bins of the data
+        """
+        if time_bins is None:
+            time_bins = model.data.unbinned_time_bins
+
+        def source_counts(chunk_time_bins):
+            return collections.OrderedDict(
+                (source.name, source.get_counts(time_bins=chunk_time_bins))
+                for source in model.sources
+            )
+
+        return cls(source_counts, time_bins, **kwargs)
+
+    def _evaluate_chunk(self, start):
+        time_bins = self._time_bins[start:start + self._chunk_size]
+
+        source_counts = self._source_counts(time_bins)
+
+        total = None
+        for counts in source_counts.values():
+            total = counts.copy() if total is None else total + counts
+
+        return start, total, source_counts
+
+    def iter_chunks(self):
+        """
+        Lazily evaluate the model chunk by chunk
+        :returns: generator of (first index, time bins, total counts, dict
+        with the counts of every source) of every chunk
+        """
+        for start in range(0, len(self._time_bins), self._chunk_size):
+            start, total, source_counts = self._evaluate_chunk(start)
+
+            yield (start, self._time_bins[start:start + self._chunk_size],
+                   total, source_counts)
+
+    def _create_dataset(self, group, name, shape, dtype=np.float64):
+        return group.create_dataset(
+            name,
+            shape=shape,
+            dtype=dtype,
+            chunks=(min(self._chunk_size, shape[0]),) + shape[1:],
+            compression=self._compression,
+        )
+
+    def write(self, group, observed_counts=None):
+        """
+        Write the time bins, the model counts and the counts of every
+        source into the group. Has to be called by all ranks, only rank 0
+        needs an open group.
+        :param group: h5py File or Group (only used on rank 0)
+        :param observed_counts: observed counts in the same time bins, also
+        written in chunks
+        """
+        num_bins = len(self._time_bins)
+        starts = list(range(0, num_bins, self._chunk_size))
+
+        datasets = None
+
+        if rank == 0:
+            for name, column in [("time_bins_start", 0), ("time_bins_stop", 1)]:
+                dataset = self._create_dataset(group, name, (num_bins,))
+                dataset[:] = self._time_bins[:, column]
+
+        for first in range(0, len(starts), size):
+            index = first + rank
+            chunk = self._evaluate_chunk(starts[index]) if index < len(starts) else None
+
+            if using_mpi:
+                chunks = comm.gather(chunk, root=0)
+            else:
+                chunks = [chunk]
+
+            if rank != 0:
+                continue
+
+            for chunk in chunks:
+                if chunk is None:
+                    continue
+
+                start, total, source_counts = chunk
+                stop = start + len(total)
+
+                if datasets is None:
+                    shape = (num_bins,) + total.shape[1:]
+
+                    datasets = {
+                        "model_counts": self._create_dataset(
+                            group, "model_counts", shape
+                        )
+                    }
+
+                    group_sources = group.create_group("sources")
+                    for name in source_counts.keys():
+                        datasets[name] = self._create_dataset(
+                            group_sources, name, shape
+                        )
+
+                datasets["model_counts"][start:stop] = total
+
+                for name, counts in source_counts.items():
+                    datasets[name][start:stop] = counts
+
+        if rank == 0 and observed_counts is not None:
+            dataset = self._create_dataset(
+                group, "observed_counts", observed_counts.shape,
+                dtype=observed_counts.dtype
+            )
+            for start in starts:
+                dataset[start:start + self._chunk_size] = \
+                    observed_counts[start:start + self._chunk_size]
+
+    @property
+    def time_bins(self):
+        return self._time_bins
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+
+def save_model_export(file_path, model, chunk_size=2 ** 14,
+                      compression="lzf"):
+    """
+    Save the counts of a fitted ModelDet or of all detectors of a
+    ModelCombine (one group per detector) in the unbinned time bins of the
+    data, together with the observed counts and the counts of every source
+    :param file_path: path of the HDF5 file
+    :param model: fitted ModelDet or ModelCombine
+    """
+    model_dets = getattr(model, "model_dets", [model])
+
+    f = h5py.File(file_path, "w") if rank == 0 else None
+
+    try:
+        for model_det in model_dets:
+            group = None
+            if rank == 0:
+                group = f if len(model_dets) == 1 else f.create_group(
+                    model_det.data.name
+                )
+                group.attrs["param_names"] = list(model.parameter.keys())
+                group.attrs["best_fit_values"] = [
+                    param.value for param in model.parameter.values()
+                ]
+
+            exporter = ChunkedModelExporter.from_model(
+                model_det, chunk_size=chunk_size, compression=compression
+            )
+            exporter.write(
+                group, observed_counts=model_det.data.unbinned_counts
+            )
+    finally:
+        if f is not None:
+            f.close()
@@ -2,6 +2,7 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import numpy as np
 from gbmbkgpy.utils.binner import Rebinner
+from gbmbkgpy.io.posterior_store import load_posterior_samples_array
 from gbmbkgpy.utils.progress_bar import progress_bar
 
 from gbmbkgpy.io.plotting.step_plots import step_plot
@@ -345,16 +346,14 @@ class ResidualPlot(object):
         q_levels.sort(reverse=True)
 
         if rebinned_ppc_rates is None or rebinned_time_bin_mean is None:
-            # Get Analyze object from results file of Multinest Fit
-            import pymultinest
-
-            analyzer = pymultinest.analyse.Analyzer(n_params, result_dir)
+            # Get the posterior samples of the Multinest Fit
+            posterior_samples = load_posterior_samples_array(result_dir, n_params)
 
             # Make a mask with 300 random True to choose 300 random samples
             N_samples = 200
             rates = []
             a = np.zeros(
-                len(analyzer.get_equal_weighted_posterior()[:, :-1]), dtype=int
+                len(posterior_samples), dtype=int
             )
             a[:N_samples] = 1
             np.random.shuffle(a)
@@ -369,7 +368,7 @@ class ResidualPlot(object):
                 if rank == 0:
                     with progress_bar(
                         len(
-                            analyzer.get_equal_weighted_posterior()[:, :-1][a][
+                            posterior_samples[a][
                                 points_lower_index:points_upper_index
                             ]
                         ),
@@ -377,7 +376,7 @@ class ResidualPlot(object):
                     ) as p:
 
                         for i, sample in enumerate(
-                            analyzer.get_equal_weighted_posterior()[:, :-1][a][
+                            posterior_samples[a][
                                 points_lower_index:points_upper_index
                             ]
                         ):
@@ -397,7 +396,7 @@ class ResidualPlot(object):
 
                 else:
                     for i, sample in enumerate(
-                        analyzer.get_equal_weighted_posterior()[:, :-1][a][
+                        posterior_samples[a][
                             points_lower_index:points_upper_index
                         ]
                     ):
@@ -431,7 +430,7 @@ class ResidualPlot(object):
                         )
             else:
                 for i, sample in enumerate(
-                    analyzer.get_equal_weighted_posterior()[:, :-1][a]
+                    posterior_samples[a]
                 ):
                     synth_data = plotter.get_synthetic_data(sample, model)
                     this_rebinner = Rebinner(synth_data.time_bins - time_ref, bin_width)
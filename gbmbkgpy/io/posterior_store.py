@@ -0,0 +1,154 @@
+import os
+import collections
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+POSTERIOR_STORE_SUFFIX = "posterior.h5"
+
+
+def posterior_store_path(result_dir):
+    """
+    Path of the posterior store of a MultiNest fit
+    :param result_dir: output directory of the fit or the MultiNest
+    outputfiles_basename (e.g. ".../fit_")
+    """
+    if Path(result_dir).is_dir():
+        return Path(result_dir) / f"fit_{POSTERIOR_STORE_SUFFIX}"
+
+    return Path(f"{result_dir}{POSTERIOR_STORE_SUFFIX}")
+
+
+def multinest_basename(result_dir):
+    """
+    MultiNest outputfiles_basename of a fit
+    :param result_dir: output directory of the fit or the basename
+    """
+    if Path(result_dir).is_dir():
+        return str(Path(result_dir).absolute() / "fit_")
+
+    return str(result_dir)
+
+
+def write_posterior_store(path, param_names, samples, log_like, log_prior):
+    """
+    Save the posterior of a fit in one HDF5 file. The arrays are stored
+    contiguous and uncompressed, so they can be memory mapped by the
+    PosteriorStore.
+    :param param_names: names of the parameters
+    :param samples: equally weighted posterior samples (N_samples, N_params)
+    :param log_like: log likelihood of every sample
+    :param log_prior: log prior of every sample
+    """
+    path = Path(path)
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+
+    with h5py.File(tmp_path, "w") as f:
+        f.attrs["param_names"] = [str(name) for name in param_names]
+
+        f.create_dataset("samples", data=np.asarray(samples, dtype=np.float64))
+        f.create_dataset("log_like", data=np.asarray(log_like, dtype=np.float64))
+        f.create_dataset("log_prior", data=np.asarray(log_prior, dtype=np.float64))
+
+    os.replace(tmp_path, path)
+
+
+class PosteriorStore:
+    """
+    Memory mapped posterior samples of a fit, written with
+    write_posterior_store
+    """
+
+    def __init__(self, path):
+        self._path = Path(path)
+
+        self._arrays = {}
+
+        with h5py.File(self._path, "r") as f:
+            self._param_names = [str(name) for name in f.attrs["param_names"]]
+
+            for key in ["samples", "log_like", "log_prior"]:
+                dataset = f[key]
+                offset = dataset.id.get_offset()
+
+                # empty datasets have no offset
+                if offset is None:
+                    self._arrays[key] = np.empty(dataset.shape, dtype=dataset.dtype)
+                else:
+                    self._arrays[key] = np.memmap(
+                        self._path,
+                        mode="r",
+                        dtype=dataset.dtype,
+                        shape=dataset.shape,
+                        offset=offset,
+                    )
+
+    @classmethod
+    def from_result_dir(cls, result_dir):
+        """
+        Posterior store of a MultiNest fit, None if the fit has no store
+        :param result_dir: output directory of the fit or the basename
+        """
+        path = posterior_store_path(result_dir)
+
+        if not path.exists():
+            return None
+
+        return cls(path)
+
+    def samples_dict(self):
+        """
+        :returns: OrderedDict with the samples of every parameter
+        """
+        return collections.OrderedDict(
+            (name, self.samples[:, i]) for i, name in enumerate(self._param_names)
+        )
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def param_names(self):
+        return self._param_names
+
+    @property
+    def samples(self):
+        return self._arrays["samples"]
+
+    @property
+    def log_like(self):
+        return self._arrays["log_like"]
+
+    @property
+    def log_prior(self):
+        return self._arrays["log_prior"]
+
+    @property
+    def log_probability(self):
+        return self.log_like + self.log_prior
+
+    def __len__(self):
+        return len(self.samples)
+
+
+def load_posterior_samples_array(result_dir, n_params=1):
+    """
+    Equally weighted posterior samples of a MultiNest fit. Uses the
+    posterior store if the fit has one, otherwise the MultiNest text output
+    is parsed.
+    :param result_dir: output directory of the fit or the basename
+    :returns: samples array (N_samples, N_params)
+    """
+    store = PosteriorStore.from_result_dir(result_dir)
+
+    if store is not None:
+        return store.samples
+
+    import pymultinest
+
+    analyzer = pymultinest.analyse.Analyzer(
+        n_params, outputfiles_basename=multinest_basename(result_dir)
+    )
+    return analyzer.get_equal_weighted_posterior()[:, :-1]
@@ -0,0 +1,377 @@
+import numpy as np
+
+from gbmbkgpy.utils.binner import reduceat_starts
+from gbmbkgpy.utils.mpi import check_mpi
+from gbmbkgpy.utils.statistics.streaming_quantiles import (
+    StreamingQuantiles,
+    default_band_levels,
+)
+
+using_mpi, rank, size, comm = check_mpi()
+
+
+def select_posterior_samples(samples, n_samples, rng):
+    """
+    Random subset of the posterior samples (without replacement), in the
+    order of the posterior
+    :param samples: posterior samples (N, N_params)
+    :param n_samples: max number of samples
+    :param rng: numpy Generator
+    """
+    if len(samples) <= n_samples:
+        return np.asarray(samples)
+
+    idx = np.sort(rng.choice(len(samples), n_samples, replace=False))
+    return np.asarray(samples)[idx]
+
+
+class ArrayPPCSink:
+    """
+    Collect the PPC counts of all samples in memory. The memory grows with
+    the number of samples, use the HDF5PPCSink for long days.
+    """
+
+    def __init__(self, binned_only=False):
+        """
+        :param binned_only: only collect the rebinned counts
+        """
+        self.needs_full_resolution = not binned_only
+        self.mergeable = False
+        self._counts = None
+        self._counts_binned = None
+
+    def start(self, n_samples, expected_counts, expected_counts_binned):
+        if self.needs_full_resolution:
+            self._counts = np.zeros((n_samples,) + expected_counts.shape,
+                                    dtype=np.uint32)
+        self._counts_binned = np.zeros(
+            (n_samples,) + expected_counts_binned.shape, dtype=np.uint32
+        )
+
+    def add(self, offset, counts, counts_binned):
+        stop = offset + len(counts_binned)
+        if self.needs_full_resolution:
+            self._counts[offset:stop] = counts
+        self._counts_binned[offset:stop] = counts_binned
+
+    @property
+    def counts(self):
+        return self._counts
+
+    @property
+    def counts_binned(self):
+        return self._counts_binned
+
+
+class HDF5PPCSink:
+    """
+    Stream the PPC counts into chunked and compressed HDF5 datasets, one
+    chunk per sample, so only one block of samples is in memory at a time
+    """
+
+    def __init__(self, group, name="ppc_counts", full_resolution=False,
+                 compression="lzf"):
+        """
+        :param group: open h5py File or Group
+        :param name: name of the dataset of the rebinned counts, the full
+        resolution counts are saved in "{name}_unbinned"
+        :param full_resolution: also save the counts in the original bins
+        """
+        self._group = group
+        self._name = name
+        self._compression = compression
+        self.needs_full_resolution = full_resolution
+        self.mergeable = False
+
+    def _create(self, name, n_samples, shape):
+        return self._group.create_dataset(
+            name,
+            shape=(n_samples,) + shape,
+            dtype=np.uint32,
+            chunks=(1,) + shape,
+            compression=self._compression,
+        )
+
+    def start(self, n_samples, expected_counts, expected_counts_binned):
+        self._binned = self._create(self._name, n_samples,
+                                    expected_counts_binned.shape)
+
+        if self.needs_full_resolution:
+            self._unbinned = self._create(f"{self._name}_unbinned",
+                                          n_samples, expected_counts.shape)
+
+    def add(self, offset, counts, counts_binned):
+        stop = offset + len(counts_binned)
+        self._binned[offset:stop] = counts_binned
+
+        if self.needs_full_resolution:
+            self._unbinned[offset:stop] = counts
+
+
+class QuantilePPCSink:
+    """
+    Streaming quantiles of the PPC counts in every bin (see
+    StreamingQuantiles), for PPC bands over all time bins with bounded
+    memory. Under MPI every rank fills its own estimator and they are
+    merged with one reduction at the end.
+    """
+
+    def __init__(self, binned=False, num_bins=64, num_sigma=6.0,
+                 rel_margin=0.05):
+        """
+        :param binned: use the rebinned counts instead of the counts in
+        the original time bins
+        :param num_bins: number of histogram bins per element
+        :param num_sigma: the grids cover num_sigma Poisson sigmas around
+        the model counts of the first sample
+        :param rel_margin: additional range of the grids for the spread of
+        the posterior, relative to the model counts
+        """
+        self.needs_full_resolution = not binned
+        self.mergeable = True
+        self._binned = binned
+        self._grid_kwargs = {
+            "num_bins": num_bins,
+            "num_sigma": num_sigma,
+            "rel_margin": rel_margin,
+        }
+        self._estimator = None
+
+    def start(self, n_samples, expected_counts, expected_counts_binned):
+        expected = expected_counts_binned if self._binned else expected_counts
+
+        self._estimator = StreamingQuantiles.from_expected_counts(
+            expected,
+            dtype=np.uint16 if n_samples < 2 ** 16 else np.uint32,
+            **self._grid_kwargs
+        )
+
+    def add(self, offset, counts, counts_binned):
+        self._estimator.add(counts_binned if self._binned else counts)
+
+    def reduce(self, comm):
+        self._estimator.reduce(comm, root=0)
+
+    def bands(self, levels=default_band_levels):
+        """
+        :returns: dict with the (low, high) counts of every level
+        """
+        return self._estimator.bands(levels)
+
+    @property
+    def estimator(self):
+        return self._estimator
+
+
+class PPCEngine:
+    """
+    Posterior predictive checks of a fitted model. The model counts are
+    evaluated for blocks of posterior samples at once, the Poisson noise is
+    drawn for the whole block with a seeded generator and the block is
+    rebinned with np.add.reduceat. Every block is passed to the sinks
+    (e.g. HDF5PPCSink) and then dropped, so the peak memory only depends
+    on the block size. With MPI every rank processes a part of the blocks.
+    If all sinks are mergeable (e.g. QuantilePPCSink) every rank fills its
+    own sinks and they are reduced at the end, otherwise rank 0 receives
+    the blocks with one buffer based Gatherv per round. The result does not
+    depend on the number of ranks, every block has its own random stream.
+    """
+
+    def __init__(self, model_counts, time_bins, min_bin_width=60,
+                 rebin_mask=None, block_size=None, max_block_memory=2 ** 28,
+                 seed=None, max_gap=1.0):
+        """
+        :param model_counts: function that returns the model counts
+        (N_samples, N_time_bins, N_echan) for a block of samples
+        :param time_bins: time bins of the model counts
+        :param min_bin_width: min bin width of the rebinned PPC counts
+        :param rebin_mask: only the bins in this mask are rebinned (e.g.
+        the SAA mask), default are all bins
+        :param block_size: number of samples per block, default is the
+        largest block below max_block_memory
+        :param max_block_memory: max memory of the arrays of one block in
+        bytes
+        :param seed: seed of the random numbers
+        :param max_gap: max gap between two bins that are combined in the
+        rebinning
+        """
+        self._model_counts = model_counts
+        self._time_bins = np.asarray(time_bins)
+
+        if rebin_mask is None:
+            rebin_mask = np.ones(len(self._time_bins), dtype=bool)
+        self._rebin_mask = np.asarray(rebin_mask, dtype=bool)
+
+        self._starts, self._ppc_time_bins = reduceat_starts(
+            self._time_bins[self._rebin_mask], min_bin_width, max_gap
+        )
+
+        self._block_size = block_size
+        self._max_block_memory = max_block_memory
+
+        # all ranks need the same seed
+        if seed is None:
+            seed = np.random.SeedSequence().entropy if rank == 0 else None
+            if using_mpi:
+                seed = comm.bcast(seed, root=0)
+        self._seed = seed
+
+    @classmethod
+    def from_model(cls, model, param_names=None, time_bins=None, **kwargs):
+        """
+        PPC of a ModelDet
+        :param param_names: names of the columns of the samples, e.g. the
+        parameter names of a ModelCombine. Default is the order of
+        model.parameter.
+        :param time_bins: special time bins, default are the fit time bins
+        """
+        def model_counts(samples):
+            return model.get_model_counts_batch(
+                samples, param_names=param_names, time_bins=time_bins
+            )
+
+        if time_bins is None:
+            time_bins = model.fit_time_bins
+
+        return cls(model_counts, time_bins, **kwargs)
+
+    def _get_block_size(self, shape):
+        """
+        :param shape: shape of the model counts of one sample, e.g.
+        (N_time_bins, N_echan) or (N_time_bins, N_det, N_echan)
+        """
+        if self._block_size is not None:
+            return self._block_size
+
+        # model counts (float64), draws (int64) and the uint32 copy
+        bytes_per_sample = int(np.prod(shape)) * 20
+        return int(max(1, self._max_block_memory // bytes_per_sample))
+
+    def _simulate_block(self, samples, block_index):
+        """
+        Poisson draws and rebinned counts of one block of samples
+        """
+        rng = np.random.default_rng([self._seed, 1, block_index])
+
+        counts = rng.poisson(self._model_counts(samples)).astype(np.uint32)
+
+        counts_binned = np.add.reduceat(
+            counts[:, self._rebin_mask], self._starts, axis=1
+        )
+
+        return counts, counts_binned
+
+    def run(self, samples, sinks, n_samples=500):
+        """
+        Simulate the PPC counts for a random subset of the samples and
+        pass them to the sinks. The results of the sinks are only complete
+        on rank 0.
+        :param samples: posterior samples (N, N_params)
+        :param sinks: list of sinks, e.g. HDF5PPCSink or ArrayPPCSink
+        :param n_samples: max number of samples used
+        :returns: number of used samples
+        """
+        rng = np.random.default_rng([self._seed, 0])
+        samples = select_posterior_samples(samples, n_samples, rng)
+        n_samples = len(samples)
+
+        # the model counts of the first sample set the shapes and the
+        # grids of the quantile sinks
+        expected_counts = self._model_counts(samples[:1])[0]
+        expected_counts_binned = np.add.reduceat(
+            expected_counts[self._rebin_mask], self._starts, axis=0
+        )
+        shape = expected_counts.shape
+        binned_shape = expected_counts_binned.shape
+
+        block_size = self._get_block_size(shape)
+
+        if using_mpi:
+            block_size = comm.bcast(block_size, root=0)
+
+        num_blocks = int(np.ceil(n_samples / block_size))
+
+        full_resolution = any(sink.needs_full_resolution for sink in sinks)
+
+        # mergeable sinks are filled on every rank and reduced at the end
+        gather = using_mpi and not all(sink.mergeable for sink in sinks)
+
+        if rank == 0 or not gather:
+            for sink in sinks:
+                sink.start(n_samples, expected_counts, expected_counts_binned)
+
+        # in every round each rank simulates one block, the blocks of one
+        # round are consecutive, so rank 0 receives them in order
+        for first_block in range(0, num_blocks, size):
+            block_index = first_block + rank
+
+            start = min(block_index * block_size, n_samples)
+            stop = min(start + block_size, n_samples)
+
+            if stop > start:
+                counts, counts_binned = self._simulate_block(
+                    samples[start:stop], block_index
+                )
+            else:
+                counts = np.zeros((0,) + shape, dtype=np.uint32)
+                counts_binned = np.zeros((0,) + binned_shape, dtype=np.uint32)
+
+            if gather:
+                offset = min(first_block * block_size, n_samples)
+
+                # number of samples of every rank in this round
+                block_edges = np.minimum(
+                    (first_block + np.arange(size + 1)) * block_size, n_samples
+                )
+                round_sizes = np.diff(block_edges)
+
+                counts_binned = self._gather(
+                    counts_binned, round_sizes, binned_shape
+                )
+                if full_resolution:
+                    counts = self._gather(counts, round_sizes, shape)
+            else:
+                offset = start
+
+            if (rank == 0 or not gather) and len(counts_binned) > 0:
+                for sink in sinks:
+                    sink.add(offset, counts, counts_binned)
+
+        if using_mpi and not gather:
+            for sink in sinks:
+                sink.reduce(comm)
+
+        return n_samples
+
+    def _gather(self, block, round_sizes, shape):
+        """
+        Gather the blocks of one round on rank 0 with one Gatherv
+        :param round_sizes: number of samples of every rank in this round
+        """
+        from mpi4py import MPI
+
+        sendcounts = round_sizes * int(np.prod(shape))
+
+        recvbuf = None
+        if rank == 0:
+            recvbuf = np.empty((np.sum(round_sizes),) + shape, dtype=np.uint32)
+            displs = np.insert(np.cumsum(sendcounts), 0, 0)[:-1]
+            recvbuf_spec = [recvbuf, sendcounts, displs, MPI.UINT32_T]
+        else:
+            recvbuf_spec = None
+
+        comm.Gatherv(np.ascontiguousarray(block), recvbuf_spec, root=0)
+
+        return recvbuf
+
+    @property
+    def time_bins(self):
+        return self._time_bins
+
+    @property
+    def ppc_time_bins(self):
+        return self._ppc_time_bins
+
+    @property
+    def seed(self):
+        return self._seed
@@ -1,13 +1,28 @@
+import os
 import collections
 import random
 import numpy as np
 from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import pymultinest
+from scipy.optimize import minimize
 
 from gbmbkgpy.utils.mpi import check_mpi
 from gbmbkgpy.io.package_data import get_path_of_external_data_dir
 from gbmbkgpy.utils.likelihood import cstat_numba
+from gbmbkgpy.io.posterior_store import (
+    PosteriorStore,
+    multinest_basename,
+    posterior_store_path,
+    write_posterior_store,
+)
+from gbmbkgpy.modeling.source import PhotonSourceFree, StackedPhotonSources
+from gbmbkgpy.modeling.warm_start import (
+    set_warm_start_priors,
+    warm_start_diagnostics,
+)
 
 using_mpi, rank, size, comm = check_mpi()
 
@@ -21,14 +36,22 @@ def check_valid_source_name(source, source_list):
             raise AssertionError("Two sources with the same names")
 
 
-def create_output_dir(identifier):
+def create_output_dir(identifier, output_dir=None):
+    """
+    :param output_dir: fixed output dir, e.g. to resume a fit. Default is
+    a new dir with the identifier and the current time.
+    """
     base = get_path_of_external_data_dir()
-    output_dir = (
-        base
-        / "fits"
-        / "mn_out"
-        / (f"{identifier}_" + datetime.now().strftime("%m-%d_%H-%M"))
-    )
+
+    if output_dir is not None:
+        output_dir = Path(output_dir).absolute()
+    else:
+        output_dir = (
+            base
+            / "fits"
+            / "mn_out"
+            / (f"{identifier}_" + datetime.now().strftime("%m-%d_%H-%M"))
+        )
 
     # If the output path is to long (MultiNest only supports 100 chars)
     # we will create a symbolic link with a random directory name
@@ -61,10 +84,51 @@ def arg_median(a):
 
 
 class ModelDet:
-    def __init__(self, data):
-        """ """
+    def __init__(self, data, incremental=False, cache_sources=False,
+                 full_recompute_interval=1000):
+        """
+        :param data: Data object
+        :param incremental: If True the sources are precalculated once for
+        all valid time bins and the fit masks are only applied as index
+        views on the precalculated arrays. Changing the fit masks
+        (data.mask_data with unvalid=False) then only needs a call of
+        update_fit_mask instead of rebuilding the model.
+        :param cache_sources: If True the counts of every source are cached
+        together with the values of its parameters. Only the sources with
+        changed parameters are evaluated again and the total model counts
+        are updated with the difference of their counts.
+        :param full_recompute_interval: Number of model evaluations after
+        which the total model counts are summed up again from the cached
+        source counts, to limit the floating point drift of the updates.
+        """
         self._data = data
+        self._init_state(incremental, cache_sources, full_recompute_interval)
+
+        if self._incremental:
+            self._num_valid_bins = len(self._data.time_bins)
+            self._fit_mask = self._data.valid_fit_time_mask
+            self._fit_counts = self._data.counts[self._fit_mask]
+
+    def _init_state(self, incremental=False, cache_sources=False,
+                    full_recompute_interval=1000):
+        """
+        Set the state of the fit, the warm start and the source cache,
+        shared with ModelCombine
+        """
         self._sources = []
+        self._incremental = incremental
+        self._fit_window = None
+
+        self._sampler = None
+        self._warm_start = None
+        self._fit_diagnostics = None
+
+        self._cache_sources = cache_sources
+        self._full_recompute_interval = full_recompute_interval
+        self._source_cache_hits = 0
+        self._source_cache_misses = 0
+        self._num_full_recomputes = 0
+        self._reset_source_cache()
 
     def add_source(self, source):
         """
@@ -73,7 +137,11 @@ class ModelDet:
         check_valid_source_name(source, self._sources)
 
         # set time bins for source
-        source.set_time_bins(self._data.fit_time_bins)
+        if self._incremental:
+            source.set_time_bins(self._data.time_bins)
+            source.set_fit_mask(self._fit_mask)
+        else:
+            source.set_time_bins(self._data.fit_time_bins)
 
         # add to list
         self._sources.append(source)
@@ -81,8 +149,145 @@ class ModelDet:
         # update current parameters
         self.update_current_parameters()
 
+        self._reset_source_cache()
+
+    def update_fit_mask(self):
+        """
+        Apply the current fit mask of the data to all sources without
+        redoing the precalculation of the sources. Only possible in the
+        incremental mode.
+        """
+        assert self._incremental, "Only possible in the incremental mode"
+
+        assert len(self._data.time_bins) == self._num_valid_bins, (
+            "The valid time bins changed. This needs a rebuild of the model. "
+            "Use data.mask_data with unvalid=False to only mask bins in the fit."
+        )
+
+        self._fit_mask = self._data.valid_fit_time_mask
+
+        if self._fit_window is not None:
+            time_bins = self._data.time_bins
+            self._fit_mask = self._fit_mask & (
+                time_bins[:, 0] >= time_bins[-1, 1] - self._fit_window
+            )
+
+        self._fit_counts = self._data.counts[self._fit_mask]
+
+        for source in self._sources:
+            source.set_fit_mask(self._fit_mask)
+
+        self._reset_source_cache()
+
+    def set_fit_window(self, window):
+        """
+        Only use the time bins in the last window seconds of the data in
+        the fit. The window moves with the data appended with append_data.
+        Only possible in the incremental mode.
+        :param window: length of the window in seconds, None for all bins
+        """
+        assert self._incremental, "Only possible in the incremental mode"
+
+        self._fit_window = window
+        self.update_fit_mask()
+
+    def append_data(self, time_bins, counts):
+        """
+        Append new time bins to the data (e.g. new CTIME packets in near
+        real time). The sources are only precalculated for the new time bins
+        and the bins that changed in the rebinning. Only possible in the
+        incremental mode.
+        :param time_bins: new time bins (N, 2)
+        :param counts: counts of the new time bins (N, num_echan)
+        """
+        assert self._incremental, "Only possible in the incremental mode"
+
+        num_unchanged = self._data.append(time_bins, counts)
+
+        self._num_valid_bins = len(self._data.time_bins)
+
+        for source in self._sources:
+            source.extend_time_bins(self._data.time_bins, num_unchanged)
+
+        self.update_fit_mask()
+
+    def refit(self, method="L-BFGS-B", options=None):
+        """
+        Maximum likelihood fit with scipy, started at the current parameter
+        values. After new data was appended the previous optimum is a good
+        start value, so only a few iterations are needed.
+        :param method: scipy.optimize.minimize method
+        :param options: options for scipy.optimize.minimize
+        :return: scipy OptimizeResult
+        """
+        parameters = list(self.parameter.values())
+
+        start_values = np.array([param.value for param in parameters])
+        bounds = [(param.min_value, param.max_value) for param in parameters]
+
+        # log_like returns the Cash statistic, which is minimized
+        def func_wrapper(values):
+            self.set_parameters(values)
+            return self.log_like()
+
+        result = minimize(
+            func_wrapper,
+            start_values,
+            method=method,
+            bounds=bounds,
+            options=options,
+        )
+
+        self.set_parameters(result.x)
+
+        return result
+
+    def fit_multiresolution(self, widths, method="L-BFGS-B", options=None):
+        """
+        Coarse to fine fit. The data is rebinned to every width in widths
+        and fitted with refit, starting at the optimum of the previous
+        (coarser) level. The fits on the coarse levels are fast and bring
+        the parameters close to the optimum, so only a few iterations are
+        needed on the fine levels. The data keeps the binning of the
+        last level.
+        :param widths: min bin widths of the levels, e.g. [300, 60, 10]
+        :param method: scipy.optimize.minimize method
+        :param options: options for scipy.optimize.minimize
+        :return: list with the scipy OptimizeResult of every level
+        """
+        results = []
+
+        for width in widths:
+            self.rebin_data(width)
+
+            results.append(self.refit(method=method, options=options))
+
+        return results
+
+    def rebin_data(self, min_bin_width):
+        """
+        Rebin the data and redo the precalculation of all sources for
+        the new time bins
+        :param min_bin_width: min bin width of the new bins
+        """
+        self._data.rebin_data(min_bin_width)
+
+        if self._incremental:
+            self._num_valid_bins = len(self._data.time_bins)
+
+            for source in self._sources:
+                source.set_time_bins(self._data.time_bins)
+
+            self.update_fit_mask()
+
+        else:
+            for source in self._sources:
+                source.set_time_bins(self._data.fit_time_bins)
+
+            self._reset_source_cache()
+
     def log_like(self):
-        return cstat_numba(self.get_model_counts(), self._data.fit_counts)
+        return cstat_numba(self.get_model_counts(), self.fit_counts)
 
     def log_prior(self, trial_values) -> float:
         """Compute the sum of log-priors, used in the parallel tempering sampling"""
@@ -106,15 +311,70 @@ class ModelDet:
 
         return log_prior
 
+    def set_warm_start_priors(self, previous, **kwargs):
+        """
+        Use informative priors centered on the posterior of a previous fit,
+        e.g. of the day before. The following minimize_multinest runs use
+        fewer live points and the constant efficiency mode and check if
+        the posterior is consistent with the warm start priors.
+        :param previous: ModelDet with samples (e.g. after load_fit), dict
+        with samples or path of an exported result file
+        :param kwargs: see gbmbkgpy.modeling.warm_start.set_warm_start_priors
+        :returns: dict with the warm started parameters
+        """
+        self._warm_start = set_warm_start_priors(
+            self.parameter, previous, **kwargs
+        )
+        return self._warm_start
+
+    def reset_warm_start_priors(self):
+        """
+        Set the priors back to the priors before the warm start, e.g. to
+        repeat a fit for which the warm start failed
+        """
+        if self._warm_start is None:
+            return
+
+        for name, info in self._warm_start.items():
+            self.parameter[name].prior = info["old_prior"]
+
+        self._warm_start = None
+
     def minimize_multinest(
         self,
         identifier="gbmbkgpy_fit",
-        n_live_points=400,
-        const_efficiency_mode=False,
+        n_live_points=None,
+        const_efficiency_mode=None,
         verbose=True,
         resume=False,
+        sampling_efficiency=None,
+        output_dir=None,
     ):
-        """Multinest Fit"""
+        """
+        Multinest Fit
+        The defaults of n_live_points (400), const_efficiency_mode (False)
+        and sampling_efficiency (0.8) change to 150, True and 0.3 if the
+        priors are warm started.
+        :param resume: Resume the MultiNest run in output_dir. If the fit
+        in output_dir was already completed, its posterior is loaded and
+        the sampling is skipped.
+        :param output_dir: fixed output dir, needed to resume a fit
+        """
+        if (resume and output_dir is not None and
+                PosteriorStore.from_result_dir(output_dir) is not None):
+            self._output_dir = Path(output_dir).absolute()
+            self.load_fit(self._output_dir)
+            return self._output_dir
+        warm_started = self._warm_start is not None
+
+        if n_live_points is None:
+            n_live_points = 150 if warm_started else 400
+
+        if const_efficiency_mode is None:
+            const_efficiency_mode = warm_started
+
+        if sampling_efficiency is None:
+            sampling_efficiency = 0.3 if const_efficiency_mode else 0.8
 
         # assert (
         #    has_pymultinest
@@ -130,7 +390,7 @@ class ModelDet:
         prior = self._get_multinest_prior()
 
         # output dir
-        output_dir, tmp_output_dir = create_output_dir(identifier)
+        output_dir, tmp_output_dir = create_output_dir(identifier, output_dir)
         # Run PyMultiNest
         sampler = pymultinest.run(
             func_wrapper,
@@ -144,6 +404,7 @@ class ModelDet:
             verbose=verbose,  # False was default
             importance_nested_sampling=False,
             const_efficiency_mode=const_efficiency_mode,
+            sampling_efficiency=sampling_efficiency,
         )
 
         # Store the sample for further use (if needed)
@@ -155,13 +416,50 @@ class ModelDet:
             tmp_output_dir.unlink()
             self._output_dir = output_dir
 
+        self._read_multinest_posterior(
+            str((self._output_dir / "fit_").absolute())
+        )
+
+        self._check_warm_start()
+
+        return self._output_dir
+
+    def _read_multinest_posterior(self, basename):
+        """
+        Read the posterior from the MultiNest output files, calculate the
+        log prior of all samples and save everything in the posterior
+        store, so it never has to be parsed again.
+        """
         # analyse : taken from 3ML
         multinest_analyzer = pymultinest.analyse.Analyzer(
             n_params=len(self.parameter),
-            outputfiles_basename=str((tmp_output_dir / "fit_").absolute()),
+            outputfiles_basename=basename,
+        )
+
+        posterior = multinest_analyzer.get_equal_weighted_posterior()
+
+        raw_samples = posterior[:, :-1]
+
+        # Get the log. likelihood values from the chain
+        log_like_values = posterior[:, -1]
+
+        log_prior_values = np.array(
+            [self.log_prior(samples) for samples in raw_samples]
         )
 
-        self._raw_samples = multinest_analyzer.get_equal_weighted_posterior()[:, :-1]
+        if rank == 0:
+            write_posterior_store(
+                posterior_store_path(basename),
+                list(self.parameter.keys()),
+                raw_samples,
+                log_like_values,
+                log_prior_values,
+            )
+
+        self._set_posterior(raw_samples, log_like_values + log_prior_values)
+
+    def _set_posterior(self, raw_samples, log_probability_values):
+        self._raw_samples = raw_samples
 
         self._samples = collections.OrderedDict()
 
@@ -170,50 +468,60 @@ class ModelDet:
 
             self._samples[parameter_name] = self._raw_samples[:, i]
 
-        # Get the log. likelihood values from the chain
-        log_like_values = multinest_analyzer.get_equal_weighted_posterior()[:, -1]
+        self._log_probability_values = log_probability_values
+
+    def _check_warm_start(self):
+        """
+        Diagnostics of the posterior of a warm started fit
+        """
+        if self._warm_start is None:
+            self._fit_diagnostics = None
+            return
 
-        # now get the log probability
-        self._log_probability_values = log_like_values + np.array(
-            [self.log_prior(samples) for samples in self._raw_samples]
+        self._fit_diagnostics = warm_start_diagnostics(
+            self._samples, self._warm_start
         )
-        return self._output_dir
+
+        if not self._fit_diagnostics["warm_start_ok"] and rank == 0:
+            print(
+                "Warning: The posterior of the parameters "
+                f"{self._fit_diagnostics['flagged']} is not consistent "
+                "with the warm start priors. The fit should be repeated "
+                "with the broad priors (reset_warm_start_priors)."
+            )
 
     def load_fit(self, output_dir):
         """
         Only works if the fitted model was created exactly like the model
         here. Same sources & same order!
+        The memory mapped posterior store of the fit is used if it exists,
+        otherwise the MultiNest output is parsed and the store is written.
+        :param output_dir: output directory of the fit or the MultiNest
+        outputfiles_basename
         """
-        # analyse : taken from 3ML
         if not isinstance(output_dir, str):
             output_dir = str(output_dir.absolute())
 
-        multinest_analyzer = pymultinest.analyse.Analyzer(
-            n_params=len(self.parameter), outputfiles_basename=output_dir
-        )
-
-        self._raw_samples = multinest_analyzer.get_equal_weighted_posterior()[:, :-1]
+        store = PosteriorStore.from_result_dir(output_dir)
 
-        self._samples = collections.OrderedDict()
+        if store is not None:
+            assert store.param_names == list(self.parameter.keys()), (
+                "The parameters of the stored posterior do not match the "
+                "parameters of this model"
+            )
 
-        for i, parameter_name in enumerate(self.parameter.keys()):
-            # Add the samples for this parameter for this source
+            self._set_posterior(store.samples, store.log_probability)
 
-            self._samples[parameter_name] = self._raw_samples[:, i]
-
-        # Get the log. likelihood values from the chain
-        log_like_values = multinest_analyzer.get_equal_weighted_posterior()[:, -1]
+        else:
+            self._read_multinest_posterior(multinest_basename(output_dir))
 
-        # now get the log probability
-        self._log_probability_values = log_like_values + np.array(
-            [self.log_prior(samples) for samples in self._raw_samples]
-        )
+        self._check_warm_start()
 
     def get_model_counts_given_source(
         self, source_name_list: list, bin_mask=None, time_bins=None
     ):
         if time_bins is None:
-            counts = np.zeros_like(self.data.fit_counts, dtype=float)
+            counts = np.zeros_like(self.fit_counts, dtype=float)
         else:
             counts = np.zeros((len(time_bins), self.data.num_echan), dtype=float)
 
@@ -257,17 +565,138 @@ class ModelDet:
 
         return prior
 
-    def get_model_counts(self, bin_mask=None, time_bins=None):
+    def get_model_counts(self, bin_mask=None, time_bins=None,
+                         source_counts=None):
+        """
+        :param source_counts: dict with the already evaluated counts of
+        some sources (key: id of the source), e.g. from the stacked folding
+        of a ModelCombine. Only used for the default time bins.
+        """
+        if self._cache_sources and time_bins is None:
+            counts = self._get_cached_model_counts(source_counts)
+
+            if bin_mask is not None:
+                return counts[bin_mask]
+            return counts.copy()
+
         if time_bins is None:
-            counts = np.zeros_like(self.data.fit_counts, dtype=float)
+            counts = np.zeros_like(self.fit_counts, dtype=float)
         else:
             counts = np.zeros((len(time_bins), self.data.num_echan), dtype=float)
 
         for source in self._sources:
-            counts += source.get_counts(bin_mask, time_bins=time_bins)
+            if (source_counts is not None and time_bins is None and
+                    id(source) in source_counts):
+                if bin_mask is None:
+                    counts += source_counts[id(source)]
+                else:
+                    counts += source_counts[id(source)][bin_mask]
+            else:
+                counts += source.get_counts(bin_mask, time_bins=time_bins)
 
         return counts
 
+    def get_model_counts_batch(self, samples, param_names=None,
+                               time_bins=None):
+        """
+        Model counts for a block of parameter samples, e.g. for posterior
+        predictive checks. Every source evaluates the whole block at once
+        (the responses and base arrays are only prepared once per block).
+        The parameters keep their current values.
+        :param samples: array (N_samples, N_params)
+        :param param_names: names of the columns of samples, e.g. the
+        parameter names of a ModelCombine. Default is the order of
+        self.parameter.
+        :param time_bins: special time bins, default are the fit time bins
+        :returns: counts array (N_samples, N_time_bins, N_echan)
+        """
+        samples = np.atleast_2d(samples)
+
+        if param_names is not None:
+            param_names = list(param_names)
+            samples = samples[:, [param_names.index(name)
+                                  for name in self.parameter.keys()]]
+
+        column = {name: i for i, name in enumerate(self.parameter.keys())}
+
+        counts = None
+        for source in self._sources:
+            columns = [column[f"{source.name}_{name}"]
+                       for name in source.parameters.keys()]
+
+            source_counts = source.get_counts_batch(
+                samples[:, columns], time_bins=time_bins
+            )
+
+            if counts is None:
+                counts = source_counts
+            else:
+                counts += source_counts
+
+        return counts
+
+    def _reset_source_cache(self):
+        """
+        Clear the cached source counts, needed if the time bins of the
+        sources changed
+        """
+        self._source_cache = [None] * len(self._sources)
+        self._source_cache_parameters = [
+            list(source.parameters.values()) for source in self._sources
+        ]
+        self._model_counts_total = None
+        self._num_model_evaluations = 0
+
+    def _get_cached_model_counts(self, source_counts=None):
+        """
+        Total model counts in the default time bins. Only the sources whose
+        parameter values changed since their last evaluation are evaluated
+        again, their old counts are subtracted from the running total and
+        the new counts are added.
+        """
+        full_recompute = (
+            self._model_counts_total is None or
+            self._num_model_evaluations % self._full_recompute_interval == 0
+        )
+        self._num_model_evaluations += 1
+
+        if full_recompute:
+            total = np.zeros_like(self.fit_counts, dtype=float)
+            self._num_full_recomputes += 1
+        else:
+            total = self._model_counts_total
+
+        for i, source in enumerate(self._sources):
+            key = tuple(param.value for param in self._source_cache_parameters[i])
+            cached = self._source_cache[i]
+
+            if cached is not None and cached[0] == key:
+                self._source_cache_hits += 1
+
+                if full_recompute:
+                    total += cached[1]
+                continue
+
+            self._source_cache_misses += 1
+
+            if source_counts is not None and id(source) in source_counts:
+                new_counts = source_counts[id(source)]
+            else:
+                new_counts = source.get_counts()
+
+            # copy, some sources reuse their output arrays
+            new_counts = np.array(new_counts, dtype=float)
+
+            if not full_recompute:
+                total -= cached[1]
+            total += new_counts
+
+            self._source_cache[i] = (key, new_counts)
+
+        self._model_counts_total = total
+
+        return total
+
     def set_parameters(self, values):
         """
         Set parameters to values in the array values
@@ -316,6 +745,32 @@ class ModelDet:
             names.append(source.name)
         return names
 
+    @property
+    def fit_diagnostics(self):
+        """
+        Convergence diagnostics of the last warm started fit
+        """
+        return self._fit_diagnostics
+
+    @property
+    def warm_start(self):
+        return self._warm_start
+
+    @property
+    def source_cache_stats(self):
+        """
+        Statistics of the source cache: hits and misses of the cached
+        source counts and the number of full recomputes of the total
+        """
+        num_lookups = self._source_cache_hits + self._source_cache_misses
+        return {
+            "hits": self._source_cache_hits,
+            "misses": self._source_cache_misses,
+            "hit_rate": (self._source_cache_hits / num_lookups
+                         if num_lookups > 0 else 0.0),
+            "full_recomputes": self._num_full_recomputes,
+        }
+
     @property
     def parameter(self):
         return self._current_parameters
@@ -332,6 +787,25 @@ class ModelDet:
     def data(self):
         return self._data
 
+    @property
+    def fit_counts(self):
+        if self._incremental:
+            return self._fit_counts
+        return self._data.fit_counts
+
+    @property
+    def fit_time_bins(self):
+        """
+        Time bins of the model counts and the fit counts
+        """
+        if self._incremental:
+            return self._data.time_bins[self._fit_mask]
+        return self._data.fit_time_bins
+
+    @property
+    def incremental(self):
+        return self._incremental
+
     @property
     def sources(self):
         return self._sources
@@ -342,36 +816,173 @@ class ModelDet:
 
 
 class ModelCombine(ModelDet):
-    def __init__(self, *model_dets):
+    def __init__(self, *model_dets, stacked_folding=True, num_threads=None):
+        """
+        :param model_dets: ModelDet objects of the different detectors
+        :param stacked_folding: Fold the PhotonSourceFree sources that share
+        the same spectral model in the different detectors all at once.
+        :param num_threads: Number of threads used to evaluate the
+        likelihoods of the submodels, see set_num_threads.
+        """
         self._model_dets: ModelDet = model_dets
-        self._sampler = None
+
+        # the submodels have their own sources, masks and caches
+        self._init_state()
+
+        if stacked_folding:
+            self._stacked_sources = self._find_shared_spectrum_sources()
+        else:
+            self._stacked_sources = []
+
+        self.update_current_parameters()
+
+        self._thread_pool = None
+        self.set_num_threads(num_threads)
+
+    def set_num_threads(self, num_threads=None):
+        """
+        Set the number of threads of the persistent thread pool that
+        evaluates the likelihoods of the submodels in parallel.
+        :param num_threads: Number of threads, at most one per submodel.
+        Default is the number of cpus divided by the number of MPI ranks,
+        so every rank of a MultiNest fit with MPI gets its own share of
+        the cpus. With 1 the submodels are evaluated sequentially.
+        """
+        if num_threads is None:
+            num_threads = max(1, (os.cpu_count() or 1) // size)
+
+        self._num_threads = int(min(num_threads, len(self._model_dets)))
+
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
+
+        if self._num_threads > 1:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self._num_threads
+            )
+
+    def __getstate__(self):
+        # the thread pool can not be copied, it is recreated instead
+        state = self.__dict__.copy()
+        state["_thread_pool"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.set_num_threads(self._num_threads)
+
+    def _find_shared_spectrum_sources(self):
+        """
+        Group the PhotonSourceFree sources of all submodels by their
+        spectral model. Sources with the same spectral model object in
+        several detectors are folded together.
+        """
+        groups = collections.OrderedDict()
+        for model in self._model_dets:
+            for source in model.sources:
+                if type(source) is PhotonSourceFree:
+                    groups.setdefault(id(source.fit_model), []).append(source)
+
+        return [
+            StackedPhotonSources(sources)
+            for sources in groups.values()
+            if len(sources) > 1
+        ]
+
+    def _evaluate_stacked_sources(self):
+        """
+        Evaluate all sources with shared spectra
+        :returns: dict with the counts of the sources (key: id of the source)
+        """
+        source_counts = {}
+        for stacked in self._stacked_sources:
+            for source, counts in zip(stacked.sources, stacked.evaluate()):
+                source_counts[id(source)] = counts
+
+        return source_counts
 
     def log_like(self):
+        source_counts = self._evaluate_stacked_sources()
+
+        def model_log_like(model):
+            return cstat_numba(
+                model.get_model_counts(source_counts=source_counts),
+                model.fit_counts
+            )
+
+        if self._thread_pool is None:
+            log_likes = map(model_log_like, self._model_dets)
+        else:
+            log_likes = self._thread_pool.map(model_log_like, self._model_dets)
+
+        # sum in the order of the submodels, independent of the threads
         log_like = 0
-        for model in self._model_dets:
-            log_like += model.log_like()
+        for value in log_likes:
+            log_like += value
         return log_like
 
+    def get_model_counts(self, bin_mask=None, time_bins=None,
+                         source_counts=None):
+        """
+        Model counts of all submodels, concatenated along the time axis in
+        the order of the submodels (like fit_counts)
+        :param bin_mask: mask of the concatenated time bins
+        :param time_bins: special time bins, used for every submodel
+        """
+        if time_bins is None and source_counts is None:
+            source_counts = self._evaluate_stacked_sources()
+
+        counts = np.concatenate(
+            [
+                model.get_model_counts(time_bins=time_bins,
+                                       source_counts=source_counts)
+                for model in self._model_dets
+            ]
+        )
+
+        if bin_mask is not None:
+            return counts[bin_mask]
+        return counts
+
     @property
-    def parameter(self):
-        parameters = {}
+    def fit_counts(self):
+        """
+        Fit counts of all submodels, concatenated along the time axis in
+        the order of the submodels
+        """
+        return np.concatenate([model.fit_counts for model in self._model_dets])
+
+    def update_current_parameters(self):
+        """
+        Merge the parameters of all submodels. The merged dict is cached,
+        so this has to be called again if sources are added to the
+        submodels after the ModelCombine was created.
+        """
+        parameters = collections.OrderedDict()
         for model in self._model_dets:
             for name, param in model.parameter.items():
                 parameters[name] = param
-        return parameters
+        self._current_parameters = parameters
 
     def minimize_multinest(
         self,
         identifier="gbmbkgpy_fit",
-        n_live_points=400,
-        const_efficiency_mode=False,
+        n_live_points=None,
+        const_efficiency_mode=None,
         verbose=True,
+        resume=False,
+        sampling_efficiency=None,
+        output_dir=None,
     ):
         self._output_dir = super().minimize_multinest(
             identifier=identifier,
             n_live_points=n_live_points,
             const_efficiency_mode=const_efficiency_mode,
             verbose=verbose,
+            resume=resume,
+            sampling_efficiency=sampling_efficiency,
+            output_dir=output_dir,
         )
 
         self.send_samples_to_submodels()
@@ -406,6 +1017,27 @@ class ModelCombine(ModelDet):
 
             model.set_log_probability_values(self._log_probability_values)
 
+    def update_fit_mask(self):
+        """
+        Apply the current fit masks of the data to all submodels
+        """
+        for model in self._model_dets:
+            model.update_fit_mask()
+
+    def set_fit_window(self, window):
+        """
+        Only use the last window seconds of the data of all submodels
+        """
+        for model in self._model_dets:
+            model.set_fit_window(window)
+
+    def rebin_data(self, min_bin_width):
+        """
+        Rebin the data of all submodels
+        """
+        for model in self._model_dets:
+            model.rebin_data(min_bin_width)
+
     def send_parameters_to_submodels(self):
         """
         Sends the new parameter values to the submodels
@@ -1,5 +1,7 @@
 from astromodels import Function1D, FunctionMeta
 import astropy.units as astropy_units
+import numpy as np
+import scipy.stats as stats
 
 
 class SBPL(Function1D, metaclass=FunctionMeta):
@@ -59,6 +61,70 @@ class SBPL(Function1D, metaclass=FunctionMeta):
         return K/((x/xb)**alpha+(x/xb)**beta)
 
 
+class Truncated_student_t(Function1D, metaclass=FunctionMeta):
+    r"""
+    description :
+        Student-t distribution truncated to the interval between the
+        lower_bound and the upper_bound. Has heavier tails than a
+        Gaussian, which makes it a robust informative prior.
+    latex : test
+    parameters :
+        F :
+            desc : Integral between -inf and +inf. Fix this to 1 to obtain a normalized distribution
+            initial value : 1
+        mu :
+            desc : Central value
+            initial value : 0.0
+        sigma :
+            desc : scale
+            initial value : 1.0
+            min : 1e-12
+        nu :
+            desc : degrees of freedom
+            initial value : 4.0
+            min : 1e-3
+        lower_bound :
+            desc : lower bound of the distribution
+            initial value : -1.
+        upper_bound :
+            desc : upper bound of the distribution
+            initial value : 1.
+    """
+
+    def _setup(self):
+        self._is_prior = True
+
+    def _set_units(self, x_unit, y_unit):
+        self.F.unit = y_unit * x_unit
+        self.mu.unit = x_unit
+        self.sigma.unit = x_unit
+        self.lower_bound.unit = x_unit
+        self.upper_bound.unit = x_unit
+        self.nu.unit = astropy_units.dimensionless_unscaled
+
+    def evaluate(self, x, F, mu, sigma, nu, lower_bound, upper_bound):
+        dist = stats.t(nu, loc=mu, scale=sigma)
+
+        norm = dist.cdf(upper_bound) - dist.cdf(lower_bound)
+
+        idx = (x >= lower_bound) & (x <= upper_bound)
+
+        return F * np.where(idx, dist.pdf(x), 0.0) / norm
+
+    def from_unit_cube(self, x):
+        dist = stats.t(self.nu.value, loc=self.mu.value, scale=self.sigma.value)
+
+        lower_bound = self.lower_bound.value
+        upper_bound = self.upper_bound.value
+
+        theta_lower = dist.cdf(lower_bound)
+        theta_upper = dist.cdf(upper_bound)
+
+        out = dist.ppf(theta_lower + x * (theta_upper - theta_lower))
+
+        return np.clip(out, lower_bound, upper_bound)
+
+
 def fix_all_params(astro_func):
     """
     Helper function to fix all the parameters of a astromodel function
@@ -4,6 +4,34 @@ import numpy as np
 from astromodels import Constant
 
 from gbmbkgpy.modeling.new_astromodels import fix_all_params
+from gbmbkgpy.modeling.spectral_integration import SpectralIntegrator
+
+
+def _extend_response_precalculation(source, time_bins, num_unchanged):
+    """
+    Extend the interpolated response array of a photon source, only the
+    responses of the new time bins are interpolated
+    """
+    response_array = source._full_response_array[:num_unchanged]
+    tile_time_bins = source._full_tile_time_bins[:num_unchanged]
+
+    if num_unchanged < len(time_bins):
+        new_time_bins = time_bins[num_unchanged:]
+
+        new_tile_time_bins = np.tile(
+            new_time_bins, (source._num_ebins_out, 1, 1)
+        ).T
+        new_tile_time_bins = np.swapaxes(new_tile_time_bins, 0, 1)
+
+        response_array = np.concatenate(
+            (response_array, source._response_interpolation(new_time_bins))
+        )
+        tile_time_bins = np.concatenate((tile_time_bins, new_tile_time_bins))
+
+    source._full_response_array = response_array
+    source._full_tile_time_bins = tile_time_bins
+    source._response_array = response_array
+    source._tile_time_bins = tile_time_bins
 
 
 class Source:
@@ -19,11 +47,52 @@ class Source:
         return self._evaluate()
 
     def set_time_bins(self, time_bins):
+        self._full_time_bins = time_bins
         self._precalculation(time_bins)
 
+    def set_fit_mask(self, fit_mask):
+        """
+        Restrict the evaluation to a subset of the time bins set with
+        set_time_bins, without redoing the expensive precalculation.
+        :param fit_mask: bool mask of the time bins used in the fit
+        """
+        assert hasattr(
+            self, "_full_time_bins"
+        ), "You first have to set the time-bins before setting a fit mask"
+        assert len(fit_mask) == len(
+            self._full_time_bins
+        ), "The fit mask must have the same length as the time bins"
+
+        self._apply_fit_mask(np.asarray(fit_mask, dtype=bool))
+
+    def extend_time_bins(self, time_bins, num_unchanged):
+        """
+        Set new time bins of which the first num_unchanged bins are the
+        same as the current time bins, e.g. after new data was appended.
+        Only the other bins get precalculated.
+        :param time_bins: all new time bins
+        :param num_unchanged: number of time bins at the start that did not change
+        """
+        assert hasattr(
+            self, "_full_time_bins"
+        ), "You first have to set the time-bins before extending them"
+
+        self._full_time_bins = time_bins
+        self._extend_precalculation(time_bins, num_unchanged)
+
     def _precalculation(self, time_bins):
         self._time_bins = time_bins
 
+    def _apply_fit_mask(self, fit_mask):
+        # Default for sources with a cheap precalculation:
+        # just redo it for the masked time bins
+        self._precalculation(self._full_time_bins[fit_mask])
+
+    def _extend_precalculation(self, time_bins, num_unchanged):
+        # Default for sources with a cheap precalculation:
+        # just redo it for all time bins
+        self._precalculation(time_bins)
+
     def get_counts(self, bin_mask=None, time_bins=None):
         """
         Calls the evaluation of the source to get the counts per bin. Uses a bin_mask to exclude some bins if needed.
@@ -42,6 +111,39 @@ class Source:
 
         return self._evaluate()
 
+    def get_counts_batch(self, values, time_bins=None):
+        """
+        Counts for a block of parameter values, e.g. posterior samples.
+        The parameters keep their current values.
+        :param values: array (N_samples, N_params) with the values of the
+        free parameters of this source (in the order of self.parameters)
+        :param time_bins: special time bins, default are the time bins of
+        the precalculation
+        :returns: counts array (N_samples, N_time_bins, N_echan)
+        """
+        counts = []
+        for _ in self._iterate_parameter_values(values):
+            counts.append(self.get_counts(time_bins=time_bins))
+
+        return np.array(counts)
+
+    def _iterate_parameter_values(self, values):
+        """
+        Set the parameters to every row of values and restore the current
+        values afterwards
+        """
+        parameters = list(self.parameters.values())
+        current_values = [param.value for param in parameters]
+
+        try:
+            for row in values:
+                for param, value in zip(parameters, row):
+                    param.value = value
+                yield row
+        finally:
+            for param, value in zip(parameters, current_values):
+                param.value = value
+
     def _evaluate(self):
         # evaluate at the default time bins
         raise NotImplementedError("Has to be implemented in sub-class")
@@ -203,8 +305,24 @@ class NormOnlySource(Source):
     def _precalculation(self, time_bins):
         # self._base_array = self._integrate_base_array(time_bins)
         self._integrate_base_array(time_bins)
+        self._full_base_array = self._base_array
         super()._precalculation(time_bins)
 
+    def _apply_fit_mask(self, fit_mask):
+        self._base_array = self._full_base_array[fit_mask]
+        self._time_bins = self._full_time_bins[fit_mask]
+
+    def _extend_precalculation(self, time_bins, num_unchanged):
+        base_array = self._full_base_array[:num_unchanged]
+
+        if num_unchanged < len(time_bins):
+            self._integrate_base_array(time_bins[num_unchanged:])
+            base_array = np.concatenate((base_array, self._base_array))
+
+        self._base_array = base_array
+        self._full_base_array = base_array
+        self._time_bins = time_bins
+
     def _integrate_base_array(self, time_bins):
         """
         Integrate the base rate array over the time bins
@@ -233,7 +351,7 @@ class NormOnlySource(Source):
         # eval model at dummy value (is a constant model)
         return self._fit_model(1) * self._base_array
 
-    def _evaluate_at_time_bins(self, time_bins):
+    def _base_array_at_time_bins(self, time_bins):
         rates = self._interp1d_rate_base_array(time_bins)
         if len(rates.shape) == 3:
             time_bins = np.tile(time_bins, (rates.shape[2], 1, 1)).T
@@ -247,22 +365,45 @@ class NormOnlySource(Source):
 
             else:
                 base_array = np.tile(base_array, (1, 1))
-        # base_array = self._integrate_base_array(time_bins)
-        return self._fit_model(1) * base_array
+        return base_array
+
+    def _evaluate_at_time_bins(self, time_bins):
+        return self._fit_model(1) * self._base_array_at_time_bins(time_bins)
+
+    def get_counts_batch(self, values, time_bins=None):
+        """
+        The base array is integrated once for the whole block and only
+        multiplied with the norms of the samples
+        """
+        if time_bins is None:
+            base_array = self._base_array
+        else:
+            base_array = self._base_array_at_time_bins(time_bins)
+
+        norms = np.array([
+            self._fit_model(1) for _ in self._iterate_parameter_values(values)
+        ])
+
+        return norms.reshape(len(norms), 1, -1) * base_array
 
 
 class PhotonSourceFixed(NormOnlySource):
-    def __init__(self, name, astro_model, rsp_obj):
+    def __init__(self, name, astro_model, rsp_obj, integration="analytic"):
         """
         :param name: Name of this source
         :param astro_model: Astromodel Function for spectrum
         :param response_array: Array with response for different times
+        :param integration: Integration of the spectrum over the input
+        energy bins, see SpectralIntegrator
         """
 
         # fix all the params
         fix_all_params(astro_model)
 
         self._monte_carlo_energies = rsp_obj.Ebins_in_edge
+        self._spectral_integrator = SpectralIntegrator(
+            self._monte_carlo_energies, integration
+        )
         response_interpolation = rsp_obj.interp_effective_response
         self._num_ebins_out = rsp_obj.num_ebins_out
 
@@ -280,14 +421,7 @@ class PhotonSourceFixed(NormOnlySource):
     def _construct_interp1d_rate_base_array(
         self, response_interpolation, model, norm_val
     ):
-        spec = 1 / norm_val * model(self._monte_carlo_energies)
-
-        # trapz integrate
-        ee1 = self._monte_carlo_energies[:-1]
-        ee2 = self._monte_carlo_energies[1:]
-        binned_spec = np.trapz(
-            np.array([spec[:-1], spec[1:]]).T, np.array([ee1, ee2]).T
-        )
+        binned_spec = 1 / norm_val * self._spectral_integrator(model)
 
         def interp1d_rate_base_array(time):
             return np.dot(binned_spec, response_interpolation(time))
@@ -296,12 +430,19 @@ class PhotonSourceFixed(NormOnlySource):
 
 
 class PhotonSourceFree(Source):
-    def __init__(self, name, astro_model, rsp_obj):
+    def __init__(self, name, astro_model, rsp_obj, integration="analytic"):
+        """
+        :param integration: Integration of the spectrum over the input
+        energy bins, see SpectralIntegrator
+        """
         assert (
             len(astro_model.free_parameters) > 1
         ), "There should be more than one free parameter if the spectrum shape is free"
 
         self._monte_carlo_energies = rsp_obj.Ebins_in_edge
+        self._spectral_integrator = SpectralIntegrator(
+            self._monte_carlo_energies, integration
+        )
         self._response_interpolation = rsp_obj.interp_effective_response
         self._num_ebins_out = rsp_obj.num_ebins_out
 
@@ -312,20 +453,27 @@ class PhotonSourceFree(Source):
         self._tile_time_bins = np.tile(time_bins, (self._num_ebins_out, 1, 1)).T
         self._tile_time_bins = np.swapaxes(self._tile_time_bins, 0, 1)
 
+        self._full_response_array = self._response_array
+        self._full_tile_time_bins = self._tile_time_bins
+
         super()._precalculation(time_bins)
 
+    def _apply_fit_mask(self, fit_mask):
+        self._response_array = self._full_response_array[fit_mask]
+        self._tile_time_bins = self._full_tile_time_bins[fit_mask]
+        self._time_bins = self._full_time_bins[fit_mask]
+
+    def _extend_precalculation(self, time_bins, num_unchanged):
+        _extend_response_precalculation(self, time_bins, num_unchanged)
+        self._time_bins = time_bins
+
+    def _binned_spectrum(self):
+        # integrate the flux over the input energy bins
+        return self._spectral_integrator(self._fit_model)
+
     def _evaluate(self):
-        # get flux at input edges
-        spec = self._fit_model(self._monte_carlo_energies)
-
-        # trapz integrate
-        ee1 = self._monte_carlo_energies[:-1]
-        ee2 = self._monte_carlo_energies[1:]
-        binned_spec = np.trapz(
-            np.array([spec[:-1], spec[1:]]).T, np.array([ee1, ee2]).T
-        )
         # fold with all the responses
-        rates = np.dot(binned_spec, self._response_array)
+        rates = np.dot(self._binned_spectrum(), self._response_array)
         # integrate over the time bins
         return np.trapz(rates, self._tile_time_bins, axis=1)
 
@@ -334,27 +482,55 @@ class PhotonSourceFree(Source):
         tile_time_bins = np.tile(time_bins, (self._num_ebins_out, 1, 1)).T
         tile_time_bins = np.swapaxes(tile_time_bins, 0, 1)
 
-        # get flux at input edges
-        spec = self._fit_model(self._monte_carlo_energies)
-
-        # trapz integrate
-        ee1 = self._monte_carlo_energies[:-1]
-        ee2 = self._monte_carlo_energies[1:]
-        binned_spec = np.trapz(
-            np.array([spec[:-1], spec[1:]]).T, np.array([ee1, ee2]).T
-        )
         # fold with all the responses
-        rates = np.dot(binned_spec, response_array)
+        rates = np.dot(self._binned_spectrum(), response_array)
         # integrate over the time bins
         return np.trapz(rates, tile_time_bins, axis=1)
 
+    def get_counts_batch(self, values, time_bins=None):
+        """
+        The responses are interpolated once for the whole block and the
+        spectra of all samples are folded with one tensordot
+        """
+        if time_bins is None:
+            response_array = self._response_array
+            tile_time_bins = self._tile_time_bins
+        else:
+            response_array = self._response_interpolation(time_bins)
+            tile_time_bins = np.tile(time_bins, (self._num_ebins_out, 1, 1)).T
+            tile_time_bins = np.swapaxes(tile_time_bins, 0, 1)
+
+        binned_spectra = np.array([
+            self._binned_spectrum()
+            for _ in self._iterate_parameter_values(values)
+        ])
+
+        # (N_samples, N_time_bins, 2, N_echan)
+        rates = np.tensordot(
+            binned_spectra, response_array, axes=([1], [response_array.ndim - 2])
+        )
+        return np.trapz(rates, tile_time_bins, axis=-2)
+
+    @property
+    def num_ebins_out(self):
+        return self._num_ebins_out
+
+    @property
+    def monte_carlo_energies(self):
+        return self._monte_carlo_energies
+
 
 class PhotonSourceVariable(Source):
     """
     Add temporal evolution to point source
     """
 
-    def __init__(self, name, spec_model, vari_model, t0, rsp_obj):
+    def __init__(self, name, spec_model, vari_model, t0, rsp_obj,
+                 integration="analytic"):
+        """
+        :param integration: Integration of the spectrum over the input
+        energy bins, see SpectralIntegrator
+        """
         msg = "Please Fix the normalization of the spectral model. "
         msg += "Otherwise this is very ambigious"
         assert (
@@ -363,6 +539,9 @@ class PhotonSourceVariable(Source):
         ), msg
 
         self._monte_carlo_energies = rsp_obj.Ebins_in_edge
+        self._spectral_integrator = SpectralIntegrator(
+            self._monte_carlo_energies, integration
+        )
         self._response_interpolation = rsp_obj.interp_effective_response
         self._num_ebins_out = rsp_obj.num_ebins_out
         # function how the photon source will vary
@@ -377,6 +556,29 @@ class PhotonSourceVariable(Source):
         self._tile_time_bins = np.tile(time_bins, (self._num_ebins_out, 1, 1)).T
         self._tile_time_bins = np.swapaxes(self._tile_time_bins, 0, 1)
 
+        self._full_response_array = self._response_array
+        self._full_tile_time_bins = self._tile_time_bins
+
+        self._precalculation_temporal(time_bins)
+
+        super()._precalculation(time_bins)
+
+    def _apply_fit_mask(self, fit_mask):
+        time_bins = self._full_time_bins[fit_mask]
+
+        self._response_array = self._full_response_array[fit_mask]
+        self._tile_time_bins = self._full_tile_time_bins[fit_mask]
+
+        self._precalculation_temporal(time_bins)
+
+        self._time_bins = time_bins
+
+    def _extend_precalculation(self, time_bins, num_unchanged):
+        _extend_response_precalculation(self, time_bins, num_unchanged)
+        self._precalculation_temporal(time_bins)
+        self._time_bins = time_bins
+
+    def _precalculation_temporal(self, time_bins):
         self._idx_start = time_bins[:, 0] < self._t0
 
         self._tstart = time_bins[:, 0][~self._idx_start]
@@ -384,18 +586,9 @@ class PhotonSourceVariable(Source):
 
         self._out = np.zeros_like(time_bins[:, 0])
 
-        super()._precalculation(time_bins)
-
     def _evaluate(self):
-        # get flux at input edges
-        spec = self._fit_model(self._monte_carlo_energies)
-
-        # trapz integrate
-        ee1 = self._monte_carlo_energies[:-1]
-        ee2 = self._monte_carlo_energies[1:]
-        binned_spec = np.trapz(
-            np.array([spec[:-1], spec[1:]]).T, np.array([ee1, ee2]).T
-        )
+        # integrate the flux over the input energy bins
+        binned_spec = self._spectral_integrator(self._fit_model)
 
         # fold with all the responses
         rates_pre = np.dot(binned_spec, self._response_array)
@@ -420,15 +613,9 @@ class PhotonSourceVariable(Source):
         tile_time_bins = np.tile(time_bins, (self._num_ebins_out, 1, 1)).T
         tile_time_bins = np.swapaxes(tile_time_bins, 0, 1)
 
-        # get flux at input edges
-        spec = self._fit_model(self._monte_carlo_energies)
+        # integrate the flux over the input energy bins
+        binned_spec = self._spectral_integrator(self._fit_model)
 
-        # trapz integrate
-        ee1 = self._monte_carlo_energies[:-1]
-        ee2 = self._monte_carlo_energies[1:]
-        binned_spec = np.trapz(
-            np.array([spec[:-1], spec[1:]]).T, np.array([ee1, ee2]).T
-        )
         # fold with all the responses
         rates_pre = np.dot(binned_spec, response_array)
         out = np.zeros_like(time_bins[:, 0])
@@ -445,3 +632,97 @@ class PhotonSourceVariable(Source):
         rates = np.einsum("ijk,i->ijk", rates_pre, out)
         # integrate over the time bins-
         return np.trapz(rates, tile_time_bins, axis=1)
+
+
+class StackedPhotonSources:
+    """
+    PhotonSourceFree sources of different detectors that share the same
+    spectral model (the same astromodels function object). The spectrum is
+    integrated once and folded with the stacked responses of all sources
+    in one matrix product, instead of once per source.
+    """
+
+    def __init__(self, sources):
+        """
+        :param sources: list of PhotonSourceFree with the same fit_model,
+        input energy bins and number of output energy bins
+        """
+        for source in sources[1:]:
+            assert source.fit_model is sources[0].fit_model, \
+                "All stacked sources must share the same spectral model"
+            assert np.array_equal(
+                source.monte_carlo_energies, sources[0].monte_carlo_energies
+            ), "All stacked sources must have the same input energy bins"
+            assert source.num_ebins_out == sources[0].num_ebins_out, \
+                "All stacked sources must have the same output energy bins"
+
+        self._sources = list(sources)
+        self._response_views = None
+
+    def _stack(self):
+        """
+        Stack the responses and time bins of all sources. The sources get
+        views on the stacked arrays, so the stacked arrays do not need
+        additional memory. Restacking is only needed if a source got new
+        arrays, e.g. after a new fit mask was set.
+        """
+        if self._response_views is not None and all(
+            source._response_array is view
+            for source, view in zip(self._sources, self._response_views)
+        ):
+            return
+
+        self._stacked_response_array = np.concatenate(
+            [source._response_array for source in self._sources]
+        )
+        self._stacked_tile_time_bins = np.concatenate(
+            [source._tile_time_bins for source in self._sources]
+        )
+
+        self._offsets = np.cumsum(
+            [0] + [len(source._response_array) for source in self._sources]
+        )
+
+        self._response_views = []
+        for source, start, stop in zip(
+            self._sources, self._offsets[:-1], self._offsets[1:]
+        ):
+            # without a fit mask the full arrays are the same objects,
+            # they are replaced by the views, too
+            if source._full_response_array is source._response_array:
+                source._full_response_array = \
+                    self._stacked_response_array[start:stop]
+                source._full_tile_time_bins = \
+                    self._stacked_tile_time_bins[start:stop]
+
+                source._response_array = source._full_response_array
+                source._tile_time_bins = source._full_tile_time_bins
+            else:
+                source._response_array = \
+                    self._stacked_response_array[start:stop]
+                source._tile_time_bins = \
+                    self._stacked_tile_time_bins[start:stop]
+
+            self._response_views.append(source._response_array)
+
+    def evaluate(self):
+        """
+        Evaluate all sources with one folding of the shared spectrum
+        :returns: list with the counts of all sources
+        """
+        self._stack()
+
+        # fold with the responses of all sources at once
+        rates = np.dot(self._sources[0]._binned_spectrum(),
+                       self._stacked_response_array)
+        # integrate over the time bins
+        counts = np.trapz(rates, self._stacked_tile_time_bins, axis=1)
+
+        return [
+            counts[start:stop]
+            for start, stop in zip(self._offsets[:-1], self._offsets[1:])
+        ]
+
+    @property
+    def sources(self):
+        return self._sources
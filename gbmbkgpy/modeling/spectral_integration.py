@@ -0,0 +1,237 @@
+import numpy as np
+from scipy.special import gamma, gammaincc, exp1, hyp2f1
+
+valid_integration_methods = ["analytic", "simpson", "trapz"]
+
+
+def powerlaw_integral(e1, e2, index, piv):
+    """
+    Integral of (x/piv)**index from e1 to e2
+    """
+    s = index + 1
+    log_ratio = np.log(e2 / e1)
+
+    if s == 0:
+        return piv * log_ratio
+
+    # expm1 keeps the integral accurate for indices close to -1
+    return piv / s * (e1 / piv) ** s * np.expm1(s * log_ratio)
+
+
+def upper_incomplete_gamma(s, x):
+    """
+    Upper incomplete gamma function Gamma(s, x) for all real s, also
+    for s <= 0 which is not covered by scipy.special.gammaincc.
+    For s < 0 the recurrence Gamma(s, x) = (Gamma(s+1, x) - x**s exp(-x))/s
+    is used, starting from the first s+n >= 0.
+    """
+    x = np.asarray(x, dtype=np.float64)
+
+    if s > 0:
+        return gamma(s) * gammaincc(s, x)
+
+    num_steps = int(np.ceil(-s))
+    s_start = s + num_steps
+
+    if s_start == 0:
+        result = exp1(x)
+    else:
+        result = gamma(s_start) * gammaincc(s_start, x)
+
+    for k in range(1, num_steps + 1):
+        s_k = s_start - k
+        result = (result - x ** s_k * np.exp(-x)) / s_k
+
+    return result
+
+
+def cutoff_powerlaw_integral(e1, e2, index, xc, piv):
+    """
+    Integral of (x/piv)**index * exp(-x/xc) from e1 to e2
+    """
+    s = index + 1
+    return (piv ** (-index) * xc ** s *
+            (upper_incomplete_gamma(s, e1 / xc) -
+             upper_incomplete_gamma(s, e2 / xc)))
+
+
+def _integrate_powerlaw(e1, e2, K, piv, index):
+    return K * powerlaw_integral(e1, e2, index, piv)
+
+
+def _integrate_cutoff_powerlaw(e1, e2, K, piv, index, xc):
+    if xc <= 0:
+        return None
+
+    return K * cutoff_powerlaw_integral(e1, e2, index, xc, piv)
+
+
+def _integrate_broken_powerlaw(e1, e2, K, xb, alpha, beta, piv):
+    factor = (xb / piv) ** (alpha - beta)
+
+    low_e2 = np.minimum(e2, xb)
+    high_e1 = np.maximum(e1, xb)
+
+    low = np.where(e1 < xb, powerlaw_integral(e1, low_e2, alpha, piv), 0.0)
+    high = np.where(e2 > xb,
+                    factor * powerlaw_integral(high_e1, e2, beta, piv), 0.0)
+
+    return K * (low + high)
+
+
+def _integrate_band(e1, e2, K, alpha, xp, beta, piv):
+    if alpha < beta or 2 + alpha <= 0:
+        return None
+
+    E0 = xp / (2 + alpha)
+    break_point = (alpha - beta) * E0
+    factor_ab = np.exp(beta - alpha) * (break_point / piv) ** (alpha - beta)
+
+    low_e2 = np.minimum(e2, break_point)
+    high_e1 = np.maximum(e1, break_point)
+
+    low = np.where(
+        e1 < break_point,
+        cutoff_powerlaw_integral(e1, low_e2, alpha, E0, piv),
+        0.0
+    )
+    high = np.where(
+        e2 > break_point,
+        factor_ab * powerlaw_integral(high_e1, e2, beta, piv),
+        0.0
+    )
+
+    return K * (low + high)
+
+
+def _sbpl_antiderivative(u, s, e):
+    """
+    Antiderivative of u**(s-1) / (1 + u**e)
+    """
+    c = s / e
+    return u ** s / s * hyp2f1(1, c, 1 + c, -u ** e)
+
+
+def _integrate_sbpl(e1, e2, K, alpha, xb, beta):
+    """
+    Integral of K / ((x/xb)**alpha + (x/xb)**beta). Below the break the
+    term with the smaller exponent is factored out and above the break
+    the one with the larger exponent, so the argument of the
+    hypergeometric function stays in [-1, 0].
+    """
+    m = min(alpha, beta)
+    M = max(alpha, beta)
+    D = M - m
+
+    if D == 0:
+        return K / 2 * powerlaw_integral(e1, e2, -alpha, xb)
+
+    c_low = (1 - m) / D
+    c_high = (M - 1) / D
+
+    # poles of the hypergeometric function, use the numerical integration
+    if m == 1 or M == 1:
+        return None
+    for c in (c_low, c_high):
+        if 1 + c <= 0 and float(1 + c).is_integer():
+            return None
+
+    u1 = e1 / xb
+    u2 = e2 / xb
+
+    def low(u):
+        return _sbpl_antiderivative(u, 1 - m, D)
+
+    def high(u):
+        return _sbpl_antiderivative(u, 1 - M, -D)
+
+    one = np.ones(1)
+
+    result = np.where(
+        u2 <= 1,
+        low(np.minimum(u2, 1)) - low(np.minimum(u1, 1)),
+        np.where(
+            u1 >= 1,
+            high(np.maximum(u2, 1)) - high(np.maximum(u1, 1)),
+            (low(one) - low(np.minimum(u1, 1)) +
+             high(np.maximum(u2, 1)) - high(one))
+        )
+    )
+
+    return K * xb * result
+
+
+# closed form bin integrals of the spectral shapes, by astromodels name
+analytic_integrals = {
+    "Powerlaw": _integrate_powerlaw,
+    "Cutoff_powerlaw": _integrate_cutoff_powerlaw,
+    "Broken_powerlaw": _integrate_broken_powerlaw,
+    "Band": _integrate_band,
+    "SBPL": _integrate_sbpl,
+}
+
+
+class SpectralIntegrator:
+    """
+    Integrate spectral models over the input energy bins of the responses.
+    Closed form integrals are used for the standard spectral shapes
+    (Powerlaw, Cutoff_powerlaw, Broken_powerlaw, Band and SBPL), all other
+    models are integrated with the Simpson rule.
+    """
+
+    def __init__(self, ebin_edges, method="analytic"):
+        """
+        :param ebin_edges: edges of the input energy bins
+        :param method: "analytic" (closed form if possible, else Simpson),
+        "simpson" or "trapz" (two point trapezoidal rule)
+        """
+        assert method in valid_integration_methods, \
+            f"method must be one of {valid_integration_methods}"
+
+        self._method = method
+
+        ebin_edges = np.asarray(ebin_edges, dtype=np.float64)
+
+        self._e1 = ebin_edges[:-1]
+        self._e2 = ebin_edges[1:]
+        self._widths = self._e2 - self._e1
+        self._num_ebins = len(self._widths)
+
+        # edges and centers, to evaluate the models in one call
+        self._simpson_energies = np.concatenate(
+            (ebin_edges, (self._e1 + self._e2) / 2)
+        )
+        self._ebin_edges = ebin_edges
+
+    def __call__(self, model):
+        """
+        Integrate the model over all energy bins
+        :param model: astromodels function
+        :returns: array with the integrated flux in every bin
+        """
+        if self._method == "analytic":
+            integral_func = analytic_integrals.get(model.name)
+
+            if integral_func is not None:
+                params = {
+                    name: param.value
+                    for name, param in model.parameters.items()
+                }
+                binned_spec = integral_func(self._e1, self._e2, **params)
+
+                if binned_spec is not None:
+                    return binned_spec
+
+        if self._method == "trapz":
+            spec = model(self._ebin_edges)
+            return self._widths * (spec[:-1] + spec[1:]) / 2
+
+        spec = model(self._simpson_energies)
+        edges = spec[:self._num_ebins + 1]
+        centers = spec[self._num_ebins + 1:]
+
+        return self._widths / 6 * (edges[:-1] + 4 * centers + edges[1:])
+
+    @property
+    def method(self):
+        return self._method
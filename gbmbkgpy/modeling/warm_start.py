@@ -0,0 +1,174 @@
+import collections
+
+import h5py
+import numpy as np
+from astromodels import Truncated_gaussian
+
+from gbmbkgpy.modeling.new_astromodels import Truncated_student_t
+
+valid_warm_start_distributions = ["student_t", "gaussian"]
+
+
+def load_posterior_samples(previous):
+    """
+    Get the posterior samples of a previous fit
+    :param previous: ModelDet/ModelCombine with samples (e.g. after
+    load_fit), dict with the samples of every parameter or path of an
+    exported result hdf5 file. The result files only contain the best fit
+    values, they are used as samples without spread.
+    :returns: OrderedDict with the samples of every parameter
+    """
+    if hasattr(previous, "samples"):
+        return collections.OrderedDict(previous.samples)
+
+    if isinstance(previous, dict):
+        return collections.OrderedDict(previous)
+
+    with h5py.File(previous, "r") as f:
+        param_names = f.attrs["param_names"]
+        best_fit_values = f.attrs["best_fit_values"]
+
+    return collections.OrderedDict(
+        (str(name), np.array([value]))
+        for name, value in zip(param_names, best_fit_values)
+    )
+
+
+def posterior_summary(samples):
+    """
+    Robust center and width of the posterior of every parameter
+    :param samples: dict with the samples of every parameter
+    :returns: OrderedDict with (median, width) of every parameter, the width
+    is half of the central 68% interval
+    """
+    summary = collections.OrderedDict()
+    for name, values in samples.items():
+        low, median, high = np.percentile(values, [16, 50, 84])
+        summary[name] = (median, (high - low) / 2)
+
+    return summary
+
+
+def _prior_bounds(parameter):
+    """
+    Bounds of the current prior of the parameter, if the prior has bounds,
+    otherwise the bounds of the parameter
+    """
+    lower = parameter.min_value if parameter.min_value is not None else -np.inf
+    upper = parameter.max_value if parameter.max_value is not None else np.inf
+
+    prior = parameter.prior
+    if prior is not None and hasattr(prior, "lower_bound"):
+        lower = max(lower, prior.lower_bound.value)
+        upper = min(upper, prior.upper_bound.value)
+
+    return lower, upper
+
+
+def set_warm_start_priors(
+    parameters,
+    previous,
+    inflation=2.0,
+    distribution="student_t",
+    nu=4.0,
+    min_rel_width=0.01,
+):
+    """
+    Set informative priors centered on the posterior of a previous fit
+    (e.g. of the day before). The priors are wider than the previous
+    posterior and truncated to the bounds of the old priors, so the fit can
+    still move away if the background changed.
+    :param parameters: dict with the parameters of the model
+    :param previous: previous fit, see load_posterior_samples
+    :param inflation: factor between the prior width and the width of the
+    previous posterior
+    :param distribution: "student_t" (robust, heavy tails) or "gaussian"
+    :param nu: degrees of freedom of the student_t priors
+    :param min_rel_width: min width of the priors relative to the center
+    :returns: OrderedDict with the old prior and the (center, width) of the
+    new prior of every warm started parameter. Parameters not in the
+    previous fit keep their priors.
+    """
+    assert distribution in valid_warm_start_distributions, \
+        f"distribution must be one of {valid_warm_start_distributions}"
+
+    summary = posterior_summary(load_posterior_samples(previous))
+
+    warm_start = collections.OrderedDict()
+
+    for name, parameter in parameters.items():
+        if name not in summary:
+            continue
+
+        center, width = summary[name]
+        lower, upper = _prior_bounds(parameter)
+
+        width = max(inflation * width, min_rel_width * abs(center), 1e-12)
+        center = np.clip(center, lower, upper)
+
+        if distribution == "student_t":
+            prior = Truncated_student_t(
+                mu=center, sigma=width, nu=nu,
+                lower_bound=lower, upper_bound=upper
+            )
+        else:
+            prior = Truncated_gaussian(
+                mu=center, sigma=width, lower_bound=lower, upper_bound=upper
+            )
+
+        warm_start[name] = {
+            "old_prior": parameter.prior,
+            "center": center,
+            "width": width,
+            "bounds": (lower, upper),
+        }
+
+        parameter.prior = prior
+
+    return warm_start
+
+
+def warm_start_diagnostics(samples, warm_start, max_pull=3.0,
+                           max_bound_fraction=0.05):
+    """
+    Check if the posterior of a warm started fit is consistent with its
+    priors. A large pull (distance of the posterior median from the prior
+    center in prior widths) or many samples at the truncation bounds of the
+    prior show that the prior constrained the fit, e.g. because the
+    background changed between the days, and the fit should be repeated
+    with the broad priors.
+    :param samples: dict with the posterior samples of every parameter
+    :param warm_start: return value of set_warm_start_priors
+    :returns: dict with the diagnostics of every parameter, the names of the
+    flagged parameters and if the warm start looks ok
+    """
+    parameters = collections.OrderedDict()
+    flagged = []
+
+    for name, info in warm_start.items():
+        values = samples[name]
+        median, width = posterior_summary({name: values})[name]
+
+        lower, upper = info["bounds"]
+        margin = 1e-3 * (upper - lower) if np.isfinite(upper - lower) else 0.0
+
+        pull = abs(median - info["center"]) / info["width"]
+        width_ratio = width / info["width"]
+        bound_fraction = np.mean(
+            (values <= lower + margin) | (values >= upper - margin)
+        )
+
+        parameters[name] = {
+            "pull": pull,
+            "width_ratio": width_ratio,
+            "bound_fraction": bound_fraction,
+        }
+
+        if pull > max_pull or bound_fraction > max_bound_fraction:
+            flagged.append(name)
+
+    return {
+        "parameters": parameters,
+        "flagged": flagged,
+        "warm_start_ok": len(flagged) == 0,
+    }
@@ -1,5 +1,13 @@
+import warnings as custom_warnings
+
+import numba
 import numpy as np
 from gbm_drm_gen.drmgen import DRMGen
+from gbm_drm_gen.matrix_functions import (
+    echan_integrator,
+    highres_ephoton_interpolator,
+    trfind,
+)
 
 from gbmbkgpy.response.response import ResponseGenerator
 
@@ -20,6 +28,66 @@ valid_det_names = [
     "b1",
 ]
 
+# internals of the DRMGen (gbm_drm_gen 1.2) used by the batch kernel
+_drm_gen_attributes = ("_database_nb", "_in_edge", "_ein", "_out_edge",
+                       "_nobins_in", "_nobins_out", "_matrix_type")
+_database_attributes = ("grid_points_list", "rsps", "milliaz", "millizen",
+                        "epx_lo", "epx_hi", "ichan")
+
+
+def _batch_kernel_supported(drm_gen):
+    """
+    Check if the DRMs of a DRMGen can be built from the cached DRMs of the
+    database grid points. This needs the DRMGen internals listed above and
+    only works for the direct matrix (mat_type=0), the atmospheric
+    scattering is not linear in the database matrices.
+    """
+    if not all(hasattr(drm_gen, attr) for attr in _drm_gen_attributes):
+        return False
+
+    if not all(hasattr(drm_gen._database_nb, attr)
+               for attr in _database_attributes):
+        return False
+
+    return drm_gen._matrix_type == 0
+
+
+@numba.njit(parallel=True)
+def _sky_interpolation_numba(az, el, grid_points):
+    """
+    Triangle of database grid points and normalized interpolation weights
+    for every direction, like the sky interpolation of the DRMGen
+    """
+    num = len(az)
+
+    indices = np.empty((num, 3), dtype=np.int64)
+    weights = np.empty((num, 3))
+
+    sf = np.arctan(1.0) / 45.0
+
+    for n in numba.prange(num):
+        plat = el[n] * sf
+        plon = az[n] * sf
+
+        point = np.array([np.cos(plat) * np.cos(plon),
+                          np.cos(plat) * np.sin(plon),
+                          np.sin(plat)])
+
+        b1, b2, b3, i1, i2, i3 = trfind(point, grid_points)
+
+        norm = b1 + b2 + b3
+
+        indices[n, 0] = i1
+        indices[n, 1] = i2
+        indices[n, 2] = i3
+
+        weights[n, 0] = b1 / norm
+        weights[n, 1] = b2 / norm
+        weights[n, 2] = b3 / norm
+
+    return indices, weights
+
+
 class GBMResponseGenerator(ResponseGenerator):
 
     def __init__(self, geometry, Ebins_in_edge, data):
@@ -29,12 +97,18 @@ class GBMResponseGenerator(ResponseGenerator):
 
         super().__init__(geometry, Ebins_in_edge, self._echans_mask.shape[0])
 
+        # matrix to sum the channels of the echans with one dot product
+        self._echan_sum_matrix = self._echans_mask.T.astype(np.float64)
+
         # detector name <-> number convention for GBM
 
         # assert det in valid_det_names
 
         det_num = np.argwhere(np.array(valid_det_names) == data.det)[0, 0]
 
+        self._det = data.det
+        self._Ebins_out_edge = Ebins_out_edge
+
         self._drm_gen_no_occult = DRMGen(
             self._geometry._position_interpolator,
             det_num,
@@ -45,23 +119,130 @@ class GBMResponseGenerator(ResponseGenerator):
             time=geometry._position_interpolator.time[1]
             )
 
+        # DRMs of the grid points of the database, built on demand
+        self._grid_responses = None
+        self._grid_response_built = None
+
+        if not _batch_kernel_supported(self._drm_gen_no_occult):
+            custom_warnings.warn(
+                "The installed gbm_drm_gen is not supported by the batch "
+                "response kernel, the responses are built direction by "
+                "direction."
+            )
+
     def calc_response_az_zen(self, az, zen):
         """
         calc response matrix for a given position in detector frame
         defined by az and zen
         :returns: response matrix
         """
+        return self.calc_response_az_zen_batch(az, zen)[0]
 
+    def calc_response_az_zen_batch(self, az, zen):
+        """
+        calc response matrices for many positions in detector frame
+        defined by az and zen. Without atmospheric scattering the DRM of a
+        position is the weighted sum of the DRMs of three grid points of
+        the response database (the energy interpolation and integration
+        are linear in the database matrix). The DRMs of the grid points are
+        built once, summed in the echans and cached, so a batch only needs
+        the sky interpolation of all positions and one weighted sum.
+        If the DRMGen does not support this, every DRM is built on its own.
+        :returns: response matrices (N, N_Ein, N_echan)
+        """
+        az = np.atleast_1d(np.asarray(az, dtype=np.float64))
+        zen = np.atleast_1d(np.asarray(zen, dtype=np.float64))
+
+        if not _batch_kernel_supported(self._drm_gen_no_occult):
+            return self._calc_responses_per_direction(az, zen)
+
+        database = self._drm_gen_no_occult._database_nb
+
+        indices, weights = _sky_interpolation_numba(
+            az, zen, database.grid_points_list
+        )
+
+        grid_responses = self._get_grid_responses(np.unique(indices))
+
+        return np.einsum("nk,nkij->nij", weights, grid_responses[indices])
+
+    def _calc_responses_per_direction(self, az, zen):
+        """
+        Build the DRM of every position with the DRMGen and sum the echans
+        :returns: response matrices (N, N_Ein, N_echan)
+        """
+        rsp = self._drm_gen_no_occult
+
+        responses = np.empty((len(az), len(self._Ebins_in_edge) - 1,
+                              self._num_ebins_out))
+
+        for i in range(len(az)):
+            drm = rsp._make_drm_numba(az[i], zen[i], rsp._geo_az, rsp._geo_el)
+            np.dot(drm, self._echan_sum_matrix, out=responses[i])
+
+        return responses
+
+    def _get_grid_responses(self, grid_indices):
+        """
+        DRMs of the grid points of the response database, summed in the
+        echans. Only the missing grid points are built.
+        :returns: array (N_grid, N_Ein, N_echan) with all built grid points
+        """
         rsp = self._drm_gen_no_occult
+        database = rsp._database_nb
+
+        if self._grid_responses is None:
+            self._grid_responses = np.zeros(
+                (len(database.grid_points_list), rsp._nobins_in,
+                 self._num_ebins_out)
+            )
+            self._grid_response_built = np.zeros(
+                len(database.grid_points_list), dtype=bool
+            )
 
-        mat = rsp.to_3ML_response_direct_sat_coord(az, zen).matrix.T
+        # photon energies of the DRMGen: the input edges and the
+        # logarithmic centers of the input bins
+        tmp_phot_bin = np.zeros(2 * rsp._nobins_in + rsp._nobins_in % 2)
+        tmp_phot_bin[::2] = rsp._in_edge[:-1]
+        tmp_phot_bin[1::2] = 10 ** (
+            (np.log10(rsp._in_edge[:-1]) + np.log10(rsp._in_edge[1:])) / 2.0
+        )
+
+        for i in grid_indices[~self._grid_response_built[grid_indices]]:
+            matrix = database.rsps[
+                database.milliaz[i] + "_" + database.millizen[i]
+            ]
+
+            new_epx_lo, new_epx_hi, diff_matrix = highres_ephoton_interpolator(
+                tmp_phot_bin, rsp._ein, matrix, database.epx_lo,
+                database.epx_hi, 64
+            )
+            binned_matrix = echan_integrator(
+                diff_matrix, new_epx_lo, new_epx_hi, database.ichan,
+                rsp._out_edge
+            )
+
+            # integrate the photon energies with the trapezoidal rule
+            drm = np.zeros((rsp._nobins_in, rsp._nobins_out))
+            drm[:-1, :] = (
+                binned_matrix[::2, :][:-1, :] / 2.0
+                + binned_matrix[1::2, :][:-1, :]
+                + binned_matrix[2::2, :] / 2.0
+            ) / 2.0
 
-        # sum the responses needed
-        response_final = np.zeros((mat.shape[0], self._echans_mask.shape[0]))
+            # sum the responses needed
+            np.dot(drm, self._echan_sum_matrix, out=self._grid_responses[i])
 
-        for i, echan_mask in enumerate(self._echans_mask):
-            for j, entry in enumerate(echan_mask):
-                if entry:
-                    response_final[:, i] += mat[:, j]
+            self._grid_response_built[i] = True
 
-        return response_final
+        return self._grid_responses
+
+    @property
+    def cache_key(self):
+        """
+        Everything that defines the responses in the detector frame,
+        besides the input energy bins
+        """
+        return (self._det.encode() +
+                self._echans_mask.tobytes() +
+                np.asarray(self._Ebins_out_edge, dtype=np.float64).tobytes())
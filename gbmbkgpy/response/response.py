@@ -1,4 +1,4 @@
-from collections import Iterable
+from collections.abc import Iterable
 import numpy as np
 
 
@@ -17,6 +17,62 @@ class ResponseGenerator:
         """
         raise NotImplementedError("Has to be implenemented in subclass")
 
+    def calc_response_az_zen_batch(self, az, zen):
+        """
+        calc response matrices for many positions in detector frame
+        defined by az and zen. Subclasses should overwrite this with a
+        real batched implementation, this fallback loops over the positions.
+        :returns: response matrices (N, N_Ein, N_Eout)
+        """
+        az = np.atleast_1d(az)
+        zen = np.atleast_1d(zen)
+
+        responses = np.zeros((len(az),
+                              len(self._Ebins_in_edge)-1,
+                              self._num_ebins_out))
+
+        for i, (a, z) in enumerate(zip(az, zen)):
+            responses[i] = self.calc_response_az_zen(a, z)
+
+        return responses
+
+    def calc_response_ra_dec_batch(self, times, ra, dec, occult=True):
+        """
+        calc response matrices for many sources in ICRS and many times.
+        The occultation of all sources and times is checked at once and
+        the responses of occulted sources are zero.
+        :param times: times of interest (array or float)
+        :param ra: ra of the sources (array or float)
+        :param dec: dec of the sources (array or float)
+        :param occult: Check if the sources are occulted by the earth
+        :returns: response matrices (N_times, N_src, N_Ein, N_Eout)
+        """
+        times = np.atleast_1d(times)
+        ra = np.atleast_1d(ra)
+        dec = np.atleast_1d(dec)
+
+        if occult:
+            visible = self._geometry.visibility(times, ra, dec)
+        else:
+            visible = np.ones((len(times), len(ra)), dtype=bool)
+
+        responses = np.zeros((len(times),
+                              len(ra),
+                              len(self._Ebins_in_edge)-1,
+                              self._num_ebins_out))
+
+        for i, time in enumerate(times):
+            if not np.any(visible[i]):
+                continue
+
+            az, zen = self._geometry.icrs_to_satellite(time,
+                                                       ra[visible[i]],
+                                                       dec[visible[i]])
+
+            responses[i, visible[i]] = self.calc_response_az_zen_batch(az, zen)
+
+        return responses
+
     def calc_response_ra_dec(self, ra, dec, time, occult):
 
         if occult:
@@ -53,6 +109,25 @@ class ResponseGenerator:
 
         return self.calc_response_az_zen(az, zen)
 
+    def calc_response_xyz_batch(self, points):
+        """
+        calc response matrices for many positions in detector frame
+        defined by x,y and z
+        :param points: array (N, 3)
+        :returns: response matrices (N, N_Ein, N_Eout)
+        """
+        points = np.atleast_2d(points)
+        norm_vec = points / np.linalg.norm(points, axis=1)[:, np.newaxis]
+
+        zen = np.rad2deg(np.arcsin(norm_vec[:, 2]))
+        az = np.rad2deg(np.arctan2(norm_vec[:, 1], norm_vec[:, 0]))
+
+        return self.calc_response_az_zen_batch(az, zen)
+
+    @property
+    def geometry(self):
+        return self._geometry
+
     @property
     def Ebins_in_edge(self):
         return self._Ebins_in_edge
@@ -1,7 +1,12 @@
+import os
+import hashlib
+import collections
 import numpy as np
 
 from gbmbkgpy.utils.progress_bar import progress_bar
 from gbmbkgpy.utils.mpi import check_mpi
+from gbmbkgpy.io.package_data import get_path_of_external_data_dir
+from gbmbkgpy.utils.checkpoint import input_hash
 
 using_mpi, rank, size, comm = check_mpi()
 
@@ -31,15 +36,67 @@ def fibonacci_sphere(samples=1):
     return np.array(points)
 
 
+def points_to_az_zen(points):
+    """
+    Directions of points in the detector frame
+    :param points: array (N, 3)
+    :returns: az, zen in degree
+    """
+    norm_vec = points / np.linalg.norm(points, axis=1)[:, np.newaxis]
+
+    zen = np.rad2deg(np.arcsin(norm_vec[:, 2]))
+    az = np.rad2deg(np.arctan2(norm_vec[:, 1], norm_vec[:, 0]))
+
+    return az, zen
+
+
+def _generator_checkpoint_inputs(response_generator):
+    """
+    Inputs that define the responses of a response generator
+    """
+    return [
+        type(response_generator).__name__,
+        np.asarray(response_generator.Ebins_in_edge, dtype=np.float64),
+        response_generator.num_ebins_out,
+        getattr(response_generator, "cache_key", b""),
+    ]
+
+
 class ResponsePrecalculation:
 
-    def __init__(self, response_generator, Ngrid=40000):
+    def __init__(self, response_generator, Ngrid=40000, checkpoint=None):
+        """
+        :param response_generator: ResponseGenerator object
+        :param Ngrid: number of grid points
+        :param checkpoint: CheckpointStore, the responses of every part
+        of 4000 points are saved there and a restarted run only
+        calculates the missing parts
+        """
         self._response_generator = response_generator
         self._Ngrid = Ngrid
+        self._checkpoint = checkpoint
 
         self._points = fibonacci_sphere(samples=Ngrid)
         self._calculate_responses()
 
+    @classmethod
+    def from_response_grid(cls, response_generator, points, response_array):
+        """
+        Create the object from an already calculated response grid, e.g. of
+        a MultiDetResponsePrecalculation
+        :param points: grid points (Ngrid, 3)
+        :param response_array: responses of the grid points multiplied with
+        the area per point (Ngrid, N_Ein, N_Eout)
+        """
+        obj = cls.__new__(cls)
+
+        obj._response_generator = response_generator
+        obj._Ngrid = len(points)
+        obj._points = points
+        obj._response_array = response_array
+
+        return obj
+
     def _calculate_responses(self):
         """
         Function to calculate the responses from all the points on the unit sphere.
@@ -54,6 +111,11 @@ class ResponsePrecalculation:
         else:
             endpoint_per_run = np.array([self._Ngrid])
 
+        if self._checkpoint is not None:
+            checkpoint_key = input_hash(
+                self._Ngrid, *_generator_checkpoint_inputs(self._response_generator)
+            )
+
         responses_all_split = []
         num_calcs = len(endpoint_per_run)
         for i, endpoint in enumerate(endpoint_per_run):
@@ -63,6 +125,14 @@ class ResponsePrecalculation:
             else:
                 startpoint = endpoint_per_run[i-1]
 
+            # this part was already calculated before a restart
+            if (self._checkpoint is not None and
+                    self._checkpoint.exists("response", checkpoint_key, i)):
+                responses_all_split.append(
+                    self._checkpoint.load("response", checkpoint_key, i)["responses"]
+                )
+                continue
+
             points_per_rank = float(endpoint-startpoint) / float(size)
             points_lower_index = (int(np.floor(points_per_rank * rank)) +
                                   startpoint)
@@ -80,19 +150,28 @@ class ResponsePrecalculation:
                     "All other should be about the same.",
                     hidden=hidden,
             ) as p:
-                for point in self._points[
-                        points_lower_index:points_upper_index
-                ]:
-                    # get the response of every point
-                    matrix = self._response_generator.calc_response_xyz(
-                        point[0], point[1], point[2]
+                # get the responses of the points in small batches
+                for batch_start in range(points_lower_index,
+                                         points_upper_index, 100):
+                    batch_stop = min(batch_start + 100, points_upper_index)
+
+                    responses.append(
+                        self._response_generator.calc_response_xyz_batch(
+                            self._points[batch_start:batch_stop]
+                        )
                     )
 
-                    responses.append(matrix)
+                    for _ in range(batch_stop - batch_start):
+                        p.increase()
 
-                    p.increase()
-
-            responses = np.array(responses)
+            if len(responses) > 0:
+                responses = np.concatenate(responses)
+            else:
+                responses = np.zeros(
+                    (0,
+                     len(self._response_generator.Ebins_in_edge) - 1,
+                     self._response_generator.num_ebins_out)
+                )
             if using_mpi:
                 responses_g = comm.gather(responses, root=0)
                 if rank == 0:
@@ -101,6 +180,10 @@ class ResponsePrecalculation:
                 # broadcast the resulting list to all ranks
                 responses = comm.bcast(responses_g, root=0)
 
+            if self._checkpoint is not None:
+                self._checkpoint.save("response", checkpoint_key,
+                                      {"responses": responses}, i)
+
             responses_all_split.append(responses)
 
         # mult with area per point
@@ -113,3 +196,226 @@ class ResponsePrecalculation:
     @property
     def drm_gen(self):
         return self._response_generator
+
+
+class MultiDetResponsePrecalculation:
+
+    def __init__(self, response_generators, Ngrid=40000, use_cache=True,
+                 checkpoint=None):
+        """
+        Response precalculation for several detectors at once. The grid
+        points and their directions are only calculated once and the
+        (detector, point batch) work items are split between the MPI ranks.
+        :param response_generators: dict with detector name and
+        response generator
+        :param Ngrid: number of grid points
+        :param use_cache: Save the response grids of all detectors in one
+        cache file in $GBMDATA/cache/response and load them from there next
+        time. Needs a cache_key of the response generators.
+        :param checkpoint: CheckpointStore, the responses of every part
+        of 4000 points are saved there and a restarted run only
+        calculates the missing parts
+        """
+        self._response_generators = collections.OrderedDict(response_generators)
+        self._Ngrid = Ngrid
+        self._checkpoint = checkpoint
+
+        self._points = fibonacci_sphere(samples=Ngrid)
+
+        self._use_cache = use_cache and all(
+            hasattr(gen, "cache_key") for gen in self._response_generators.values()
+        )
+
+        response_arrays = None
+
+        if self._use_cache:
+            response_arrays = self._load_cache()
+
+        if response_arrays is None:
+            response_arrays = self._calculate_responses()
+
+            if self._use_cache and rank == 0:
+                self._save_cache(response_arrays)
+
+        self._precalculations = collections.OrderedDict()
+        for det, gen in self._response_generators.items():
+            self._precalculations[det] = ResponsePrecalculation.from_response_grid(
+                gen, self._points, response_arrays[det]
+            )
+
+    def _calculate_responses(self):
+        """
+        Calculate the responses of all detectors for all grid points.
+        The directions of the grid points are shared by all detectors.
+        """
+        az, zen = points_to_az_zen(self._points)
+
+        dets = list(self._response_generators.keys())
+
+        response_arrays = collections.OrderedDict()
+        for det, gen in self._response_generators.items():
+            response_arrays[det] = np.zeros(
+                (self._Ngrid, len(gen.Ebins_in_edge) - 1, gen.num_ebins_out)
+            )
+
+        # we have to split the calc in several parts in case we are using mpi
+        endpoint_per_run = np.append(
+            np.arange(4000, self._Ngrid, 4000, dtype=int), self._Ngrid
+        )
+
+        if self._checkpoint is not None:
+            checkpoint_key = input_hash(self._Ngrid, [
+                [det] + _generator_checkpoint_inputs(gen)
+                for det, gen in self._response_generators.items()
+            ])
+
+        num_calcs = len(endpoint_per_run)
+        for i, endpoint in enumerate(endpoint_per_run):
+            startpoint = 0 if i == 0 else endpoint_per_run[i - 1]
+
+            # this part was already calculated before a restart
+            if (self._checkpoint is not None and
+                    self._checkpoint.exists("multi_det_response",
+                                            checkpoint_key, i)):
+                part = self._checkpoint.load("multi_det_response",
+                                             checkpoint_key, i)
+                for det in dets:
+                    response_arrays[det][startpoint:endpoint] = part[det]
+                continue
+
+            # work items of this part: (detector, first point, last point)
+            work_items = [
+                (det_idx, batch_start, min(batch_start + 100, endpoint))
+                for det_idx in range(len(dets))
+                for batch_start in range(startpoint, endpoint, 100)
+            ]
+
+            items_per_rank = float(len(work_items)) / float(size)
+            items_lower_index = int(np.floor(items_per_rank * rank))
+            items_upper_index = int(np.floor(items_per_rank * (rank + 1)))
+
+            # Only rank==0 gives some output how much of the geometry is
+            # already calculated (progress_bar)
+            hidden = False if rank == 0 else True
+
+            results = []
+
+            with progress_bar(
+                    items_upper_index - items_lower_index,
+                    title=f"Calculating response calc {i+1} out of {num_calcs} "
+                    f"for {len(dets)} detectors. "
+                    f"This shows the progress of rank {rank}. "
+                    "All other should be about the same.",
+                    hidden=hidden,
+            ) as p:
+                for det_idx, start, stop in work_items[items_lower_index:
+                                                       items_upper_index]:
+                    gen = self._response_generators[dets[det_idx]]
+
+                    results.append(
+                        (det_idx, start, stop,
+                         gen.calc_response_az_zen_batch(az[start:stop],
+                                                        zen[start:stop]))
+                    )
+
+                    p.increase()
+
+            if using_mpi:
+                results_g = comm.gather(results, root=0)
+                if rank == 0:
+                    results_g = [r for results in results_g for r in results]
+
+                # broadcast the resulting list to all ranks
+                results = comm.bcast(results_g, root=0)
+
+            for det_idx, start, stop, responses in results:
+                response_arrays[dets[det_idx]][start:stop] = responses
+
+            if self._checkpoint is not None:
+                self._checkpoint.save(
+                    "multi_det_response", checkpoint_key,
+                    {det: response_arrays[det][startpoint:endpoint]
+                     for det in dets},
+                    i
+                )
+
+        # mult with area per point
+        for det in dets:
+            response_arrays[det] *= 4 * np.pi / self._Ngrid
+
+        return response_arrays
+
+    def _cache_path(self):
+        """
+        One cache file per configuration of grid and response generators
+        """
+        config_hash = hashlib.md5(str(self._Ngrid).encode())
+        for det, gen in self._response_generators.items():
+            config_hash.update(det.encode())
+            config_hash.update(np.asarray(gen.Ebins_in_edge, dtype=np.float64).tobytes())
+            config_hash.update(gen.cache_key)
+
+        return (get_path_of_external_data_dir() / "cache" / "response" /
+                f"multi_det_{config_hash.hexdigest()[:16]}.npz")
+
+    def _load_cache(self):
+        cache_path = self._cache_path()
+
+        # rank 0 decides, so all ranks either load or calculate
+        cache_exists = cache_path.exists()
+        if using_mpi:
+            cache_exists = comm.bcast(cache_exists, root=0)
+
+        if not cache_exists:
+            return None
+
+        with np.load(cache_path) as cache:
+            return collections.OrderedDict(
+                (det, cache[det]) for det in self._response_generators.keys()
+            )
+
+    def _save_cache(self, response_arrays):
+        cache_path = self._cache_path()
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = cache_path.with_suffix(f".tmp{os.getpid()}")
+
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **response_arrays)
+
+        os.replace(tmp_path, cache_path)
+
+    def __getitem__(self, det):
+        return self._precalculations[det]
+
+    @property
+    def precalculations(self):
+        """
+        ResponsePrecalculation object of every detector
+        """
+        return self._precalculations
+
+    @property
+    def response_grids(self):
+        """
+        dict with the response grid of every detector
+        """
+        return collections.OrderedDict(
+            (det, prec.response_grid) for det, prec in self._precalculations.items()
+        )
+
+    @property
+    def response_tensor(self):
+        """
+        Response grids of all detectors (N_det, Ngrid, N_Ein, N_Eout)
+        """
+        return np.stack([prec.response_grid
+                         for prec in self._precalculations.values()])
+
+    @property
+    def detectors(self):
+        return list(self._response_generators.keys())
+
+    @property
+    def points(self):
+        return self._points
@@ -36,16 +36,11 @@ class PointSourceResponse:
         self._num_ebins_out = self._rsp_gen.num_ebins_out
         self._Ebins_in_edge = self._rsp_gen.Ebins_in_edge
 
-        responses = np.zeros((len(self._times),
-                              len(self._rsp_gen._Ebins_in_edge)-1,
-                              self._rsp_gen._num_ebins_out
-                              ))
-
-        for i, time in enumerate(self._times):
-            responses[i] = self._rsp_gen.calc_response_ra_dec(self._ra,
-                                                              self._dec,
-                                                              time,
-                                                              occult=True)
+        # the responses of the times where the source is occulted are zero
+        responses = self._rsp_gen.calc_response_ra_dec_batch(self._times,
+                                                             self._ra,
+                                                             self._dec,
+                                                             occult=True)[:, 0]
 
         self._effective_response_interp = interp1d(self._times,
                                                    responses,
@@ -159,15 +154,13 @@ class EarthCGBResponse(ExtendedSourceResponse):
         # get az, el of grid points
         azs, els = cart2ang(grid_points_pos_norm_vec)
 
-        for k, time in enumerate(interp_times):
-
-            ras, decs = geom.satellite_to_icrs(time, azs, els)
-            occulted = geom.is_occulted(time, ras, decs)
+        # occultation of all grid points for all times at once
+        visible = geom.visibility_satellite_frame(interp_times, azs, els)
 
-            if kind == "earth albedo":
-                weights[k, occulted] = 1
-            else:
-                weights[k, ~occulted] = 1
+        if kind == "earth albedo":
+            weights[~visible] = 1
+        else:
+            weights[visible] = 1
 
         return weights
 
@@ -212,16 +205,16 @@ class GalacticCenterResponse(ExtendedSourceResponse):
         # get az, el of grid points
         azs, els = cart2ang(grid_points_pos_norm_vec)
 
-        for k, time in enumerate(interp_times):
+        # occultation of all grid points for all times at once
+        visible = geom.visibility_satellite_frame(interp_times, azs, els)
 
-            ras, decs = geom.satellite_to_icrs(time, azs, els)
-            occulted = geom.is_occulted(time, ras, decs)
+        for k, time in enumerate(interp_times):
 
             l, b = geom.satellite_to_galactic(time,
-                                              azs[~occulted],
-                                              els[~occulted])
+                                              azs[visible[k]],
+                                              els[visible[k]])
 
-            weights[k, ~occulted] = self._lorentzian(l, b)
+            weights[k, visible[k]] = self._lorentzian(l, b)
 
         return weights
 
@@ -13,7 +13,6 @@ from gbm_drm_gen.drmgen import DRMGen
 from gbmbkgpy.io.downloading import (
     download_data_file,
     download_flares,
-    download_lat_spacecraft,
 )
 from gbmbkgpy.io.file_utils import (
     file_existing_and_readable,
@@ -22,12 +21,12 @@ from gbmbkgpy.io.file_utils import (
 from gbmbkgpy.io.package_data import (
     get_path_of_data_file,
     get_path_of_external_data_dir,
-    get_path_of_external_data_file,
 )
 from gbmbkgpy.utils.progress_bar import progress_bar
 from gbmgeometry import GBMTime, PositionInterpolator, gbm_detector_list
 
 from gbmbkgpy.utils.binner import Rebinner
+from gbmbkgpy.geometry.gbm_geometry import get_lat_mcl
 
 from gbmbkgpy.utils.spectrum import _spec_integral_bpl, _spec_integral_pl
 
@@ -845,92 +844,14 @@ class BackgroundSimulator(object):
         return resp_grid_points, response_array
 
     def _get_mcl_from_lat_file(self):
-        # read the file
         day = astro_time.Time(f"20{self._day[:2]}-{self._day[2:-2]}-{self._day[-2:]}")
 
         min_met = GBMTime(day).met
 
         max_met = GBMTime(day + u.Quantity(1, u.day)).met
 
-        gbm_time = GBMTime(day)
-
-        mission_week = np.floor(gbm_time.mission_week.value)
-
-        filename = "lat_spacecraft_weekly_w%d_p202_v001.fits" % mission_week
-        filepath = get_path_of_external_data_file("lat", filename)
-
-        if not file_existing_and_readable(filepath):
-            download_lat_spacecraft(mission_week)
-
-        # Init all arrays as empty arrays
-        lat_time = np.array([])
-        mc_l = np.array([])
-
-        # lets check that this file has the right info
-
-        week_before = False
-        week_after = False
-
-        with fits.open(filepath) as f:
-
-            if f["PRIMARY"].header["TSTART"] >= min_met:
-
-                # we need to get week before
-
-                week_before = True
-
-                before_filename = "lat_spacecraft_weekly_w%d_p202_v001.fits" % (
-                    mission_week - 1
-                )
-                before_filepath = get_path_of_external_data_file("lat", before_filename)
-                if not file_existing_and_readable(before_filepath):
-                    download_lat_spacecraft(mission_week - 1)
-
-            if f["PRIMARY"].header["TSTOP"] <= max_met:
-
-                # we need to get week after
-
-                week_after = True
-
-                after_filename = "lat_spacecraft_weekly_w%d_p202_v001.fits" % (
-                    mission_week + 1
-                )
-                after_filepath = get_path_of_external_data_file("lat", after_filename)
-                if not file_existing_and_readable(after_filepath):
-                    download_lat_spacecraft(mission_week + 1)
-
-            # first lets get the primary file
-            lat_time = np.mean(
-                np.vstack((f["SC_DATA"].data["START"], f["SC_DATA"].data["STOP"])),
-                axis=0,
-            )
-            mc_l = f["SC_DATA"].data["L_MCILWAIN"]
-
-        # if we need to append anything to make up for the
-        # dates not being included in the files
-        # do it here... thanks Fermi!
-        if week_before:
-            with fits.open(before_filepath) as f:
-                lat_time_before = np.mean(
-                    np.vstack((f["SC_DATA"].data["START"], f["SC_DATA"].data["STOP"])),
-                    axis=0,
-                )
-                mc_l_before = f["SC_DATA"].data["L_MCILWAIN"]
-
-            mc_l = np.append(mc_l_before, mc_l)
-            lat_time = np.append(lat_time_before, lat_time)
-
-        if week_after:
-            with fits.open(after_filepath) as f:
-                lat_time_after = np.mean(
-                    np.vstack((f["SC_DATA"].data["START"], f["SC_DATA"].data["STOP"])),
-                    axis=0,
-                )
-                mc_l_after = f["SC_DATA"].data["L_MCILWAIN"]
-            mc_l = np.append(mc_l, mc_l_after)
-            lat_time = np.append(lat_time, lat_time_after)
-
-        return lat_time, mc_l
+        # read the weekly LAT files from the shared McIlwain L cache
+        return get_lat_mcl(min_met, max_met)
 
     #def _spectrum_pl(self, energy, e_norm, norm, index):
     #    return norm / (energy / e_norm) ** index
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from gbmbkgpy.io.background_index import BackgroundQueryIndex
+
+
+@pytest.mark.run(order=1)
+def test_background_query_index():
+    rng = np.random.default_rng(3)
+
+    # 10 s bins with a gap (e.g. an SAA passage)
+    starts = np.concatenate((np.arange(0, 2000, 10.0), np.arange(3000, 5000, 10.0)))
+    time_bins = np.vstack((starts, starts + 10)).T
+
+    observed_counts = rng.poisson(100, (len(time_bins), 14, 8)).astype(float)
+    model_counts = rng.uniform(90, 110, (len(time_bins), 14, 8))
+    stat_err = rng.uniform(0, 5, (len(time_bins), 14, 8))
+
+    index = BackgroundQueryIndex(time_bins, observed_counts, model_counts, stat_err)
+
+    intervals = [(-5.0, 95.0), (1503.0, 3200.0), (0.0, 5000.0), (4990.0, 5000.0)]
+
+    batch = index.query([i[0] for i in intervals], [i[1] for i in intervals])
+
+    for k, (start, stop) in enumerate(intervals):
+        mask = (time_bins[:, 0] >= start) * (time_bins[:, 1] <= stop)
+
+        single = index.query(start, stop)
+
+        for result in [single, {key: value[k] for key, value in batch.items()}]:
+            assert result["tstart"] == time_bins[mask][0, 0]
+            assert result["telapse"] == time_bins[mask][-1, 1] - time_bins[mask][0, 0]
+            assert np.array_equal(
+                result["observed_counts"], np.sum(observed_counts[mask], axis=0)
+            )
+            assert np.allclose(
+                result["model_counts"], np.sum(model_counts[mask], axis=0), rtol=1e-12
+            )
+            assert np.allclose(
+                result["stat_err"],
+                np.sqrt(np.sum(np.square(stat_err[mask]), axis=0)),
+                rtol=1e-9,
+            )
+
+    with pytest.raises(AssertionError):
+        index.query(2005.0, 2500.0)
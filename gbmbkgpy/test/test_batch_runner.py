@@ -0,0 +1,104 @@
+import json
+import os
+import sys
+
+import pytest
+
+from gbmbkgpy.utils.batch_runner import (
+    BatchRunner,
+    FitScriptTask,
+    date_range,
+    expand_config_matrix,
+)
+
+
+def dummy_fit(date, config, output_dir):
+    if date == "190102" and config["echans"] == ["3"]:
+        raise RuntimeError("no data")
+
+    return {"date": date, "num_dets": len(config["detectors"]), "pid": os.getpid()}
+
+
+config_matrix = {
+    "detectors": [["n0", "n1"], ["n6"]],
+    "echans": [["2"], ["3"]],
+}
+
+
+@pytest.mark.run(order=1)
+def test_date_range_and_matrix():
+    assert date_range("181230", "190102") == ["181230", "181231", "190101", "190102"]
+    assert len(expand_config_matrix(config_matrix)) == 4
+    assert expand_config_matrix({}) == [{}]
+
+
+@pytest.mark.run(order=1)
+@pytest.mark.parametrize("backend", ["serial", "process"])
+def test_batch_runner_manifest(tmp_path, backend):
+    prepared = []
+
+    def prepare(date, configs):
+        prepared.append((date, len(configs)))
+
+    runner = BatchRunner(
+        dummy_fit,
+        date_range("190101", "190102"),
+        config_matrix,
+        tmp_path,
+        prepare_function=prepare,
+    )
+
+    summary = runner.run(backend=backend, num_workers=2)
+
+    assert summary == {"done": 6, "failed": 2}
+    assert prepared == [("190101", 4), ("190102", 4)]
+
+    with open(tmp_path / "manifest.json") as f:
+        manifest = json.load(f)
+
+    for task in manifest["tasks"].values():
+        assert task["duration"] >= 0
+        if task["status"] == "failed":
+            assert "no data" in task["error"]
+            assert "RuntimeError" in task["traceback"]
+        else:
+            assert task["result"]["date"] == task["date"]
+
+    # resume: only the failed tasks run again
+    prepared.clear()
+    resumed = BatchRunner(
+        dummy_fit,
+        date_range("190101", "190102"),
+        config_matrix,
+        tmp_path,
+        prepare_function=prepare,
+    )
+    assert len(resumed.manifest.pending()) == 2
+
+    resumed.run(backend="serial")
+
+    assert prepared == [("190102", 2)]
+    assert all(
+        task["attempts"] == (2 if task["status"] == "failed" else 1)
+        for task in resumed.manifest.tasks.values()
+    )
+
+
+@pytest.mark.run(order=1)
+def test_fit_script_task(tmp_path):
+    # the script only prints its arguments to the log of the task
+    script = tmp_path / "print_args.py"
+    script.write_text("import sys, json\nprint(json.dumps(sys.argv[1:]))\n")
+
+    task = FitScriptTask(script, "config.yml", python=sys.executable)
+
+    output_dir = str(tmp_path / "task")
+    task("190101", {"data_type": "cspec", "detectors": ["n0", "n1"],
+                    "echans": ["2"]}, output_dir)
+
+    with open(os.path.join(output_dir, "fit.log")) as f:
+        args = json.load(f)
+
+    assert args[args.index("-dtype") + 1] == "cspec"
+    assert args[args.index("-dates") + 1] == "190101"
+    assert args[args.index("-dets") + 1:args.index("-e")] == ["n0", "n1"]
@@ -0,0 +1,194 @@
+import numpy as np
+import pytest
+import astropy.time as astro_time
+from gbmgeometry import GBMTime
+
+from gbmbkgpy.data.data import Data, bins_in_intervals
+from gbmbkgpy.data.gbm_data import GBMData
+from gbmbkgpy.utils.binner import Rebinner
+
+
+def _create_test_data():
+    edges = np.arange(0, 2000, 1.0)
+    time_bins = np.vstack((edges[:-1], edges[1:])).T
+
+    # gap in the data like a SAA passage
+    time_bins = time_bins[(time_bins[:, 0] < 500) | (time_bins[:, 0] > 700)]
+
+    counts = np.ones((len(time_bins), 2), dtype=np.int64)
+
+    return Data("test", time_bins, counts)
+
+
+@pytest.mark.run(order=1)
+def test_valid_fit_time_mask():
+    data = _create_test_data()
+    data.rebin_data(10)
+
+    num_valid_bins = len(data.time_bins)
+
+    assert np.all(data.valid_fit_time_mask)
+
+    # only mask for the fit => valid bins must not change
+    data.mask_data(1000, 100, unvalid=False)
+
+    assert len(data.time_bins) == num_valid_bins
+
+    fit_mask = data.valid_fit_time_mask
+    masked_bins = data.time_bins[~fit_mask]
+
+    assert len(fit_mask) == num_valid_bins
+    assert np.all(masked_bins[:, 1] > 1000)
+    assert np.all(masked_bins[:, 0] <= 1100)
+    assert np.all(data.valid_time_mask[data._time_bins[:, 0] > 1000])
+    assert not np.any(data.fit_time_mask[
+        (data._time_bins[:, 0] >= 1000) & (data._time_bins[:, 0] <= 1100)
+    ])
+
+
+@pytest.mark.run(order=1)
+def test_bins_in_intervals():
+    bin_starts = np.arange(0, 100, 1.0)
+
+    intervals = np.array([[50, 52], [10, 12.5], [11, 15], [90, 80]])
+
+    mask = bins_in_intervals(bin_starts, intervals)
+
+    # old interval by interval masking as reference
+    mask_ref = np.zeros(len(bin_starts), dtype=bool)
+    for start, stop in intervals:
+        mask_ref[np.logical_and(bin_starts >= start, bin_starts <= stop)] = True
+
+    assert np.array_equal(mask, mask_ref)
+
+
+@pytest.mark.run(order=1)
+def test_mask_layers():
+    data = _create_test_data()
+    data.rebin_data(10)
+
+    num_valid_bins = len(data.time_bins)
+
+    data.mask_intervals([[701, 800], [1500, 1510]], layer="saa")
+    data.mask_intervals([[1200, 1250]], layer="trigger", unvalid=False)
+
+    assert data.mask_layers == ["saa", "trigger"]
+
+    num_valid_bins_saa = len(data.time_bins)
+    num_fit_bins = len(data.fit_time_bins)
+
+    assert num_valid_bins_saa < num_valid_bins
+    assert num_fit_bins < num_valid_bins_saa
+
+    # removing a layer restores the bins without rebinning
+    data.remove_mask_layer("saa")
+
+    assert len(data.time_bins) == num_valid_bins
+    assert len(data.fit_time_bins) == num_valid_bins - (
+        num_valid_bins_saa - num_fit_bins
+    )
+
+    data.remove_mask_layer("trigger")
+
+    assert np.array_equal(data.fit_time_bins, data.time_bins)
+
+
+@pytest.mark.run(order=1)
+def test_mask_rebinned_bins():
+    # bins masked before the rebinning are excluded from the rebinning
+    data = _create_test_data()
+    data.mask_intervals([[701, 745.5]], layer="saa")
+    data.rebin_data(10)
+
+    unbinned_mask = ((data._time_bins[:, 0] >= 701) &
+                     (data._time_bins[:, 0] <= 745.5))
+    reference = Rebinner(data._time_bins, 10, mask=~unbinned_mask)
+
+    assert np.array_equal(data._rebinned_time_bins, reference.time_rebinned)
+    assert not np.any(
+        (data.time_bins[:, 1] > 701) & (data.time_bins[:, 0] < 746)
+    )
+
+    # after the rebinning only the rebinned bins starting in the
+    # interval are masked, like for the unbinned bins
+    data = _create_test_data()
+    data.rebin_data(10)
+    data.mask_data(1003, 10)
+
+    starts = data._rebinned_time_bins[:, 0]
+    masked = (starts >= 1003) & (starts - 1003 <= 10)
+
+    assert np.array_equal(data.valid_rebinned_time_mask,
+                          data._base_valid_rebinned_time_mask & ~masked)
+    assert 1002 in data.time_bins[:, 0]
+    assert 1012 not in data.time_bins[:, 0]
+
+
+@pytest.mark.run(order=1)
+def test_fit_mask_rebinned_bins():
+    # e.g. a GRB that is only excluded from the fit
+    edges = np.arange(0, 2001, 1.0)
+    time_bins = np.vstack((edges[:-1], edges[1:])).T
+
+    counts = np.ones((len(time_bins), 2), dtype=np.int64)
+    grb = (time_bins[:, 0] >= 1005) & (time_bins[:, 0] < 1030)
+    counts[grb] = 1000
+
+    data = Data("test", time_bins, counts)
+    data.mask_data(1005, 25, unvalid=False)
+    data.rebin_data(10)
+
+    # no fit bin contains counts of the masked interval
+    fit_time_bins = data.fit_time_bins
+    assert not np.any(
+        (fit_time_bins[:, 1] > 1005) & (fit_time_bins[:, 0] < 1031)
+    )
+    assert np.all(data.fit_counts < 1000)
+
+    # the valid bins are not changed by the fit mask
+    assert len(data.time_bins) == 200
+    assert np.sum(data.counts) == np.sum(counts[:-1])
+    assert np.sum(~data.valid_fit_time_mask) == 4
+
+
+class _DayData(GBMData):
+    """
+    GBMData of one day without data files, only for the flare masking
+    """
+
+    def __init__(self, date, day_start):
+        self._date = date
+
+        edges = np.arange(day_start, day_start + 86400 + 1, 60.0)
+        time_bins = np.vstack((edges[:-1], edges[1:])).T
+
+        Data.__init__(self, "test", time_bins, np.ones((len(time_bins), 2)))
+
+
+@pytest.mark.run(order=1)
+def test_mask_solar_flares():
+    # the flare list of this day contains a record cut off before the class
+    date = "120707"
+    day_start = GBMTime(
+        astro_time.Time("2012-07-07T00:00:00", format="isot", scale="utc")
+    ).met
+
+    data = _DayData(date, day_start)
+    data.mask_solar_flares(flare_classes=("M", "X"))
+
+    masked_bins = data.time_bins[~data.valid_fit_time_mask] - day_start
+
+    # the M10 flare from 08:18 to 08:39
+    assert len(masked_bins) > 0
+    assert np.any((masked_bins[:, 0] >= 8 * 3600 + 18 * 60) &
+                  (masked_bins[:, 0] <= 8 * 3600 + 39 * 60))
+    assert not np.any((masked_bins[:, 0] >= 4 * 3600 + 13 * 60) &
+                      (masked_bins[:, 0] <= 4 * 3600 + 27 * 60))
+
+    # no flare list for this year
+    data = _DayData("300101", day_start)
+
+    with pytest.warns(UserWarning):
+        data.mask_solar_flares()
+
+    assert np.all(data.valid_fit_time_mask)
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+from astromodels import Constant, Log_uniform_prior
+
+from gbmbkgpy.data.data import Data
+from gbmbkgpy.io.posterior_store import (
+    PosteriorStore,
+    posterior_store_path,
+    write_posterior_store,
+)
+from gbmbkgpy.modeling.model import ModelDet
+from gbmbkgpy.modeling.source import NormOnlySource
+from gbmbkgpy.modeling.warm_start import warm_start_diagnostics
+
+
+# rates in one echan (N, 2, 1) at the start and stop of the time bins
+def _rate_constant(time):
+    return 20 * np.ones_like(time)[..., np.newaxis]
+
+
+def _rate_orbit(time):
+    return 10 * (1 + np.sin(2 * np.pi * time / 5760))[..., np.newaxis]
+
+
+def _create_model():
+    rng = np.random.default_rng(3)
+
+    time_bins = np.vstack((np.arange(0, 20000, 1.0),
+                           np.arange(1, 20001, 1.0))).T
+    rates = 1.3 * _rate_constant(time_bins) + 0.7 * _rate_orbit(time_bins)
+    counts = rng.poisson(np.mean(rates, axis=1))
+
+    data = Data("n0", time_bins, counts)
+    data.mask_data(5000, 300)
+
+    model = ModelDet(data, incremental=True)
+
+    for name, rate in [("constant", _rate_constant), ("orbit", _rate_orbit)]:
+        const = Constant()
+        const.k.value = 1.0
+        const.k.bounds = (0.0, 10.0)
+        model.add_source(NormOnlySource(name, rate, const))
+
+    return model
+
+
+@pytest.mark.run(order=1)
+def test_fit_multiresolution():
+    model = _create_model()
+    results = model.fit_multiresolution([1000, 100, 1])
+
+    assert len(results) == 3
+    assert np.all(np.diff(model.data.time_bins, axis=1) == 1)
+
+    model_direct = _create_model()
+    model_direct.rebin_data(1)
+    model_direct.refit()
+
+    for name in ["constant_k", "orbit_k"]:
+        assert model.parameter[name].value == pytest.approx(
+            model_direct.parameter[name].value, rel=1e-3
+        )
+
+    assert model.parameter["constant_k"].value == pytest.approx(1.3, rel=0.05)
+    assert model.parameter["orbit_k"].value == pytest.approx(0.7, rel=0.05)
+
+    # the fine level starts at the optimum of the coarse levels
+    assert results[-1].nit <= results[0].nit
+
+
+@pytest.mark.run(order=1)
+def test_warm_start_priors():
+    model = _create_model()
+
+    for param in model.parameter.values():
+        param.prior = Log_uniform_prior(lower_bound=1e-3, upper_bound=100)
+
+    rng = np.random.default_rng(4)
+    previous = {
+        "constant_k": rng.normal(1.3, 0.01, 2000),
+        "orbit_k": rng.normal(0.7, 0.02, 2000),
+    }
+
+    warm_start = model.set_warm_start_priors(previous, inflation=2.0)
+
+    assert list(warm_start.keys()) == ["constant_k", "orbit_k"]
+
+    prior = model.parameter["constant_k"].prior
+    assert prior.name == "Truncated_student_t"
+    assert prior.from_unit_cube(0.5) == pytest.approx(1.3, abs=5e-3)
+    assert prior.lower_bound.value == 1e-3
+    assert warm_start["orbit_k"]["width"] == pytest.approx(0.04, rel=0.1)
+
+    # a posterior like the previous one is fine, a shifted one is flagged
+    diagnostics = warm_start_diagnostics(previous, warm_start)
+    assert diagnostics["warm_start_ok"]
+
+    shifted = dict(previous, orbit_k=previous["orbit_k"] + 0.5)
+    diagnostics = warm_start_diagnostics(shifted, warm_start)
+    assert diagnostics["flagged"] == ["orbit_k"]
+
+    model.reset_warm_start_priors()
+    assert model.parameter["constant_k"].prior.name == "Log_uniform_prior"
+
+
+@pytest.mark.run(order=1)
+def test_posterior_store(tmp_path):
+    model = _create_model()
+
+    rng = np.random.default_rng(5)
+    samples = rng.normal([1.3, 0.7], [0.01, 0.02], (100000, 2))
+    log_like = rng.normal(-100, 1, len(samples))
+    log_prior = np.full(len(samples), -2.0)
+
+    write_posterior_store(
+        posterior_store_path(tmp_path / "fit_"),
+        list(model.parameter.keys()),
+        samples,
+        log_like,
+        log_prior,
+    )
+
+    store = PosteriorStore.from_result_dir(tmp_path)
+
+    assert isinstance(store.samples, np.memmap)
+    assert store.param_names == ["constant_k", "orbit_k"]
+    assert np.array_equal(store.samples, samples)
+
+    # load_fit uses the store instead of the MultiNest output
+    model.load_fit(tmp_path / "fit_")
+
+    assert np.array_equal(model.samples["orbit_k"], samples[:, 1])
+
+    assert np.array_equal(model._log_probability_values, log_like + log_prior)
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import pytest
+import astropy.io.fits as fits
+
+from gbmbkgpy.data.gbm_data import GBMData, GBMDataSet
+
+date = "180407"
+poshist_bounds = (1000.0, 90000.0)
+
+
+def _write_ctime_file(gbmdata, det, bin_start, seed=0):
+    """
+    CTIME file with the columns read by GBMData
+    """
+    bin_stop = bin_start + 0.256
+    counts = np.random.default_rng(seed).poisson(
+        20, (len(bin_start), 8)
+    ).astype(np.int16)
+
+    spectrum = fits.BinTableHDU.from_columns([
+        fits.Column(name="COUNTS", format="8I", array=counts),
+        fits.Column(name="TIME", format="D", array=bin_start),
+        fits.Column(name="ENDTIME", format="D", array=bin_stop),
+    ], name="SPECTRUM")
+
+    edges = np.geomspace(4, 2000, 9)
+    ebounds = fits.BinTableHDU.from_columns([
+        fits.Column(name="E_MIN", format="E", array=edges[:-1]),
+        fits.Column(name="E_MAX", format="E", array=edges[1:]),
+    ], name="EBOUNDS")
+
+    path = gbmdata / "ctime" / date / f"glg_ctime_{det}_{date}_v00.pha"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fits.HDUList([fits.PrimaryHDU(), ebounds, spectrum]).writeto(path)
+
+    return path
+
+
+def _ctime_starts():
+    # the first bins are before the start of the poshist file
+    return 990.0 + np.arange(4000) * 0.256
+
+
+class _CountingGBMData(GBMData):
+    num_reads = 0
+
+    def _read_in_cleaned_arrays(self):
+        _CountingGBMData.num_reads += 1
+        return super()._read_in_cleaned_arrays()
+
+
+def _load(echans, use_cache=True):
+    return _CountingGBMData("n0", date, "ctime", "n0", echans,
+                            use_cache=use_cache, poshist_bounds=poshist_bounds,
+                            download=False)
+
+
+@pytest.mark.run(order=1)
+def test_gbm_data_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("GBMDATA", str(tmp_path))
+
+    data_file = _write_ctime_file(tmp_path, "n0", _ctime_starts())
+
+    cold = _load(["1", "2-4"], use_cache=False)
+
+    # bins before the poshist start are removed
+    assert np.all(cold._time_bins[:, 0] > poshist_bounds[0])
+    with fits.open(data_file) as f:
+        raw_counts = f["SPECTRUM"].data["COUNTS"]
+        first = np.flatnonzero(f["SPECTRUM"].data["TIME"] > poshist_bounds[0])[0]
+        assert np.array_equal(cold._counts[:, 1],
+                              np.sum(raw_counts[first:, 2:5], axis=1))
+
+    _CountingGBMData.num_reads = 0
+
+    # first load writes the cache, the second one reads it
+    _load(["1", "2-4"])
+    cached = _load(["1", "2-4"])
+
+    assert _CountingGBMData.num_reads == 1
+    assert np.array_equal(cached._counts, cold._counts)
+    assert np.array_equal(cached._time_bins, cold._time_bins)
+    assert np.array_equal(cached.ebin_out_edges, cold.ebin_out_edges)
+
+    # other echan masks have their own cache file
+    other = _load(["1", "2-5"])
+
+    assert _CountingGBMData.num_reads == 2
+    assert np.array_equal(other._counts[:, 0], cold._counts[:, 0])
+    assert not np.array_equal(other._counts[:, 1], cold._counts[:, 1])
+
+    # a data file newer than the cache is read again
+    cache_mtime = os.stat(cached._cache_path()).st_mtime
+    os.utime(data_file, (cache_mtime + 10, cache_mtime + 10))
+
+    _load(["1", "2-4"])
+
+    assert _CountingGBMData.num_reads == 3
+
+
+@pytest.mark.run(order=1)
+def test_gbm_data_set(tmp_path, monkeypatch):
+    monkeypatch.setenv("GBMDATA", str(tmp_path))
+
+    # the files exist, so nothing is downloaded
+    poshist_file = (tmp_path / "poshist" / date /
+                    f"glg_poshist_all_{date}_v00.fit")
+    poshist_file.parent.mkdir(parents=True)
+    poshist_file.touch()
+
+    bounds_cache = tmp_path / "cache" / "poshist" / f"poshist_bounds_{date}.npy"
+    bounds_cache.parent.mkdir(parents=True)
+    np.save(bounds_cache, np.array(poshist_bounds))
+
+    starts = _ctime_starts()
+
+    # every detector misses other time bins
+    missing = {"n0": [100, 101, 2000], "n1": [101, 3000], "n2": [500]}
+    for i, (det, idx) in enumerate(missing.items()):
+        _write_ctime_file(tmp_path, det, np.delete(starts, idx), seed=i)
+
+    # the poshist bounds come from the cache
+    data_set = GBMDataSet(date, "ctime", ["n0", "n1", "n2"], ["1", "2-4"],
+                          max_workers=2)
+
+    # reference: every detector read on its own
+    single = {
+        det: GBMData(det, date, "ctime", det, ["1", "2-4"], use_cache=False,
+                     poshist_bounds=poshist_bounds, download=False)
+        for det in missing.keys()
+    }
+
+    common_starts = np.delete(starts, [100, 101, 500, 2000, 3000])
+    common_starts = common_starts[common_starts > poshist_bounds[0]]
+
+    assert len(data_set) == 3
+    for det, data in single.items():
+        assert np.array_equal(data_set[det]._time_bins[:, 0], common_starts)
+
+        # the counts stay in the rows of their time bins
+        rows = np.isin(data._time_bins[:, 0], common_starts)
+        assert np.array_equal(data_set[det]._counts, data._counts[rows])
@@ -0,0 +1,244 @@
+import numpy as np
+import pytest
+import scipy.interpolate as interpolate
+import astropy.io.fits as fits
+from gbmgeometry import GBMTime
+
+from gbmbkgpy.geometry.gbm_geometry import (
+    GBMGeometry,
+    ang2cart,
+    bgo_cr_tracer_spline,
+    get_ang,
+    get_lat_mcl,
+)
+from gbmbkgpy.utils.binner import Rebinner
+
+
+def _bgo_day():
+    # CSPEC like bins of 4.096 s with two SAA passages
+    starts = 100.0 + np.arange(20000) * 4.096
+    time_bins = np.vstack((starts, starts + 4.096)).T
+
+    outside_saa = ~(
+        ((starts > 20000) & (starts < 22000)) |
+        ((starts > 50000) & (starts < 53000))
+    )
+    time_bins = time_bins[outside_saa]
+
+    rate = 300 + 100 * np.sin(2 * np.pi * time_bins[:, 0] / 5700)
+    counts = np.random.default_rng(3).poisson(rate * 4.096)
+
+    return time_bins, counts
+
+
+@pytest.mark.run(order=1)
+def test_bgo_cr_tracer_spline():
+    time_bins, counts = _bgo_day()
+
+    tck, tracer_min = bgo_cr_tracer_spline(time_bins, counts)
+
+    # tracer of the baseline (Rebinner and UnivariateSpline)
+    rebinner = Rebinner(time_bins, 100)
+    rebinned_time_bins = rebinner.time_rebinned
+    (rebinned_counts,) = rebinner.rebin(counts)
+
+    rates = rebinned_counts / (rebinned_time_bins[:, 1] -
+                               rebinned_time_bins[:, 0])
+    rates = np.concatenate((rates[:1], rates, rates[-1:]))
+    times = np.concatenate(
+        (time_bins[:1, 0], np.mean(rebinned_time_bins, axis=1),
+         time_bins[-1:, 1])
+    )
+    reference = interpolate.UnivariateSpline(times, rates, s=1000, k=3)
+
+    # the baseline subtracted the minimum over the evaluated times, which
+    # is the minimum over the day for a 10 s grid over the whole day
+    eval_times = np.arange(times[0], times[-1], 10.0)
+    reference_tracer = reference(eval_times) - reference(eval_times).min()
+
+    tracer = interpolate.splev(eval_times, tck) - tracer_min
+
+    # same spline fit, the tolerance only covers floating point differences
+    assert np.allclose(tracer, reference_tracer, rtol=1e-7, atol=1e-7)
+
+
+class _OrbitInterpolator:
+    """
+    Circular orbit with 26.5 deg inclination and a slowly rotating
+    attitude, instead of a poshist file
+    """
+
+    radius = 6900.0
+    period = 5700.0
+
+    def sc_pos(self, time):
+        phase = 2 * np.pi * np.asarray(time, dtype=float) / self.period
+        incl = np.deg2rad(26.5)
+
+        pos = np.stack((
+            np.cos(phase),
+            np.sin(phase) * np.cos(incl),
+            np.sin(phase) * np.sin(incl),
+        ), axis=-1)
+
+        return self.radius * pos
+
+    def quaternion(self, time):
+        angle = 2 * np.pi * np.asarray(time, dtype=float) / 3000.0
+
+        axis = np.array([1.0, 2.0, 3.0]) / np.sqrt(14.0)
+
+        quaternion = np.concatenate((
+            np.multiply.outer(np.sin(angle / 2), axis),
+            np.cos(angle / 2)[..., np.newaxis],
+        ), axis=-1)
+
+        return quaternion
+
+
+class _Geometry(GBMGeometry):
+
+    def __init__(self):
+        self._position_interpolator = _OrbitInterpolator()
+
+
+def _is_occulted_baseline(sc_pos, ra, dec):
+    # is_occulted of the baseline for one time
+    earth_radius = 6371.0
+    fermi_radius = np.sqrt((sc_pos ** 2).sum())
+    horizon_angle = 90 - np.rad2deg(np.arccos(earth_radius / fermi_radius))
+    min_vis = np.deg2rad(horizon_angle)
+
+    ang_sep = get_ang(ang2cart(ra, dec), -sc_pos)
+
+    return ang_sep < min_vis
+
+
+@pytest.mark.run(order=1)
+def test_visibility():
+    geom = _Geometry()
+
+    rng = np.random.default_rng(12)
+    ra = rng.uniform(0, 360, 20)
+    dec = np.rad2deg(np.arcsin(rng.uniform(-1, 1, 20)))
+
+    times = np.arange(0, 12000, 30.0)
+
+    visible, crossings = geom.visibility(times, ra, dec,
+                                         return_crossings=True)
+
+    assert visible.shape == (len(times), len(ra))
+
+    for i, time in enumerate(times):
+        occulted = _is_occulted_baseline(geom.sc_pos(time), ra, dec)
+
+        assert np.array_equal(visible[i], ~occulted)
+        assert np.array_equal(geom.is_occulted(time, ra, dec), occulted)
+
+    # crossing times from the sign changes on a fine grid
+    fine_times = np.arange(0, times[-1], 0.05)
+    fine_visible = geom.visibility(fine_times, ra, dec)
+
+    for j in range(len(ra)):
+        change = np.flatnonzero(fine_visible[1:, j] != fine_visible[:-1, j])
+        ingress = fine_visible[change, j]
+
+        for key, ref_idx in (("ingress", change[ingress]),
+                             ("egress", change[~ingress])):
+            assert len(crossings[key][j]) == len(ref_idx)
+            assert np.all(
+                (crossings[key][j] >= fine_times[ref_idx] - 1e-3) &
+                (crossings[key][j] <= fine_times[ref_idx + 1] + 1e-3)
+            )
+
+    assert sum(len(c) for c in crossings["ingress"]) > 0
+    assert sum(len(c) for c in crossings["egress"]) > 0
+
+
+@pytest.mark.run(order=1)
+def test_visibility_satellite_frame():
+    geom = _Geometry()
+
+    rng = np.random.default_rng(5)
+    az = rng.uniform(0, 360, 50)
+    el = np.rad2deg(np.arcsin(rng.uniform(-1, 1, 50)))
+
+    times = np.arange(0, 6000, 75.0)
+
+    visible = geom.visibility_satellite_frame(times, az, el)
+
+    assert visible.shape == (len(times), len(az))
+
+    # loop of the baseline: transform to ICRS and check the occultation
+    for i, time in enumerate(times):
+        ras, decs = geom.satellite_to_icrs(time, az, el)
+        occulted = _is_occulted_baseline(geom.sc_pos(time), ras, decs)
+
+        assert np.array_equal(visible[i], ~occulted)
+
+
+def _week_start(mission_week):
+    met = 5.5e8
+    return met + (mission_week - GBMTime.from_MET(met).mission_week.value) * 604800
+
+
+def _write_lat_file(gbmdata, mission_week):
+    """
+    Weekly LAT spacecraft file with 30 s bins
+    """
+    tstart, tstop = _week_start(mission_week), _week_start(mission_week + 1)
+
+    start = np.arange(tstart, tstop, 30.0)
+    stop = start + 30.0
+    mc_l = 1.0 + 0.5 * np.sin(start / 5700.0) + 1e-3 * mission_week
+
+    primary = fits.PrimaryHDU()
+    primary.header["TSTART"] = tstart
+    primary.header["TSTOP"] = tstop
+
+    sc_data = fits.BinTableHDU.from_columns([
+        fits.Column(name="START", format="D", array=start),
+        fits.Column(name="STOP", format="D", array=stop),
+        fits.Column(name="L_MCILWAIN", format="E", array=mc_l),
+    ], name="SC_DATA")
+
+    path = (gbmdata / "lat" /
+            f"lat_spacecraft_weekly_w{str(mission_week).zfill(3)}_p310_v001.fits")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fits.HDUList([primary, sc_data]).writeto(path)
+
+    return path, (start + stop) / 2, sc_data.data["L_MCILWAIN"]
+
+
+@pytest.mark.run(order=1)
+def test_lat_mcl_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("GBMDATA", str(tmp_path))
+
+    files = {week: _write_lat_file(tmp_path, week) for week in (522, 523)}
+
+    # the interval crosses the boundary of the two weeks
+    min_met, max_met = _week_start(523) - 3000, _week_start(523) + 3000
+
+    lat_time, mc_l = get_lat_mcl(min_met, max_met, use_cache=False)
+
+    ref_time = np.concatenate([files[week][1] for week in (522, 523)])
+    ref_mc_l = np.concatenate([files[week][2] for week in (522, 523)])
+
+    # float32 time offsets to the start of the week, ~0.05 s precision
+    assert np.allclose(lat_time, ref_time, rtol=0, atol=0.1)
+    assert np.allclose(mc_l, ref_mc_l, rtol=1e-6)
+
+    # the first call fills the cache of both weeks
+    get_lat_mcl(min_met, max_met)
+
+    # the cache is used without the files
+    for path, _, _ in files.values():
+        path.unlink()
+
+    assert (tmp_path / "cache" / "lat" / "mcl_w522.npz").exists()
+
+    cached_time, cached_mc_l = get_lat_mcl(min_met, max_met)
+
+    assert np.array_equal(cached_time, lat_time)
+    assert np.array_equal(cached_mc_l, mc_l)
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from gbmbkgpy.response.gbm_response import (
+    GBMResponseGenerator,
+    _batch_kernel_supported,
+)
+
+
+class _FixedPositionInterpolator:
+    """
+    Position interpolator with a fixed attitude, only needed for the
+    geometry of the DRMGen at the init
+    """
+
+    time = np.array([0.0, 1.0])
+
+    def quaternion(self, time):
+        return np.array([0.0, 0.0, 0.0, 1.0])
+
+    def sc_pos(self, time):
+        return np.array([7000.0, 0.0, 0.0])
+
+
+class _Geometry:
+    _position_interpolator = _FixedPositionInterpolator()
+
+
+class _Data:
+    det = "n0"
+
+    def __init__(self):
+        self.ebin_out_edges = np.geomspace(5, 2000, 129)
+
+        self.echans_mask = np.zeros((3, 128), dtype=bool)
+        self.echans_mask[0, 5:30] = True
+        self.echans_mask[1, 30:80] = True
+        self.echans_mask[2, 80:127] = True
+
+
+@pytest.mark.run(order=1)
+def test_gbm_response_batch():
+    gen = GBMResponseGenerator(_Geometry(), np.geomspace(10, 2000, 101), _Data())
+
+    rng = np.random.default_rng(4)
+    az = rng.uniform(0, 360, 25)
+    zen = rng.uniform(-90, 90, 25)
+
+    responses = gen.calc_response_az_zen_batch(az, zen)
+
+    assert responses.shape == (25, 100, 3)
+
+    # reference: the DRM of every position built by the DRMGen kernel
+    rsp = gen._drm_gen_no_occult
+    echan_sum = gen._echans_mask.T.astype(np.float64)
+
+    for i in range(len(az)):
+        drm = rsp._make_drm_numba(az[i], zen[i], rsp._geo_az, rsp._geo_el)
+        assert np.allclose(responses[i], drm @ echan_sum, rtol=1e-5, atol=1e-8)
+
+    assert np.allclose(gen.calc_response_az_zen(az[3], zen[3]), responses[3])
+
+
+@pytest.mark.run(order=1)
+def test_gbm_response_fallback():
+    gen = GBMResponseGenerator(_Geometry(), np.geomspace(10, 2000, 101), _Data())
+
+    # with atmospheric scattering the DRMs are built direction by direction
+    rsp = gen._drm_gen_no_occult
+    rsp._matrix_type = 2
+
+    assert not _batch_kernel_supported(rsp)
+
+    rng = np.random.default_rng(7)
+    az = rng.uniform(0, 360, 5)
+    zen = rng.uniform(-90, 90, 5)
+
+    responses = gen.calc_response_az_zen_batch(az, zen)
+
+    assert gen._grid_responses is None
+
+    echan_sum = gen._echans_mask.T.astype(np.float64)
+
+    for i in range(len(az)):
+        drm = rsp._make_drm_numba(az[i], zen[i], rsp._geo_az, rsp._geo_el)
+        assert np.allclose(responses[i], drm @ echan_sum)
+
+    # DRMGen without the internals used by the batch kernel
+    rsp._matrix_type = 0
+    assert _batch_kernel_supported(rsp)
+
+    database = rsp._database_nb
+    del rsp._database_nb
+    assert not _batch_kernel_supported(rsp)
+    rsp._database_nb = database
+
+    del rsp._ein
+    assert not _batch_kernel_supported(rsp)
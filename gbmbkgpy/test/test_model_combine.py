@@ -0,0 +1,164 @@
+import copy
+import numpy as np
+import pytest
+
+from astromodels import Powerlaw
+
+from gbmbkgpy.data.data import Data
+from gbmbkgpy.modeling.model import ModelDet, ModelCombine
+from gbmbkgpy.modeling.source import PhotonSourceFree
+
+
+class LinearResponse:
+    """
+    Effective response that changes linearly in time, different for every
+    detector
+    """
+
+    def __init__(self, scale):
+        self.Ebins_in_edge = np.geomspace(10, 1000, 21)
+        self.num_ebins_out = 4
+
+        rng = np.random.default_rng(int(scale * 10))
+        self._base = scale * rng.uniform(0, 10, (20, self.num_ebins_out))
+
+    def interp_effective_response(self, time):
+        return (1 + 1e-4 * time)[..., np.newaxis, np.newaxis] * self._base
+
+
+def _create_model_combine(stacked_folding, num_threads=1):
+    rng = np.random.default_rng(2)
+
+    pl = Powerlaw()
+    pl.K.value = 5.0
+    pl.index.value = -1.5
+
+    model_dets = []
+    for i, det in enumerate(["n0", "n1", "n2"]):
+        time_bins = np.vstack((np.arange(0, 3000, 10.0),
+                               np.arange(10, 3010, 10.0))).T
+        counts = rng.poisson(100, (len(time_bins), 4))
+
+        data = Data(det, time_bins, counts)
+        data.mask_data(time_bins[50, 0], 200)
+
+        model = ModelDet(data, incremental=True)
+        model.add_source(PhotonSourceFree("CGB", pl, LinearResponse(i + 1)))
+        model_dets.append(model)
+
+    return ModelCombine(*model_dets, stacked_folding=stacked_folding,
+                        num_threads=num_threads)
+
+
+@pytest.mark.run(order=1)
+def test_stacked_folding():
+    model_stacked = _create_model_combine(stacked_folding=True)
+    model_single = _create_model_combine(stacked_folding=False)
+
+    assert len(model_stacked._stacked_sources) == 1
+
+    for values in [[5.0, -1.5], [2.0, -2.2]]:
+        model_stacked.set_parameters(values)
+        model_single.set_parameters(values)
+
+        assert model_stacked.log_like() == pytest.approx(
+            model_single.log_like(), rel=1e-12
+        )
+
+    # a new fit mask gets applied to the stacked responses
+    for model in [model_stacked, model_single]:
+        for m in model.model_dets:
+            m.data.mask_data(1000, 500, unvalid=False)
+        model.update_fit_mask()
+
+    assert model_stacked.log_like() == pytest.approx(
+        model_single.log_like(), rel=1e-12
+    )
+
+
+@pytest.mark.run(order=1)
+def test_threaded_log_like():
+    model_threads = _create_model_combine(stacked_folding=True, num_threads=3)
+    model_single = _create_model_combine(stacked_folding=True, num_threads=1)
+
+    assert model_threads._thread_pool is not None
+    assert list(model_threads.parameter.keys()) == ["CGB_K", "CGB_index"]
+
+    for values in [[5.0, -1.5], [2.0, -2.2]]:
+        model_threads.set_parameters(values)
+        model_single.set_parameters(values)
+
+        assert model_threads.log_like() == model_single.log_like()
+
+    # the copy gets its own thread pool
+    model_copy = copy.deepcopy(model_threads)
+    assert model_copy._thread_pool is not model_threads._thread_pool
+    assert model_copy.log_like() == model_threads.log_like()
+
+
+@pytest.mark.run(order=1)
+def test_source_cache():
+    models = {}
+    for cache_sources in [True, False]:
+        model_combine = _create_model_combine(stacked_folding=False)
+        model = model_combine.model_dets[0]
+
+        pl = Powerlaw()
+        pl.K.value = 2.0
+        pl.index.value = -2.0
+        model.add_source(PhotonSourceFree("Point", pl, LinearResponse(5)))
+
+        models[cache_sources] = ModelDet(
+            model.data, incremental=True, cache_sources=cache_sources,
+            full_recompute_interval=4
+        )
+        for source in model.sources:
+            models[cache_sources].add_source(source)
+
+    model_cached, model_single = models[True], models[False]
+
+    steps = [[5.0, -1.5, 2.0, -2.0], [5.0, -1.5, 3.0, -2.0],
+             [5.0, -1.6, 3.0, -2.0], [5.0, -1.6, 3.0, -2.0],
+             [5.0, -1.6, 3.0, -2.1], [4.0, -1.6, 3.0, -2.1]]
+
+    for values in steps:
+        model_cached.set_parameters(values)
+        model_single.set_parameters(values)
+
+        assert np.allclose(model_cached.get_model_counts(),
+                           model_single.get_model_counts(), rtol=1e-12)
+
+    stats = model_cached.source_cache_stats
+
+    # first evaluation, then only the source with the changed parameters
+    assert stats["misses"] == 2 + 1 + 1 + 0 + 1 + 1
+    assert stats["hits"] == 12 - stats["misses"]
+    assert stats["full_recomputes"] == 2
+
+    # new fit masks clear the cache
+    model_cached.data.mask_data(1000, 500, unvalid=False)
+    model_single.data.mask_data(1000, 500, unvalid=False)
+    model_cached.update_fit_mask()
+    model_single.update_fit_mask()
+
+    assert np.allclose(model_cached.get_model_counts(),
+                       model_single.get_model_counts(), rtol=1e-12)
+
+
+@pytest.mark.run(order=1)
+def test_model_combine_counts():
+    model = _create_model_combine(stacked_folding=True)
+
+    fit_counts = model.fit_counts
+    model_counts = model.get_model_counts()
+
+    assert fit_counts.shape == model_counts.shape
+    assert np.array_equal(
+        fit_counts, np.concatenate([m.fit_counts for m in model.model_dets])
+    )
+    assert np.allclose(
+        model_counts,
+        np.concatenate([m.get_model_counts() for m in model.model_dets]),
+        rtol=1e-12,
+    )
+    assert ModelDet.log_like(model) == pytest.approx(model.log_like(), rel=1e-12)
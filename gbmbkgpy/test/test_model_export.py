@@ -0,0 +1,93 @@
+import h5py
+import numpy as np
+import pytest
+
+from astromodels import Constant, Powerlaw
+
+from gbmbkgpy.data.data import Data
+from gbmbkgpy.io.model_export import ChunkedModelExporter, save_model_export
+from gbmbkgpy.modeling.model import ModelDet
+from gbmbkgpy.modeling.source import NormOnlySource, PhotonSourceFree
+
+
+class LinearResponse:
+    def __init__(self):
+        self.Ebins_in_edge = np.geomspace(10, 1000, 11)
+        self.num_ebins_out = 3
+
+        rng = np.random.default_rng(1)
+        self._base = rng.uniform(0, 10, (10, self.num_ebins_out))
+
+    def interp_effective_response(self, time):
+        return (1 + 1e-4 * time)[..., np.newaxis, np.newaxis] * self._base
+
+
+def _rate_constant(time):
+    return np.ones(time.shape + (3,))
+
+
+def _create_model():
+    time_bins = np.vstack((np.arange(0, 5000, 1.0),
+                           np.arange(1, 5001, 1.0))).T
+    counts = np.random.default_rng(2).poisson(20, (len(time_bins), 3))
+
+    data = Data("n0", time_bins, counts)
+    data.mask_data(2000, 300)
+    data.rebin_data(50)
+
+    model = ModelDet(data, incremental=True)
+
+    const = Constant()
+    const.k.value = 3.0
+    model.add_source(NormOnlySource("constant", _rate_constant, const))
+
+    pl = Powerlaw()
+    pl.K.value = 5.0
+    pl.index.value = -1.5
+    model.add_source(PhotonSourceFree("CGB", pl, LinearResponse()))
+
+    return model
+
+
+@pytest.mark.run(order=1)
+def test_chunked_model_export(tmp_path):
+    model = _create_model()
+    unbinned_time_bins = model.data.unbinned_time_bins
+
+    assert len(unbinned_time_bins) == 4699
+    assert len(model.data.time_bins) < 100
+
+    save_model_export(tmp_path / "model.h5", model, chunk_size=700)
+
+    with h5py.File(tmp_path / "model.h5", "r") as f:
+        assert f["model_counts"].chunks == (700, 3)
+        assert f["model_counts"].compression == "lzf"
+        assert list(f["sources"].keys()) == ["CGB", "constant"]
+
+        model_counts = f["model_counts"][()]
+        assert np.array_equal(f["time_bins_start"][()], unbinned_time_bins[:, 0])
+        assert np.array_equal(f["observed_counts"][()], model.data.unbinned_counts)
+
+        for source in model.sources:
+            expected = source.get_counts(time_bins=unbinned_time_bins)
+            assert np.allclose(f["sources"][source.name][()], expected, rtol=1e-12)
+
+        assert np.allclose(
+            model_counts, f["sources/CGB"][()] + f["sources/constant"][()]
+        )
+
+    # the unbinned counts sum up to the counts of the rebinned model
+    bin_index = np.searchsorted(model.data.time_bins[:, 0],
+                                unbinned_time_bins[:, 0], side="right") - 1
+    # the rebinning drops the incomplete bins at the edges of the gaps
+    contained = unbinned_time_bins[:, 1] <= model.data.time_bins[bin_index, 1]
+    summed = np.zeros_like(model.get_model_counts())
+    np.add.at(summed, bin_index[contained], model_counts[contained])
+    assert np.allclose(summed, model.get_model_counts(), rtol=1e-9)
+
+    # lazy evaluation chunk by chunk
+    exporter = ChunkedModelExporter.from_model(model, chunk_size=1000)
+    chunks = list(exporter.iter_chunks())
+    assert [len(chunk[1]) for chunk in chunks] == [1000] * 4 + [699]
+    assert np.allclose(np.concatenate([chunk[2] for chunk in chunks]),
+                       model_counts)
@@ -0,0 +1,136 @@
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+from gbmbkgpy.data.data import Data
+from gbmbkgpy.data.gbm_data import GBMData, GBMDataMultiDay
+
+
+def _day_arrays(day_idx):
+    # every day overlaps with the day before by 5 bins
+    starts = day_idx * 10000.0 - 50 + np.arange(1005) * 10.0
+    time_bins = np.vstack((starts, starts + 10)).T
+
+    counts = np.random.default_rng(day_idx).poisson(30, (len(time_bins), 2))
+
+    return time_bins, counts
+
+
+class _Day(GBMData):
+    """
+    GBMData of one day without data files
+    """
+
+    def __init__(self, day_idx):
+        time_bins, counts = _day_arrays(day_idx)
+
+        self._echans_mask = np.zeros((2, 128), dtype=bool)
+        self._Ebin_out_edge = np.arange(129.0)
+        self._poshist_bounds = np.array([time_bins[0, 0], time_bins[-1, 1]])
+
+        Data.__init__(self, "test", time_bins, counts)
+
+
+class _MultiDay(GBMDataMultiDay):
+
+    def __init__(self, *args, **kwargs):
+        self.num_loads = 0
+        self.max_resident_days = 0
+        self._loaded_days = []
+        super().__init__(*args, **kwargs)
+
+    @property
+    def num_resident_days(self):
+        gc.collect()
+        return sum(day() is not None for day in self._loaded_days)
+
+    def _load_day(self, day_idx):
+        self.num_loads += 1
+
+        day = _Day(day_idx)
+
+        self._loaded_days.append(weakref.ref(day))
+        self.max_resident_days = max(self.max_resident_days,
+                                     self.num_resident_days)
+
+        return day
+
+
+def _reference_data():
+    time_bins, counts = [], []
+    last_stop = -np.inf
+
+    for day_idx in range(3):
+        day_time_bins, day_counts = _day_arrays(day_idx)
+        selection = day_time_bins[:, 0] >= last_stop
+
+        time_bins.append(day_time_bins[selection])
+        counts.append(day_counts[selection])
+        last_stop = day_time_bins[-1, 1]
+
+    return Data("test", np.concatenate(time_bins), np.concatenate(counts))
+
+
+@pytest.mark.run(order=1)
+def test_multi_day_data():
+    data = _MultiDay("test", ["180101", "180102", "180103"], "ctime", "n0",
+                     [0, 1], min_bin_width=50, max_cached_days=1)
+    reference = _reference_data()
+    reference.rebin_data(50)
+
+    assert np.array_equal(data.time_bins, reference.time_bins)
+    assert np.array_equal(data.counts, reference.counts)
+    assert np.array_equal(data.unbinned_counts, reference.unbinned_counts)
+
+    # appended bins are kept in memory, at most the last day is loaded again
+    new_starts = 30000.0 + np.arange(23) * 10.0
+    new_time_bins = np.vstack((new_starts, new_starts + 10)).T
+    new_counts = np.full((23, 2), 7)
+
+    num_loads = data.num_loads
+    assert (data.append(new_time_bins, new_counts) ==
+            reference.append(new_time_bins, new_counts))
+    assert data.num_loads <= num_loads + 1
+
+    assert np.array_equal(data.counts, reference.counts)
+    assert np.array_equal(data.unbinned_counts, reference.unbinned_counts)
+
+    # e.g. the common time grid of several detectors
+    selection = np.ones(len(reference._time_bins), dtype=bool)
+    selection[[3, 500, 996, 1500, 2999, 3003]] = False
+
+    data._select_time_bins(selection)
+    reference._select_time_bins(selection)
+    reference.rebin_data(50)
+
+    assert data.min_bin_width == 50
+    assert np.array_equal(data.time_bins, reference.time_bins)
+    assert np.array_equal(data.counts, reference.counts)
+    assert np.array_equal(data.unbinned_counts, reference.unbinned_counts)
+
+
+@pytest.mark.run(order=1)
+@pytest.mark.parametrize("max_cached_days", [1, 2])
+def test_multi_day_resident_days(max_cached_days):
+    data = _MultiDay("test", ["180101", "180102", "180103", "180104"],
+                     "ctime", "n0", [0, 1], max_cached_days=max_cached_days)
+
+    assert data.min_bin_width == 30
+    assert data.num_resident_days <= max_cached_days
+
+    # the rebinned counts are kept in memory, the days are not loaded again
+    num_loads = data.num_loads
+    data.counts
+    assert data.num_loads == num_loads
+
+    # the unbinned counts and a new rebinning need every day once
+    data.unbinned_counts
+    data.rebin_data(60)
+
+    assert data.num_resident_days <= max_cached_days
+    assert data.max_resident_days <= max_cached_days
+
+    with pytest.raises(AssertionError):
+        data.rebin_data(0)
@@ -0,0 +1,169 @@
+import h5py
+import numpy as np
+import pytest
+
+from astromodels import Constant, Powerlaw
+
+from gbmbkgpy.data.data import Data
+from gbmbkgpy.io.ppc import ArrayPPCSink, HDF5PPCSink, PPCEngine, QuantilePPCSink
+from gbmbkgpy.modeling.model import ModelDet
+from gbmbkgpy.modeling.source import NormOnlySource, PhotonSourceFree
+
+
+class LinearResponse:
+    def __init__(self):
+        self.Ebins_in_edge = np.geomspace(10, 1000, 11)
+        self.num_ebins_out = 3
+
+        rng = np.random.default_rng(1)
+        self._base = rng.uniform(0, 10, (10, self.num_ebins_out))
+
+    def interp_effective_response(self, time):
+        return (1 + 1e-4 * time)[..., np.newaxis, np.newaxis] * self._base
+
+
+def _rate_constant(time):
+    return np.ones(time.shape + (3,))
+
+
+def _create_model():
+    time_bins = np.vstack((np.arange(0, 5000, 2.0),
+                           np.arange(2, 5002, 2.0))).T
+    counts = np.random.default_rng(2).poisson(50, (len(time_bins), 3))
+
+    data = Data("n0", time_bins, counts)
+    data.mask_data(2000, 300)
+
+    model = ModelDet(data, incremental=True)
+
+    const = Constant()
+    const.k.value = 20.0
+    const.k.bounds = (0, 100)
+    model.add_source(NormOnlySource("constant", _rate_constant, const))
+
+    pl = Powerlaw()
+    pl.K.value = 5.0
+    pl.index.value = -1.5
+    model.add_source(PhotonSourceFree("CGB", pl, LinearResponse()))
+
+    return model
+
+
+def _samples(n):
+    rng = np.random.default_rng(3)
+    return np.vstack((rng.uniform(15, 25, n),
+                      rng.uniform(4, 6, n),
+                      rng.uniform(-1.7, -1.3, n))).T
+
+
+@pytest.mark.run(order=1)
+def test_model_counts_batch():
+    model = _create_model()
+    samples = _samples(5)
+    time_bins = np.array([[100.0, 110.0], [2500.0, 2600.0]])
+
+    batch = model.get_model_counts_batch(samples)
+    batch_time_bins = model.get_model_counts_batch(samples, time_bins=time_bins)
+
+    # the parameters keep their values
+    assert [p.value for p in model.parameter.values()] == pytest.approx(
+        [20.0, 5.0, -1.5]
+    )
+
+    for i, sample in enumerate(samples):
+        model.set_parameters(sample)
+        assert np.allclose(batch[i], model.get_model_counts(), rtol=1e-12)
+        assert np.allclose(batch_time_bins[i],
+                           model.get_model_counts(time_bins=time_bins),
+                           rtol=1e-12)
+
+    # columns given by name, e.g. from a ModelCombine
+    names = ["CGB_index", "constant_k", "CGB_K"]
+    reordered = model.get_model_counts_batch(samples[:, [2, 0, 1]],
+                                             param_names=names)
+    assert np.array_equal(reordered, batch)
+
+
+@pytest.mark.run(order=1)
+def test_ppc_engine(tmp_path):
+    model = _create_model()
+    samples = _samples(50)
+
+    engine = PPCEngine.from_model(model, min_bin_width=60, block_size=7, seed=42)
+
+    array_sink = ArrayPPCSink()
+    with h5py.File(tmp_path / "ppc.h5", "w") as f:
+        n = engine.run(samples, [array_sink, HDF5PPCSink(f)], n_samples=20)
+
+    assert n == 20
+    assert array_sink.counts.shape == (20, len(model.fit_time_bins), 3)
+    assert array_sink.counts_binned.shape == (20, len(engine.ppc_time_bins), 3)
+
+    with h5py.File(tmp_path / "ppc.h5", "r") as f:
+        assert np.array_equal(f["ppc_counts"][()], array_sink.counts_binned)
+
+    # the rebinning keeps all counts and does not combine over the gap
+    assert np.array_equal(array_sink.counts.sum(axis=1),
+                          array_sink.counts_binned.sum(axis=1))
+    assert not np.any((engine.ppc_time_bins[:, 0] < 2300) &
+                      (engine.ppc_time_bins[:, 1] > 2000))
+
+    # seeded: the same draws again
+    sink_again = ArrayPPCSink(binned_only=True)
+    PPCEngine.from_model(model, block_size=7, seed=42).run(
+        samples, [sink_again], n_samples=20
+    )
+    assert np.array_equal(sink_again.counts_binned, array_sink.counts_binned)
+
+    # all samples: the mean of the draws is the mean model
+    sink_all = ArrayPPCSink()
+    PPCEngine.from_model(model, seed=1).run(samples, [sink_all])
+
+    mean_model = np.mean(model.get_model_counts_batch(samples), axis=0)
+    assert np.mean(sink_all.counts) == pytest.approx(np.mean(mean_model),
+                                                     rel=1e-3)
+
+
+@pytest.mark.run(order=1)
+def test_ppc_quantile_sink():
+    model = _create_model()
+    samples = _samples(50)
+
+    array_sink = ArrayPPCSink()
+    # the grid is centered on the first sample, the test samples spread the
+    # model counts much more than a real posterior. With enough histogram
+    # bins the bands are exact.
+    quantile_sink = QuantilePPCSink(num_bins=512, rel_margin=1.0)
+
+    PPCEngine.from_model(model, block_size=8, seed=7).run(
+        samples, [array_sink, quantile_sink], n_samples=40
+    )
+
+    assert quantile_sink.estimator.exact
+
+    bands = quantile_sink.bands()
+    for level in [0.68, 0.95, 0.99]:
+        expected = np.percentile(
+            array_sink.counts, [50 - 50 * level, 50 + 50 * level], axis=0
+        )
+        assert np.allclose(bands[level], expected)
+
+
+@pytest.mark.run(order=1)
+def test_ppc_block_memory():
+    time_bins = np.vstack((np.arange(0, 1000, 1.0), np.arange(1, 1001, 1.0))).T
+
+    # counts with a detector axis like in the DataExporter
+    def model_counts(samples):
+        return np.full((len(samples), len(time_bins), 12, 8), 5.0)
+
+    engine = PPCEngine(model_counts, time_bins, max_block_memory=2 ** 24,
+                       seed=1)
+
+    block_size = engine._get_block_size((len(time_bins), 12, 8))
+    assert block_size * len(time_bins) * 12 * 8 * 20 <= 2 ** 24
+    assert block_size == 2 ** 24 // (len(time_bins) * 12 * 8 * 20)
+
+    sink = ArrayPPCSink(binned_only=True)
+    assert engine.run(np.zeros((30, 1)), [sink], n_samples=30) == 30
+    assert sink.counts_binned.shape[:1] + sink.counts_binned.shape[2:] == (30, 12, 8)
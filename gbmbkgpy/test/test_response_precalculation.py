@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from gbmbkgpy.response.response import ResponseGenerator
+from gbmbkgpy.utils.checkpoint import CheckpointStore
+from gbmbkgpy.response.response_precalculation import (
+    ResponsePrecalculation,
+    MultiDetResponsePrecalculation,
+)
+
+
+class AnalyticResponseGenerator(ResponseGenerator):
+    """
+    Simple response with a cosine dependence on the zenith, which is
+    different for every detector
+    """
+
+    def __init__(self, det_index):
+        self._det_index = det_index
+        super().__init__(None, np.geomspace(10, 1000, 6), 3)
+
+    def calc_response_az_zen(self, az, zen):
+        eff = np.clip(np.sin(np.deg2rad(zen)), 0, None) * (self._det_index + 1)
+        return eff * np.outer(np.arange(1, 6), np.ones(3))
+
+    @property
+    def cache_key(self):
+        return str(self._det_index).encode()
+
+
+@pytest.mark.run(order=1)
+def test_multi_det_response_precalculation(tmp_path, monkeypatch):
+    monkeypatch.setenv("GBMDATA", str(tmp_path))
+
+    gens = {det: AnalyticResponseGenerator(i) for i, det in enumerate(["n0", "n1", "b0"])}
+
+    multi = MultiDetResponsePrecalculation(gens, Ngrid=500)
+
+    assert multi.response_tensor.shape == (3, 500, 5, 3)
+
+    for det, gen in gens.items():
+        single = ResponsePrecalculation(gen, Ngrid=500)
+
+        assert np.allclose(multi[det].response_grid, single.response_grid)
+        assert np.array_equal(multi[det]._points, single._points)
+
+    # one cache file for the whole configuration
+    cache_files = list((tmp_path / "cache" / "response").iterdir())
+    assert len(cache_files) == 1
+
+    cached = MultiDetResponsePrecalculation(gens, Ngrid=500)
+    assert np.array_equal(cached.response_tensor, multi.response_tensor)
+
+
+class CountingResponseGenerator(AnalyticResponseGenerator):
+
+    def __init__(self, det_index):
+        super().__init__(det_index)
+        self.num_calls = 0
+
+    def calc_response_az_zen(self, az, zen):
+        self.num_calls += 1
+        return super().calc_response_az_zen(az, zen)
+
+
+@pytest.mark.run(order=1)
+def test_response_precalculation_checkpoint(tmp_path):
+    checkpoint = CheckpointStore(tmp_path)
+
+    gen = CountingResponseGenerator(0)
+    full = ResponsePrecalculation(gen, Ngrid=9000, checkpoint=checkpoint)
+
+    parts = sorted(checkpoint.directory.glob("response_*_part*.npz"))
+    assert len(parts) == 3
+
+    # a restart after the second part was interrupted
+    parts[1].unlink()
+
+    gen_restart = CountingResponseGenerator(0)
+    restarted = ResponsePrecalculation(gen_restart, Ngrid=9000,
+                                       checkpoint=checkpoint)
+
+    assert gen_restart.num_calls == 4000
+    assert np.array_equal(restarted.response_grid, full.response_grid)
+
+
+@pytest.mark.run(order=1)
+def test_checkpoint_stage(tmp_path):
+    checkpoint = CheckpointStore(tmp_path)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"counts": np.arange(10)}
+
+    for _ in range(2):
+        result = checkpoint.stage("data", [np.ones(3), "n0"], compute)
+        assert np.array_equal(result["counts"], np.arange(10))
+
+    assert len(calls) == 1
+
+    # different inputs run the stage again
+    checkpoint.stage("data", [np.ones(3), "n1"], compute)
+    assert len(calls) == 2
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from scipy.integrate import quad
+
+from astromodels import Powerlaw, Cutoff_powerlaw, Band, Broken_powerlaw
+
+from gbmbkgpy.modeling.new_astromodels import SBPL
+from gbmbkgpy.modeling.spectral_integration import SpectralIntegrator
+
+
+def _spectral_models():
+    pl = Powerlaw()
+    pl.K.value = 5.0
+    pl.index.value = -2.5
+
+    cpl = Cutoff_powerlaw()
+    cpl.index.value = -1.3
+    cpl.xc.value = 300.0
+
+    band = Band()
+    band.alpha.value = -0.8
+    band.beta.value = -2.3
+    band.xp.value = 300.0
+
+    bpl = Broken_powerlaw()
+    bpl.alpha.value = -1.2
+    bpl.beta.value = -2.6
+    bpl.xb.value = 333.0
+
+    sbpl = SBPL()
+    sbpl.K.value = 0.11
+    sbpl.alpha.value = -1.0
+    sbpl.beta.value = -2.3
+    sbpl.xb.value = 30.0
+
+    return [pl, cpl, band, bpl, sbpl]
+
+
+@pytest.mark.run(order=1)
+def test_analytic_integrals():
+    edges = np.geomspace(5, 2000, 31)
+
+    analytic = SpectralIntegrator(edges, "analytic")
+    simpson = SpectralIntegrator(edges, "simpson")
+
+    # break energies, quad needs them to be accurate
+    breaks = [None, None, [375.0], [333.0], None]
+
+    for model, points in zip(_spectral_models(), breaks):
+
+        def f(x):
+            return float(model(np.array([x]))[0])
+
+        expected = np.array([
+            quad(f, e1, e2, epsrel=1e-12, limit=200,
+                 points=[p for p in points if e1 < p < e2]
+                 if points is not None else None)[0]
+            for e1, e2 in zip(edges[:-1], edges[1:])
+        ])
+
+        assert np.allclose(analytic(model), expected, rtol=1e-8, atol=0), \
+            model.name
+        assert np.allclose(simpson(model), expected, rtol=1e-2, atol=0), \
+            model.name
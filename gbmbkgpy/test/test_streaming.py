@@ -0,0 +1,103 @@
+import os
+import h5py
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+
+from astromodels import Constant
+
+from gbmbkgpy.data.data import Data
+from gbmbkgpy.modeling.model import ModelDet
+from gbmbkgpy.modeling.source import NormOnlySource
+
+
+def _load_recorded_day():
+    path_of_tests = os.path.dirname(os.path.abspath(__file__))
+
+    with h5py.File(
+        os.path.join(path_of_tests, "datasets", "data_of_fit_test.hdf5"), "r"
+    ) as f:
+        time_bins = np.vstack(
+            (f["time_bins_start"][()], f["time_bins_stop"][()])
+        ).T
+        counts = f["observed_counts"][()][:, 0, :].astype(np.int64)
+        model_counts = f["model_counts"][()][:, 0, :]
+
+    return time_bins, counts, model_counts
+
+
+def _create_source(time_bins, model_counts):
+    # rate template of the recorded model, the norm should be fitted to 1
+    widths = time_bins[:, 1] - time_bins[:, 0]
+    interp = interp1d(
+        np.mean(time_bins, axis=1),
+        model_counts / widths[:, np.newaxis],
+        axis=0,
+        fill_value="extrapolate",
+    )
+
+    const = Constant()
+    const.k.value = 0.5
+    const.k.bounds = (0.0, 10.0)
+
+    return NormOnlySource("recorded_model", interp, const)
+
+
+def _replay(time_bins, counts, num_start, chunk_size):
+    data = Data("n0", time_bins[:num_start], counts[:num_start])
+    data.rebin_data(60)
+    data.mask_data(time_bins[200, 0], 500)
+
+    for start in range(num_start, len(time_bins), chunk_size):
+        data.append(time_bins[start: start + chunk_size],
+                    counts[start: start + chunk_size])
+
+    return data
+
+
+@pytest.mark.run(order=1)
+def test_append_data():
+    time_bins, counts, _ = _load_recorded_day()
+
+    data_full = Data("n0", time_bins, counts)
+    data_full.rebin_data(60)
+    data_full.mask_data(time_bins[200, 0], 500)
+
+    data = _replay(time_bins, counts, num_start=50, chunk_size=7)
+
+    assert np.array_equal(data.time_bins, data_full.time_bins)
+    assert np.array_equal(data.counts, data_full.counts)
+    assert np.array_equal(data.valid_rebinned_time_mask,
+                          data_full.valid_rebinned_time_mask)
+    assert np.array_equal(data.fit_counts, data_full.fit_counts)
+
+
+@pytest.mark.run(order=1)
+def test_streaming_refit():
+    time_bins, counts, model_counts = _load_recorded_day()
+
+    data = Data("n0", time_bins[:100], counts[:100])
+    data.rebin_data(60)
+
+    model = ModelDet(data, incremental=True)
+    model.add_source(_create_source(time_bins, model_counts))
+    model.set_fit_window(3000)
+
+    for start in range(100, len(time_bins), 20):
+        model.append_data(time_bins[start: start + 20],
+                          counts[start: start + 20])
+        model.refit()
+
+    # the sources of the streamed model equal a model of the whole day
+    data_full = Data("n0", time_bins, counts)
+    data_full.rebin_data(60)
+
+    model_full = ModelDet(data_full, incremental=True)
+    model_full.add_source(_create_source(time_bins, model_counts))
+    model_full.set_parameters([model.parameter["recorded_model_k"].value])
+    model_full.set_fit_window(3000)
+
+    assert np.allclose(model.get_model_counts(), model_full.get_model_counts())
+
+    # the warm started fit in the window finds the recorded model again
+    assert model.parameter["recorded_model_k"].value == pytest.approx(1, rel=0.05)
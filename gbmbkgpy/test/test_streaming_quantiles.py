@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from gbmbkgpy.utils.statistics.streaming_quantiles import StreamingQuantiles
+
+
+@pytest.mark.run(order=1)
+def test_streaming_quantiles_exact():
+    rng = np.random.default_rng(5)
+    expected = rng.uniform(0.5, 8, (200, 4))
+    draws = rng.poisson(expected, (301, 200, 4))
+
+    estimator = StreamingQuantiles.from_expected_counts(expected)
+
+    for block in np.array_split(draws, 7):
+        estimator.add(block)
+
+    assert estimator.exact
+    assert estimator.num_samples == 301
+
+    q = [0.005, 0.16, 0.5, 0.84, 0.995]
+    assert np.allclose(estimator.quantiles(q),
+                       np.percentile(draws, 100 * np.array(q), axis=0))
+
+    bands = estimator.bands([0.68])
+    assert np.allclose(bands[0.68][0], np.percentile(draws, 16, axis=0))
+
+
+@pytest.mark.run(order=1)
+def test_streaming_quantiles_merge():
+    rng = np.random.default_rng(6)
+    expected = rng.uniform(1e3, 1e4, (100, 2))
+    draws = rng.poisson(expected, (400, 100, 2))
+
+    single = StreamingQuantiles.from_expected_counts(expected)
+    single.add(draws)
+
+    # e.g. two MPI ranks
+    parts = [StreamingQuantiles.from_expected_counts(expected) for _ in range(2)]
+    parts[0].add(draws[:150])
+    parts[1].add(draws[150:])
+    parts[0].merge(parts[1])
+
+    q = [0.025, 0.5, 0.975]
+    assert np.array_equal(parts[0].quantiles(q), single.quantiles(q))
+
+    # large counts use wider histogram bins, the error is a small fraction
+    # of the Poisson sigma
+    assert not single.exact
+    assert np.all(single.num_clipped == 0)
+    error = np.abs(single.quantiles(q) - np.percentile(draws, [2.5, 50, 97.5], axis=0))
+    assert np.max(error / np.sqrt(expected)) < 0.2
+
+    with pytest.raises(AssertionError):
+        single.merge(StreamingQuantiles.from_expected_counts(expected + 100))
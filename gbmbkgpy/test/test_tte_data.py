@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+import astropy.io.fits as fits
+
+from gbmbkgpy.data.tte_data import EventList, GBMTTEData, time_bins_in_gtis
+
+
+def _write_test_event_file(path, time, pha, gtis):
+    events = fits.BinTableHDU.from_columns(
+        [
+            fits.Column(name="TIME", format="D", array=time),
+            fits.Column(name="PHA", format="I", array=pha),
+        ],
+        name="EVENTS",
+    )
+    ebounds = fits.BinTableHDU.from_columns(
+        [
+            fits.Column(name="E_MIN", format="E", array=np.arange(128) + 4.0),
+            fits.Column(name="E_MAX", format="E", array=np.arange(128) + 5.0),
+        ],
+        name="EBOUNDS",
+    )
+    gti = fits.BinTableHDU.from_columns(
+        [
+            fits.Column(name="START", format="D", array=gtis[:, 0]),
+            fits.Column(name="STOP", format="D", array=gtis[:, 1]),
+        ],
+        name="GTI",
+    )
+    fits.HDUList([fits.PrimaryHDU(), ebounds, events, gti]).writeto(path)
+
+
+@pytest.mark.run(order=1)
+def test_event_list_histogram(tmp_path):
+    rng = np.random.default_rng(1)
+
+    gtis = np.array([[0.0, 500.0], [700.0, 1000.0]])
+
+    time = np.sort(rng.uniform(0, 1000, 20000))
+    pha = rng.integers(0, 128, len(time))
+
+    # split the events in two files like the hourly TTE files
+    _write_test_event_file(tmp_path / "tte_0.fit", time[time < 600],
+                           pha[time < 600], gtis[:1])
+    _write_test_event_file(tmp_path / "tte_1.fit", time[time >= 600],
+                           pha[time >= 600], gtis[1:])
+
+    events = EventList([tmp_path / "tte_0.fit", tmp_path / "tte_1.fit"],
+                       chunk_size=1000)
+
+    assert events.num_events == len(time)
+    assert np.array_equal(events.gtis, gtis)
+
+    echans_mask = np.zeros((2, 128), dtype=bool)
+    echans_mask[0, :10] = True
+    echans_mask[1, 5:128] = True
+
+    time_bins = time_bins_in_gtis(events.gtis, 3.0)
+
+    # no bins in the gap between the gtis and none crossing a gti border
+    assert not np.any((time_bins[:, 1] > 500) & (time_bins[:, 0] < 700))
+    assert time_bins[-1, 1] <= 1000
+
+    counts = events.histogram(time_bins, echans_mask)
+
+    for j in range(2):
+        selected = echans_mask[j][pha]
+        expected = np.array([
+            np.sum((time[selected] >= start) & (time[selected] < stop))
+            for start, stop in time_bins
+        ])
+        assert np.array_equal(counts[:, j], expected)
+
+
+@pytest.mark.run(order=1)
+def test_tte_data_append_not_supported():
+    # no event files needed, append has to fail before using the data
+    data = GBMTTEData.__new__(GBMTTEData)
+
+    with pytest.raises(NotImplementedError):
+        data.append(np.array([[0.0, 1.0]]), np.zeros((1, 2)))
@@ -0,0 +1,526 @@
+import os
+import json
+import time
+import socket
+import itertools
+import threading
+import traceback
+import subprocess
+import collections
+from datetime import datetime, timedelta
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from gbmbkgpy.utils.checkpoint import input_hash
+
+valid_batch_backends = ["serial", "process", "mpi"]
+
+# message tags of the MPI task farm
+_TAG_READY = 1
+_TAG_TASK = 2
+_TAG_STOP = 3
+
+
+def date_range(start, stop):
+    """
+    All days between two dates
+    :param start: first date, string like '180407'
+    :param stop: last date (included)
+    :returns: list of date strings
+    """
+    day = datetime.strptime(start, "%y%m%d")
+    last_day = datetime.strptime(stop, "%y%m%d")
+
+    dates = []
+    while day <= last_day:
+        dates.append(day.strftime("%y%m%d"))
+        day += timedelta(days=1)
+
+    return dates
+
+
+def expand_config_matrix(matrix):
+    """
+    All combinations of a configuration matrix
+    :param matrix: dict with a list of values for every option, e.g.
+    {"detectors": [["n0", "n1"], ["n6", "n7"]], "echans": [["2"], ["3"]]}
+    :returns: list of config dicts
+    """
+    if not matrix:
+        return [{}]
+
+    keys = list(matrix.keys())
+
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*(matrix[key] for key in keys))
+    ]
+
+
+def task_id(date, config):
+    """
+    Unique and stable name of a task, used as key in the manifest and as
+    name of the output directory of the task
+    """
+    return f"{date}_{input_hash(config)[:8]}"
+
+
+class BatchManifest:
+    """
+    JSON file with the state of all tasks of a batch run. Every finished
+    task is written immediately (atomic replace), so an interrupted run can
+    be resumed and skips all tasks that are already done.
+    """
+
+    def __init__(self, path):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+
+        if self._path.exists():
+            with open(self._path) as f:
+                content = json.load(f)
+
+            self._tasks = collections.OrderedDict(content["tasks"])
+            self._dates = dict(content.get("dates", {}))
+        else:
+            self._tasks = collections.OrderedDict()
+            self._dates = {}
+
+    def add_task(self, date, config):
+        """
+        Add a task if it is not in the manifest yet
+        :returns: id of the task
+        """
+        tid = task_id(date, config)
+
+        if tid not in self._tasks:
+            self._tasks[tid] = {
+                "date": date,
+                "config": config,
+                "status": "pending",
+                "attempts": 0,
+            }
+
+        return tid
+
+    def pending(self, retry_failed=True):
+        """
+        Ids of the tasks that have to run, tasks that were running when the
+        last run was interrupted count as pending
+        """
+        statuses = ["pending", "running"]
+        if retry_failed:
+            statuses.append("failed")
+
+        return [tid for tid, task in self._tasks.items()
+                if task["status"] in statuses]
+
+    def update_task(self, tid, record):
+        with self._lock:
+            self._tasks[tid].update(record)
+            self.write()
+
+    def update_date(self, date, record):
+        with self._lock:
+            self._dates.setdefault(date, {}).update(record)
+            self.write()
+
+    def write(self):
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = self._path.with_suffix(f".tmp{os.getpid()}")
+
+        with open(tmp_path, "w") as f:
+            json.dump({"tasks": self._tasks, "dates": self._dates}, f, indent=2)
+
+        os.replace(tmp_path, self._path)
+
+    def summary(self):
+        """
+        :returns: dict with the number of tasks per status
+        """
+        return dict(collections.Counter(
+            task["status"] for task in self._tasks.values()
+        ))
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def tasks(self):
+        return self._tasks
+
+    @property
+    def dates(self):
+        return self._dates
+
+
+def _run_task(task_function, tid, date, config, output_dir):
+    """
+    Run one task and record its timing, result or failure
+    """
+    start = time.time()
+
+    record = {
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "start": start,
+    }
+
+    try:
+        result = task_function(date, config, str(output_dir))
+
+        # the result is saved in the json manifest
+        try:
+            json.dumps(result)
+        except TypeError:
+            result = repr(result)
+
+        record["status"] = "done"
+        record["result"] = result
+        record["error"] = None
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = repr(e)
+        record["traceback"] = traceback.format_exc()
+
+    record["stop"] = time.time()
+    record["duration"] = record["stop"] - start
+
+    return tid, record
+
+
+def prepare_gbm_day(date, configs):
+    """
+    Prepare the per-day files and caches that are shared by all tasks of a
+    day: downloads the poshist and data files and fills the caches of the
+    poshist bounds and the LAT McIlwain L-parameter in $GBMDATA/cache.
+    Used as prepare_function of the BatchRunner, so the tasks of a day do
+    not download the same files concurrently.
+    :param configs: configs of the tasks of this day, the data_type and
+    detectors options are used
+    """
+    from gbmbkgpy.io.downloading import download_gbm_file
+    from gbmbkgpy.data.gbm_data import get_poshist_bounds
+    from gbmbkgpy.geometry.gbm_geometry import get_lat_mcl, day_start_met
+
+    download_gbm_file(date, "poshist")
+    get_poshist_bounds(date)
+
+    downloads = set()
+    for config in configs:
+        data_type = config.get("data_type", "ctime")
+        if data_type not in ["ctime", "cspec"]:
+            continue
+
+        for det in config.get("detectors", []):
+            downloads.add((data_type, det))
+
+    for data_type, det in sorted(downloads):
+        download_gbm_file(date, data_type, det)
+
+    get_lat_mcl(day_start_met(date), day_start_met(date, 1))
+
+
+class FitScriptTask:
+    """
+    Task that runs a fit script (e.g. examples/fit_background.py) for one
+    date and config in a subprocess. The subprocess gets
+    GBMBKGPY_NO_MPI=1, so every task is an independent single rank fit.
+    """
+
+    def __init__(self, script, config_file, extra_args=None,
+                 python="python"):
+        """
+        :param script: path of the fit script
+        :param config_file: config file passed with -c
+        :param extra_args: list of additional arguments of the script
+        :param python: python executable
+        """
+        self._script = str(script)
+        self._config_file = str(config_file)
+        self._extra_args = list(extra_args) if extra_args is not None else []
+        self._python = python
+
+    def __call__(self, date, config, output_dir):
+        cmd = [self._python, self._script, "-c", self._config_file,
+               "-dates", date, "-out", os.path.join(output_dir, "")]
+
+        if "data_type" in config:
+            cmd += ["-dtype", str(config["data_type"])]
+
+        if "detectors" in config:
+            cmd += ["-dets"] + [str(det) for det in config["detectors"]]
+
+        if "echans" in config:
+            cmd += ["-e"] + [str(e) for e in config["echans"]]
+
+        cmd += self._extra_args
+
+        env = dict(os.environ, GBMBKGPY_NO_MPI="1")
+
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        with open(Path(output_dir) / "fit.log", "w") as log:
+            subprocess.run(cmd, env=env, stdout=log, stderr=subprocess.STDOUT,
+                           check=True)
+
+        return {"output_dir": output_dir}
+
+
+class BatchRunner:
+    """
+    Task farm for fitting many days and configurations. Every combination
+    of a date and a config of the matrix is one task. The tasks run in a
+    process pool on one node or distributed over MPI ranks (rank 0 is the
+    master, all other ranks are workers). The tasks are scheduled ordered
+    by date and the prepare function runs once per day before its tasks,
+    e.g. prepare_gbm_day downloads the data files of the day and fills the
+    poshist and LAT McIlwain L caches in $GBMDATA/cache. The responses are
+    not prepared, every task calculates its own. Timing and failures of
+    every task are recorded in a manifest, a restarted run with the same
+    output_dir skips all finished tasks.
+    """
+
+    def __init__(self, task_function, dates, config_matrix, output_dir,
+                 prepare_function=None, retry_failed=True):
+        """
+        :param task_function: function(date, config, output_dir) that runs
+        one fit and returns a json serializable result (or None). Must be
+        picklable (module level function or class instance).
+        :param dates: list of date strings, see date_range
+        :param config_matrix: dict with the values of the options, see
+        expand_config_matrix
+        :param output_dir: the manifest is saved here, every task gets the
+        subdirectory with its task id
+        :param prepare_function: function(date, configs) that is called
+        once per day before the tasks of the day, e.g. prepare_gbm_day
+        :param retry_failed: run failed tasks of a previous run again
+        """
+        self._task_function = task_function
+        self._prepare_function = prepare_function
+        self._retry_failed = retry_failed
+
+        self._output_dir = Path(output_dir)
+        self._manifest = BatchManifest(self._output_dir / "manifest.json")
+
+        for date in sorted(dates):
+            for config in expand_config_matrix(config_matrix):
+                self._manifest.add_task(date, config)
+
+    def _task_output_dir(self, tid):
+        return self._output_dir / tid
+
+    def _pending_by_date(self):
+        """
+        Pending tasks grouped by date, ordered by date
+        """
+        by_date = collections.OrderedDict()
+        for tid in sorted(self._manifest.pending(self._retry_failed),
+                          key=lambda t: self._manifest.tasks[t]["date"]):
+            by_date.setdefault(self._manifest.tasks[tid]["date"], []).append(tid)
+
+        return by_date
+
+    def _prepare(self, date, tids):
+        """
+        Run the prepare function of a day, if it fails all tasks of the
+        day are marked as failed
+        :returns: if the tasks of the day can run
+        """
+        if self._prepare_function is None:
+            return True
+
+        configs = [self._manifest.tasks[tid]["config"] for tid in tids]
+
+        start = time.time()
+        try:
+            self._prepare_function(date, configs)
+        except Exception as e:
+            self._manifest.update_date(
+                date, {"prepare_duration": time.time() - start,
+                       "prepare_error": repr(e)}
+            )
+            for tid in tids:
+                self._manifest.update_task(tid, {
+                    "status": "failed",
+                    "error": f"prepare failed: {e!r}",
+                    "traceback": traceback.format_exc(),
+                })
+            return False
+
+        self._manifest.update_date(
+            date, {"prepare_duration": time.time() - start,
+                   "prepare_error": None}
+        )
+        return True
+
+    def _task_args(self, tid):
+        task = self._manifest.tasks[tid]
+        return (tid, task["date"], task["config"], self._task_output_dir(tid))
+
+    def _start_task(self, tid):
+        attempts = self._manifest.tasks[tid]["attempts"] + 1
+        self._manifest.update_task(tid, {"status": "running",
+                                         "attempts": attempts})
+
+    def _finish_task(self, future_or_result):
+        if hasattr(future_or_result, "result"):
+            try:
+                tid, record = future_or_result.result()
+            except Exception:
+                # a worker process died, the task stays "running" and is
+                # repeated by the next run
+                return
+        else:
+            tid, record = future_or_result
+
+        self._manifest.update_task(tid, record)
+
+    def run(self, backend="process", num_workers=None):
+        """
+        Run all pending tasks
+        :param backend: "serial", "process" (process pool on this node) or
+        "mpi" (master/worker over all MPI ranks)
+        :param num_workers: size of the process pool, default is the number
+        of cpu cores
+        :returns: dict with the number of tasks per status (on the MPI
+        master, None on the workers)
+        """
+        assert backend in valid_batch_backends, \
+            f"backend must be one of {valid_batch_backends}"
+
+        if backend == "mpi":
+            return self._run_mpi()
+
+        self._manifest.write()
+
+        by_date = self._pending_by_date()
+
+        if backend == "serial":
+            for date, tids in by_date.items():
+                if not self._prepare(date, tids):
+                    continue
+
+                for tid in tids:
+                    self._start_task(tid)
+                    self._finish_task(
+                        _run_task(self._task_function, *self._task_args(tid))
+                    )
+
+            return self._manifest.summary()
+
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            futures = []
+
+            # the next day is prepared while the tasks of the previous
+            # days are running
+            for date, tids in by_date.items():
+                if not self._prepare(date, tids):
+                    continue
+
+                for tid in tids:
+                    self._start_task(tid)
+                    future = executor.submit(
+                        _run_task, self._task_function, *self._task_args(tid)
+                    )
+                    future.add_done_callback(self._finish_task)
+                    futures.append(future)
+
+            for future in futures:
+                future.exception()
+
+        return self._manifest.summary()
+
+    def _run_mpi(self):
+        """
+        MPI task farm. The workers request a task from the master, which
+        prefers a task of the day the worker processed before. The fits
+        themselves run on one rank each, so the gbmbkgpy modules must be
+        imported with GBMBKGPY_NO_MPI=1.
+        """
+        from mpi4py import MPI
+
+        from gbmbkgpy.utils.mpi import check_mpi
+
+        assert not check_mpi()[0], \
+            "The fits of the MPI task farm must run on one rank each, " \
+            "set GBMBKGPY_NO_MPI=1 before gbmbkgpy is imported"
+
+        comm = MPI.COMM_WORLD
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+
+        if size == 1:
+            return self.run(backend="serial")
+
+        if rank != 0:
+            # the ready message carries the result of the previous task
+            result = None
+            while True:
+                comm.send(result, dest=0, tag=_TAG_READY)
+                status = MPI.Status()
+                args = comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+
+                if status.Get_tag() == _TAG_STOP:
+                    return None
+
+                result = _run_task(self._task_function, *args)
+
+        self._manifest.write()
+
+        by_date = self._pending_by_date()
+        prepared = {}
+        last_date = {}
+        num_stopped = 0
+
+        while num_stopped < size - 1:
+            status = MPI.Status()
+            message = comm.recv(source=MPI.ANY_SOURCE, tag=_TAG_READY,
+                                status=status)
+            worker = status.Get_source()
+
+            if message is not None:
+                self._finish_task(message)
+
+            # prefer a task of the same day, its files are already loaded
+            # in the page cache of this node
+            date = last_date.get(worker)
+            if date not in by_date:
+                date = None
+
+            while date is None and len(by_date) > 0:
+                candidate = next(iter(by_date))
+
+                if candidate not in prepared:
+                    prepared[candidate] = self._prepare(candidate,
+                                                        by_date[candidate])
+
+                if prepared[candidate]:
+                    date = candidate
+                else:
+                    del by_date[candidate]
+
+            if date is None:
+                comm.send(None, dest=worker, tag=_TAG_STOP)
+                num_stopped += 1
+                continue
+
+            tid = by_date[date].pop(0)
+            if len(by_date[date]) == 0:
+                del by_date[date]
+
+            last_date[worker] = date
+            self._start_task(tid)
+            comm.send(self._task_args(tid), dest=worker, tag=_TAG_TASK)
+
+        return self._manifest.summary()
+
+    @property
+    def manifest(self):
+        return self._manifest
+
+    @property
+    def output_dir(self):
+        return self._output_dir
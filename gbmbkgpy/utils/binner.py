@@ -29,11 +29,69 @@ class Rebinner(object):
         self._grouping = []
         self._saa_idx = []
 
-        ignore_width = 100
+        self._min_bin_width = min_bin_width
+
+        self._rebin_from_index(vector_to_rebin_on, 0)
+
+        self._finalize(vector_to_rebin_on)
+
+    def extend(self, vector_to_rebin_on, mask=None):
+        """
+        Update the rebinning after new elements were appended at the end of
+        the vector to rebin on. Only the last rebinned bin (that could still
+        be open) and the new elements are processed again, the result is the
+        same as a new Rebinner on the whole vector.
+        :param vector_to_rebin_on: the whole extended vector
+        :param mask: mask of the whole extended vector
+        :return: index of the first rebinned bin that changed
+        """
+        if mask is not None:
+
+            mask = np.array(mask, bool)
+
+            assert mask.shape[0] == len(vector_to_rebin_on), (
+                "The provided mask must have the same number of "
+                "elements as the vector to rebin on"
+            )
+
+        else:
+            mask = np.ones_like(vector_to_rebin_on[:, 0], dtype=bool)
+
+        assert len(mask) >= len(self._mask), "Elements can only be appended"
+
+        self._mask = mask
+
+        first_bin = self.n_bins - 1
+        first_index = self._starts[first_bin]
+
+        # Drop the last rebinned bin, it gets rebinned again
+        self._starts = list(self._starts[:first_bin])
+        self._stops = list(self._stops[:first_bin])
+        self._saa_idx = [idx for idx in self._saa_idx if idx < first_bin]
+
+        self._rebin_from_index(vector_to_rebin_on, first_index)
+
+        self._finalize(vector_to_rebin_on)
+
+        return first_bin
+
+    def _rebin_from_index(self, vector_to_rebin_on, first_index):
+        """
+        Rebin the vector starting at first_index. There must not be an open
+        rebinned bin before first_index.
+        """
+        mask = self._mask
+        min_bin_width = self._min_bin_width
+
         sum_bin_width = 0.0
         bin_open = False
-        old_end = vector_to_rebin_on[0, 0]
-        for index, bin in enumerate(vector_to_rebin_on):
+        if first_index > 0:
+            old_end = vector_to_rebin_on[first_index - 1, 1]
+        else:
+            old_end = vector_to_rebin_on[0, 0]
+
+        for index in range(first_index, len(vector_to_rebin_on)):
+            bin = vector_to_rebin_on[index]
             if (not mask[index]) or bin[0]-old_end > 1:
                 # This element is excluded by the mask or there is a gap
 
@@ -87,12 +145,14 @@ class Rebinner(object):
         if bin_open:
             self._stops.append(len(vector_to_rebin_on) - 1)
 
+    def _finalize(self, vector_to_rebin_on):
+        """
+        Create the arrays of the rebinned bins and the rebinned mask
+        """
         assert len(self._starts) == len(self._stops), (
             "This is a bug: the starts and stops of the bins are not in " "equal number"
         )
 
-        self._min_bin_width = min_bin_width
-
         self._rebinned_vector_idx = np.array(zip(self._starts, self._stops))
 
         self._time_rebinned = np.stack(
@@ -119,6 +179,22 @@ class Rebinner(object):
 
         return len(self._starts)
 
+    @property
+    def starts(self):
+        """
+        Index of the first original bin in every rebinned bin
+        """
+
+        return self._starts
+
+    @property
+    def stops(self):
+        """
+        Index of the original bin after every rebinned bin
+        """
+
+        return self._stops
+
     @property
     def time_rebinned(self):
 
@@ -216,3 +292,42 @@ class Rebinner(object):
             rebinned_vectors.append(np.array(rebinned_vector))
 
         return rebinned_vectors
+
+
+def reduceat_starts(time_bins, min_bin_width, max_gap=1.0):
+    """
+    Vectorized rebinning to bins of about min_bin_width, e.g. to rebin
+    many count arrays with the same time bins with np.add.reduceat. A new
+    bin starts whenever the summed width since the last gap passes a
+    multiple of min_bin_width, so unlike the Rebinner the new bins can be
+    shorter by up to one original bin. Bins are not combined over gaps
+    larger than max_gap.
+    :param time_bins: time bins array (N, 2)
+    :param min_bin_width: min width of the new bins
+    :param max_gap: max gap between two bins that are combined
+    :returns: start indices, rebinned time bins
+    """
+    widths = time_bins[:, 1] - time_bins[:, 0]
+
+    new_segment = np.ones(len(time_bins), dtype=bool)
+    new_segment[1:] = time_bins[1:, 0] - time_bins[:-1, 1] > max_gap
+
+    # width of all bins before this bin in the same segment
+    width_before = np.cumsum(widths) - widths
+    segment_start_width = width_before[new_segment][np.cumsum(new_segment) - 1]
+    width_before -= segment_start_width
+
+    group = np.floor(width_before / min_bin_width).astype(np.int64)
+
+    new_group = new_segment.copy()
+    new_group[1:] |= group[1:] != group[:-1]
+
+    starts = np.flatnonzero(new_group)
+    stops = np.append(starts[1:], len(time_bins))
+
+    rebinned_time_bins = np.vstack(
+        (time_bins[starts, 0], time_bins[stops - 1, 1])
+    ).T
+
+    return starts, rebinned_time_bins
+
@@ -0,0 +1,138 @@
+import os
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from gbmbkgpy.utils.mpi import check_mpi
+
+using_mpi, rank, size, comm = check_mpi()
+
+
+def _update_hash(md5, value):
+    if isinstance(value, np.ndarray):
+        md5.update(str((value.dtype.str, value.shape)).encode())
+        md5.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, bytes):
+        md5.update(value)
+    elif isinstance(value, (list, tuple)):
+        md5.update(f"{type(value).__name__}{len(value)}".encode())
+        for v in value:
+            _update_hash(md5, v)
+    elif isinstance(value, dict):
+        md5.update(f"dict{len(value)}".encode())
+        for k in sorted(value.keys(), key=str):
+            _update_hash(md5, str(k))
+            _update_hash(md5, value[k])
+    else:
+        md5.update(repr(value).encode())
+
+
+def input_hash(*inputs):
+    """
+    Hash of the inputs of a stage (arrays, bytes, lists, dicts, numbers
+    and strings)
+    :returns: hex string
+    """
+    md5 = hashlib.md5()
+    for value in inputs:
+        _update_hash(md5, value)
+    return md5.hexdigest()[:16]
+
+
+class CheckpointStore:
+    """
+    Stage-level checkpoints of a fit. Every stage saves its result arrays
+    together with the hash of its inputs, so a restarted run skips all
+    stages that were already completed with the same inputs. Only rank 0
+    writes, the decision if a checkpoint exists is broadcasted so all MPI
+    ranks skip or compute a stage together.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: directory of the fit, the checkpoints are saved
+        in the subdirectory "checkpoints"
+        """
+        self._directory = Path(directory) / "checkpoints"
+
+        if rank == 0:
+            self._directory.mkdir(parents=True, exist_ok=True)
+
+        if using_mpi:
+            comm.Barrier()
+
+    def path(self, stage, key, part=None):
+        if part is None:
+            return self._directory / f"{stage}_{key}.npz"
+        return self._directory / f"{stage}_{key}_part{part}.npz"
+
+    def exists(self, stage, key, part=None):
+        """
+        Check if the checkpoint exists. Has to be called by all ranks.
+        """
+        exists = self.path(stage, key, part).exists()
+
+        if using_mpi:
+            exists = comm.bcast(exists, root=0)
+
+        return exists
+
+    def save(self, stage, key, arrays, part=None):
+        """
+        Save the arrays of a stage (only rank 0 writes)
+        :param arrays: dict with the arrays
+        """
+        if rank != 0:
+            return
+
+        path = self.path(stage, key, part)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+
+        os.replace(tmp_path, path)
+
+    def load(self, stage, key, part=None):
+        """
+        :returns: dict with the arrays of the stage
+        """
+        with np.load(self.path(stage, key, part)) as f:
+            return {name: f[name] for name in f.files}
+
+    def stage(self, stage, inputs, compute):
+        """
+        Run a stage or load its result if it was already completed with
+        the same inputs
+        :param stage: name of the stage
+        :param inputs: list with all inputs of the stage
+        :param compute: function without arguments, that returns a dict with
+        the result arrays. Is called on all ranks.
+        :returns: dict with the result arrays
+        """
+        key = input_hash(stage, *inputs)
+
+        if self.exists(stage, key):
+            return self.load(stage, key)
+
+        result = compute()
+        self.save(stage, key, result)
+
+        return result
+
+    def clear(self, stage=None):
+        """
+        Remove the checkpoints of one or all stages
+        """
+        if rank == 0:
+            pattern = "*.npz" if stage is None else f"{stage}_*.npz"
+            for path in self._directory.glob(pattern):
+                path.unlink()
+
+        if using_mpi:
+            comm.Barrier()
+
+    @property
+    def directory(self):
+        return self._directory
@@ -5,6 +5,7 @@ import math
     numba.float64(numba.float64[:, :], numba.int64[:, :]),
     parallel=False,
     fastmath=True,
+    nogil=True,
 )
 def cstat_numba(M, counts):
     # Poisson loglikelihood statistic (Cash) is:
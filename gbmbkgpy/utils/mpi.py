@@ -1,6 +1,11 @@
+import os
+
+
 def check_mpi():
     """
-    Check if mpi is available and which rank this thread is
+    Check if mpi is available and which rank this thread is. Setting the
+    environment variable GBMBKGPY_NO_MPI=1 runs every process as a single
+    rank, e.g. for the workers of a batch run that fit independently.
     :returns: if mpi is used, rank of this thread, size of the mpi cluster,
     comm of MPI
     """
@@ -8,6 +13,10 @@ def check_mpi():
     rank = 0
     size = 1
     comm = None
+
+    if os.environ.get("GBMBKGPY_NO_MPI", "0") not in ["", "0"]:
+        return False, rank, size, comm
+
     try:
         # see if we have mpi and/or are upalsing parallel
         from mpi4py import MPI
@@ -0,0 +1,221 @@
+import numpy as np
+
+# central intervals of the PPC bands
+default_band_levels = (0.68, 0.95, 0.99)
+
+
+class StreamingQuantiles:
+    """
+    Streaming quantiles of integer counts, e.g. of PPC draws, for every
+    element of an array (time bins x echans). Every element has a counting
+    histogram on a fixed grid of num_bins integer bins of the same width.
+    If the range of the counts fits in num_bins the width is one and the
+    quantiles are exact (identical to np.percentile), otherwise the values
+    are interpolated inside the histogram bins. The memory only depends on
+    the number of elements and num_bins, not on the number of samples.
+    Estimators with the same grid can be merged by adding the histograms,
+    e.g. over MPI ranks or processes.
+    """
+
+    def __init__(self, lower, bin_width, num_bins=64, dtype=np.uint32,
+                 chunk_size=2 ** 16):
+        """
+        :param lower: lower edge of the grid of every element
+        :param bin_width: integer width of the histogram bins of every
+        element
+        :param num_bins: number of histogram bins per element
+        :param dtype: dtype of the histograms, np.uint16 is enough for
+        less than 65536 samples
+        :param chunk_size: number of elements per chunk in the quantile
+        calculation
+        """
+        lower = np.asarray(lower, dtype=np.int64)
+        bin_width = np.broadcast_to(
+            np.asarray(bin_width, dtype=np.int64), lower.shape
+        )
+
+        assert np.all(bin_width >= 1), "The bin width must be at least 1"
+
+        self._shape = lower.shape
+        self._lower = lower.ravel()
+        self._bin_width = bin_width.ravel()
+        self._num_bins = num_bins
+        self._chunk_size = chunk_size
+
+        num_elements = len(self._lower)
+
+        self._histograms = np.zeros((num_elements, num_bins), dtype=dtype)
+        self._num_clipped = np.zeros(num_elements, dtype=dtype)
+        self._num_samples = 0
+
+        self._flat_offsets = np.arange(num_elements, dtype=np.int64) * num_bins
+
+    @classmethod
+    def from_expected_counts(cls, expected_counts, num_bins=64, num_sigma=6.0,
+                             rel_margin=0.05, **kwargs):
+        """
+        Grid centered on expected counts, e.g. the model counts of one
+        posterior sample. The grid covers num_sigma Poisson sigmas plus
+        rel_margin of the expected counts for the spread of the posterior.
+        :param expected_counts: array with the expected counts
+        """
+        expected_counts = np.asarray(expected_counts, dtype=np.float64)
+
+        half_range = (num_sigma * np.sqrt(expected_counts + 1) +
+                      rel_margin * expected_counts + 1)
+
+        lower = np.floor(np.maximum(expected_counts - half_range, 0))
+        upper = np.ceil(expected_counts + half_range) + 1
+
+        bin_width = np.maximum(np.ceil((upper - lower) / num_bins), 1)
+
+        # center the grid again after rounding the bin width up
+        lower = np.maximum(
+            np.floor((lower + upper - bin_width * num_bins) / 2), 0
+        )
+
+        return cls(lower, bin_width, num_bins=num_bins, **kwargs)
+
+    def add(self, values):
+        """
+        Add samples
+        :param values: integer array (N_samples, *shape)
+        """
+        values = np.asarray(values).reshape(len(values), -1)
+
+        for row in values:
+            idx = (row - self._lower) // self._bin_width
+            clipped = (idx < 0) | (idx >= self._num_bins)
+
+            np.clip(idx, 0, self._num_bins - 1, out=idx)
+
+            # every element appears once per row, so no np.add.at is needed
+            self._histograms.reshape(-1)[self._flat_offsets + idx] += 1
+            self._num_clipped += clipped.astype(self._num_clipped.dtype)
+
+        self._num_samples += len(values)
+
+    def _check_same_grid(self, other):
+        assert (
+            self._num_bins == other._num_bins
+            and np.array_equal(self._lower, other._lower)
+            and np.array_equal(self._bin_width, other._bin_width)
+        ), "Only estimators with the same grid can be merged"
+
+    def merge(self, other):
+        """
+        Add the samples of another estimator with the same grid
+        """
+        self._check_same_grid(other)
+
+        self._histograms += other._histograms
+        self._num_clipped += other._num_clipped
+        self._num_samples += other._num_samples
+
+    def reduce(self, comm, root=0):
+        """
+        Merge the estimators of all MPI ranks on the root rank with one
+        buffer based Reduce of the histograms
+        """
+        from mpi4py import MPI
+
+        for array in [self._histograms, self._num_clipped]:
+            if comm.Get_rank() == root:
+                comm.Reduce(MPI.IN_PLACE, array, op=MPI.SUM, root=root)
+            else:
+                comm.Reduce(array, None, op=MPI.SUM, root=root)
+
+        self._num_samples = comm.reduce(self._num_samples, op=MPI.SUM,
+                                        root=root)
+
+    def _order_statistic(self, hist, cdf, lower, bin_width, k):
+        """
+        k-th smallest value (starting at 0) of every element of a chunk
+        """
+        j = np.argmax(cdf > k, axis=1)
+        rows = np.arange(len(j))
+
+        before = np.where(j > 0, cdf[rows, j - 1], 0)
+        in_bin = hist[rows, j]
+
+        # spread the values of a bin uniformly over its integers
+        position = (k - before + 0.5) / in_bin
+
+        return lower + j * bin_width + (bin_width - 1) * position
+
+    def quantiles(self, q):
+        """
+        Quantiles with linear interpolation between the order statistics,
+        like np.percentile
+        :param q: list of quantiles between 0 and 1
+        :returns: array (len(q), *shape)
+        """
+        assert self._num_samples > 0, "No samples added"
+
+        q = np.atleast_1d(q)
+        result = np.zeros((len(q), len(self._lower)))
+
+        for start in range(0, len(self._lower), self._chunk_size):
+            stop = start + self._chunk_size
+
+            hist = self._histograms[start:stop].astype(np.int64)
+            cdf = np.cumsum(hist, axis=1)
+            lower = self._lower[start:stop]
+            bin_width = self._bin_width[start:stop]
+
+            for i, quantile in enumerate(q):
+                position = quantile * (self._num_samples - 1)
+                k_low = int(np.floor(position))
+                k_high = min(k_low + 1, self._num_samples - 1)
+
+                value_low = self._order_statistic(hist, cdf, lower, bin_width,
+                                                  k_low)
+                value_high = self._order_statistic(hist, cdf, lower,
+                                                   bin_width, k_high)
+
+                result[i, start:stop] = (
+                    value_low + (position - k_low) * (value_high - value_low)
+                )
+
+        return result.reshape((len(q),) + self._shape)
+
+    def bands(self, levels=default_band_levels):
+        """
+        Central intervals
+        :param levels: contents of the intervals, e.g. (0.68, 0.95, 0.99)
+        :returns: dict with (low, high) of every level
+        """
+        q = []
+        for level in levels:
+            q += [0.5 - level / 2, 0.5 + level / 2]
+
+        values = self.quantiles(q)
+
+        return {
+            level: (values[2 * i], values[2 * i + 1])
+            for i, level in enumerate(levels)
+        }
+
+    @property
+    def num_samples(self):
+        return self._num_samples
+
+    @property
+    def num_clipped(self):
+        """
+        Number of samples outside of the grid for every element, the
+        quantiles are only reliable where this is small
+        """
+        return self._num_clipped.reshape(self._shape)
+
+    @property
+    def exact(self):
+        """
+        If all quantiles are exact (bin width one and no clipped samples)
+        """
+        return bool(np.all(self._bin_width == 1) and
+                    np.all(self._num_clipped == 0))
+
+    @property
+    def shape(self):
+        return self._shape